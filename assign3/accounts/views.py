@@ -1,3 +1,5 @@
+import contextvars
+
 from django.contrib.auth import login
 from django.urls import reverse_lazy
 from django.views.generic import FormView, TemplateView, View
@@ -11,12 +13,17 @@ from threading import Thread
 
 from .forms import RegistrationForm
 from myapp.models import UserProfile
+from myapp.ratelimit import RateLimitMixin, Rate
 
 
-class RegisterView(FormView):
+class RegisterView(RateLimitMixin, FormView):
     template_name = 'accounts/signup.html'
     form_class = RegistrationForm
     success_url = reverse_lazy('verification-sent')
+    # Signups hash a password and start an SMTP thread, so cap both the
+    # per-IP rate and how many run at once across all workers
+    ratelimit_rates = (Rate('5/h', 'ip'), Rate('120/m', 'global'))
+    ratelimit_concurrency = settings.SIGNUP_CONCURRENCY_LIMIT
 
     def dispatch(self, request, *args, **kwargs):
         # If already logged in, redirect to home
@@ -64,7 +71,7 @@ The Blog Team''',
                 # Silently ignore; user can use resend flow
                 pass
 
-        Thread(target=_send_verification, daemon=True).start()
+        Thread(target=contextvars.copy_context().run, args=(_send_verification,), daemon=True).start()
 
         messages.success(
             self.request,
@@ -129,7 +136,7 @@ The Blog Team''',
                 except Exception:
                     pass
 
-            Thread(target=_send_verified, daemon=True).start()
+            Thread(target=contextvars.copy_context().run, args=(_send_verified,), daemon=True).start()
             
             messages.success(
                 request,
@@ -142,9 +149,10 @@ The Blog Team''',
             return redirect('login')
 
 
-class ResendVerificationView(TemplateView):
+class ResendVerificationView(RateLimitMixin, TemplateView):
     """View to resend verification email"""
     template_name = 'accounts/resend_verification.html'
+    ratelimit_rates = (Rate('5/h', 'ip'), Rate('120/m', 'global'))
     
     def post(self, request):
         email = request.POST.get('email')
@@ -187,7 +195,7 @@ The Blog Team''',
                 except Exception:
                     pass
 
-            Thread(target=_send_resend, daemon=True).start()
+            Thread(target=contextvars.copy_context().run, args=(_send_resend,), daemon=True).start()
             
             messages.success(
                 request,
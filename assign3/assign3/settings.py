@@ -61,6 +61,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so the request span covers every other middleware; removes
+    # itself at startup unless TRACING_ENABLED is set
+    'myapp.tracing.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -69,6 +72,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # These two remove themselves at startup unless enabled below
+    'myapp.slow_queries.SlowQueryViewMiddleware',
+    'myapp.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'assign3.urls'
@@ -113,6 +119,82 @@ DATABASES = {
 }
 
 
+# Cache
+# Local memory by default; point at a shared backend (e.g. Redis) in production
+# so every gunicorn worker sees the same entries.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', ''),
+    }
+}
+
+# Anonymous full-page cache for published post detail pages (seconds)
+POST_PAGE_CACHE_TIMEOUT = int(os.environ.get('POST_PAGE_CACHE_TIMEOUT', '600'))
+POST_PAGE_BROWSER_MAX_AGE = int(os.environ.get('POST_PAGE_BROWSER_MAX_AGE', '60'))
+POST_PAGE_CDN_MAX_AGE = int(os.environ.get('POST_PAGE_CDN_MAX_AGE', '300'))
+
+# Home page search: cached result lists per worker, and the longest list kept
+SEARCH_CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', '256'))
+SEARCH_CACHE_MAX_IDS = int(os.environ.get('SEARCH_CACHE_MAX_IDS', '1000'))
+
+# Number of precomputed related posts shown under each post
+RELATED_POSTS_COUNT = int(os.environ.get('RELATED_POSTS_COUNT', '5'))
+
+# Seconds between write-behind flushes of buffered post view counts
+VIEW_COUNT_FLUSH_INTERVAL = int(os.environ.get('VIEW_COUNT_FLUSH_INTERVAL', '60'))
+
+# Spam probability at or above which the moderation worker flags a comment
+COMMENT_SPAM_THRESHOLD = float(os.environ.get('COMMENT_SPAM_THRESHOLD', '0.9'))
+
+# Seconds between each ASGI worker's poll for newly approved comments (live stream)
+COMMENT_STREAM_POLL_INTERVAL = float(os.environ.get('COMMENT_STREAM_POLL_INTERVAL', '2'))
+# Public URL of the Procfile's `live` (ASGI) process, e.g. https://live.example.com.
+# Post pages only open the comment stream when this is set, because the
+# gunicorn `web` process cannot serve it
+COMMENT_STREAM_URL = os.environ.get('COMMENT_STREAM_URL', '')
+
+# Personalized feeds (see myapp/timeline.py): posts reaching more followers than
+# this are merged in at read time instead of copied, and posts copied on follow
+TIMELINE_FANOUT_LIMIT = int(os.environ.get('TIMELINE_FANOUT_LIMIT', '5000'))
+TIMELINE_BACKFILL = int(os.environ.get('TIMELINE_BACKFILL', '50'))
+
+# Where manage.py export_static writes the static copy of the public site
+STATIC_EXPORT_DIR = Path(os.environ.get('STATIC_EXPORT_DIR', BASE_DIR / 'static_export'))
+
+# Rate limiting for write endpoints (see myapp/ratelimit.py)
+RATELIMIT_ENABLE = os.environ.get('RATELIMIT_ENABLE', 'true').lower() == 'true'
+# Railway and nginx append the client address to X-Forwarded-For
+RATELIMIT_USE_X_FORWARDED_FOR = os.environ.get('RATELIMIT_USE_X_FORWARDED_FOR', 'false').lower() == 'true'
+# Signups in flight across all workers before new ones get a 503
+SIGNUP_CONCURRENCY_LIMIT = int(os.environ.get('SIGNUP_CONCURRENCY_LIMIT', '8'))
+
+# On-demand request profiling (see myapp/profiling.py); off means no middleware at all
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+# Fraction of requests profiled without a token, e.g. 0.001
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', BASE_DIR / 'profiles'))
+# Captures kept on disk; the oldest are removed first
+PROFILE_RING_SIZE = int(os.environ.get('PROFILE_RING_SIZE', '50'))
+
+# Request tracing to a local JSON-lines file (see myapp/tracing.py)
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'false').lower() == 'true'
+# Head sampling rate; X-Force-Trace or a sampled traceparent always trace
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.01'))
+# X-Force-Trace is only honoured when its value equals this secret; empty disables it
+TRACE_FORCE_SECRET = os.environ.get('TRACE_FORCE_SECRET', '')
+TRACE_FILE = Path(os.environ.get('TRACE_FILE', BASE_DIR / 'traces' / 'traces.jsonl'))
+TRACE_FILE_MAX_BYTES = int(os.environ.get('TRACE_FILE_MAX_BYTES', str(10 * 1024 * 1024)))
+TRACE_FILE_BACKUPS = int(os.environ.get('TRACE_FILE_BACKUPS', '5'))
+
+# Slow query log with EXPLAIN plans (see myapp/slow_queries.py, manage.py slow_queries)
+SLOW_QUERY_LOG_ENABLED = os.environ.get('SLOW_QUERY_LOG_ENABLED', 'false').lower() == 'true'
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', '200'))
+SLOW_QUERY_LOG = Path(os.environ.get('SLOW_QUERY_LOG', BASE_DIR / 'logs' / 'slow_queries.jsonl'))
+SLOW_QUERY_LOG_MAX_BYTES = int(os.environ.get('SLOW_QUERY_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.environ.get('SLOW_QUERY_LOG_BACKUPS', '5'))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -154,6 +236,11 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Hand media transfers to the front proxy instead of streaming through gunicorn.
+# nginx: internal location prefix, e.g. '/protected-media/' (X-Accel-Redirect)
+# Apache/lighttpd: header name, e.g. 'X-Sendfile'
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX', '')
+MEDIA_SENDFILE_HEADER = os.environ.get('MEDIA_SENDFILE_HEADER', '')
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -3,6 +3,13 @@ from django.contrib.auth.models import Group
 from django.utils import timezone
 from django.core.mail import send_mail
 from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from . import moderation
+from .admin_changelist import AutocompleteFilter, PublishedMonthFilter, ScalableChangelistMixin
+from .trash import move_to_trash
 from .models import Category, Tag, Post, Comment, AuthorApplication, UserProfile
 
 
@@ -15,32 +22,110 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
-	list_display = ("name", "slug", "created_at", "updated_at")
+	list_display = ("name", "slug", "post_count", "created_at", "updated_at")
 	search_fields = ("name",)
 	prepopulated_fields = {"slug": ("name",)}
 
 
+class AuthorFilter(AutocompleteFilter):
+	title = "author"
+	field_name = "author"
+
+
+class TagFilter(AutocompleteFilter):
+	title = "tag"
+	field_name = "tags"
+
+
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(ScalableChangelistMixin, admin.ModelAdmin):
 	list_display = ("title", "author", "status", "published_at", "created_at")
-	list_filter = ("status", "author", "category", "tags")
+	list_filter = ("status", AuthorFilter, "category", TagFilter, PublishedMonthFilter)
+	list_select_related = ("author",)
+	# Served by the trigram indexes from migration 0015 on PostgreSQL
 	search_fields = ("title", "content")
 	prepopulated_fields = {"slug": ("title",)}
 	autocomplete_fields = ("author", "category", "tags")
-	date_hierarchy = "published_at"
+
+	def delete_model(self, request, obj):
+		# Same soft delete as the site; purge_deleted_posts removes the rows
+		move_to_trash(obj)
+
+	def delete_queryset(self, request, queryset):
+		for post in queryset:
+			move_to_trash(post)
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
-	list_display = ("post", "user", "is_approved", "created_at")
-	list_filter = ("is_approved",)
+class CommentAdmin(ScalableChangelistMixin, admin.ModelAdmin):
+	list_display = ("post", "user", "moderation_status", "is_approved", "created_at")
+	list_filter = ("moderation_status", "is_approved")
+	list_select_related = ("post", "user")
 	search_fields = ("content",)
+	raw_id_fields = ("post", "user")
+	actions = ["approve_comments", "mark_spam"]
+	moderation_page_size = 50
+
+	def get_urls(self):
+		urls = [
+			path(
+				"moderation/",
+				self.admin_site.admin_view(self.moderation_queue_view),
+				name="myapp_comment_moderation",
+			),
+		]
+		return urls + super().get_urls()
+
+	def moderation_queue_view(self, request):
+		"""Pending and flagged comments, oldest first, paged by id keyset."""
+		if not self.has_change_permission(request):
+			raise PermissionDenied
+		if request.method == "POST":
+			ids = [int(pk) for pk in request.POST.getlist("comment") if pk.isdigit()]
+			spam = request.POST.get("verdict") == "spam"
+			count = moderation.review(ids, spam=spam)
+			self.message_user(request, f"{count} comment(s) marked as {'spam' if spam else 'approved'}.")
+			return redirect(request.get_full_path())
+
+		after = request.GET.get("after", "")
+		queue = (
+			Comment.objects.filter(moderation_status__in=[Comment.PENDING, Comment.FLAGGED])
+			.select_related("post", "user")
+			.order_by("id")
+		)
+		if after.isdigit():
+			queue = queue.filter(id__gt=int(after))
+		# One extra row tells us whether there is a next page without a COUNT
+		rows = list(queue[:self.moderation_page_size + 1])
+		page, has_next = rows[:self.moderation_page_size], len(rows) > self.moderation_page_size
+		context = {
+			**self.admin_site.each_context(request),
+			"opts": self.model._meta,
+			"title": "Comment moderation queue",
+			"comments": page,
+			"next_after": page[-1].id if has_next else None,
+		}
+		return TemplateResponse(request, "admin/myapp/comment/moderation_queue.html", context)
+
+	def approve_comments(self, request, queryset):
+		"""Approve selected comments and train the spam filter on them"""
+		count = moderation.review(queryset.values_list("pk", flat=True), spam=False)
+		self.message_user(request, f"{count} comment(s) approved.")
+	approve_comments.short_description = "✅ Approve selected comments"
+
+	def mark_spam(self, request, queryset):
+		"""Hide selected comments as spam and train the spam filter on them"""
+		count = moderation.review(queryset.values_list("pk", flat=True), spam=True)
+		self.message_user(request, f"{count} comment(s) marked as spam.")
+	mark_spam.short_description = "🚫 Mark selected comments as spam"
 
 
 @admin.register(AuthorApplication)
-class AuthorApplicationAdmin(admin.ModelAdmin):
+class AuthorApplicationAdmin(ScalableChangelistMixin, admin.ModelAdmin):
 	list_display = ("user", "status", "created_at", "reviewed_by", "reviewed_at")
 	list_filter = ("status", "created_at")
+	list_select_related = ("user", "reviewed_by")
+	raw_id_fields = ("user", "reviewed_by")
 	search_fields = ("user__username", "user__email", "reason")
 	readonly_fields = ("created_at", "updated_at")
 	
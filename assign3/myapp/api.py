@@ -0,0 +1,193 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.generic import View
+
+from .models import Post
+
+try:
+	import orjson
+except ImportError:  # pragma: no cover - optional speedup
+	orjson = None
+
+
+# Public field name -> ORM path read through .values()
+FIELD_PATHS = {
+	"id": "id",
+	"slug": "slug",
+	"title": "title",
+	"content": "content",
+	"author": "author__username",
+	"category": "category__slug",
+	"image": "image",
+	"published_at": "published_at",
+	"updated_at": "updated_at",
+}
+# Fields that are not a single column
+COMPUTED_FIELDS = {"tags", "url"}
+ALL_FIELDS = set(FIELD_PATHS) | COMPUTED_FIELDS
+
+LIST_FIELDS = ("id", "slug", "title", "author", "category", "tags", "published_at", "url")
+DETAIL_FIELDS = tuple(FIELD_PATHS) + ("tags", "url")
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def dumps(data):
+	if orjson is not None:
+		return orjson.dumps(data)
+	return json.dumps(data, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+
+
+def json_response(request, data, status=200):
+	"""Encode ``data`` and answer 304 when the client's ETag still matches.
+
+	Only successful responses are publicly cacheable.
+	"""
+	body = dumps(data)
+	etag = '"%s"' % hashlib.md5(body, usedforsecurity=False).hexdigest()
+	if status == 200:
+		conditional = get_conditional_response(request, etag=etag)
+		if conditional is not None:
+			return conditional
+	response = HttpResponse(body, status=status, content_type="application/json")
+	if status == 200:
+		response["ETag"] = etag
+		patch_cache_control(response, public=True, max_age=60)
+	else:
+		# Errors must not be kept by shared caches
+		patch_cache_control(response, no_store=True)
+	return response
+
+
+def error_response(request, message, status):
+	return json_response(request, {"detail": message}, status=status)
+
+
+def api_queryset():
+	# Same published set as HomeView. Rows without published_at have no
+	# stable place in the (published_at, id) keyset, so they are left out.
+	return Post.objects.published().filter(published_at__isnull=False)
+
+
+def parse_fields(request, default):
+	raw = request.GET.get("fields")
+	if not raw:
+		return list(default)
+	fields = [f.strip() for f in raw.split(",") if f.strip()]
+	unknown = [f for f in fields if f not in ALL_FIELDS]
+	if unknown:
+		raise ValueError("Unknown field(s): " + ", ".join(unknown))
+	return fields
+
+
+def serialize(queryset, fields):
+	"""Build plain dicts from ``.values()`` rows without creating Post objects.
+
+	Returns the results plus the ``(id, published_at)`` key of each row so
+	callers can build a cursor even when those fields were not requested.
+	"""
+	paths = {FIELD_PATHS[f] for f in fields if f in FIELD_PATHS}
+	paths.update(("id", "published_at"))
+	if "url" in fields:
+		paths.add("slug")
+	rows = list(queryset.values(*paths))
+	image_storage = Post._meta.get_field("image").storage
+
+	tags_by_post = {}
+	if "tags" in fields and rows:
+		through = Post.tags.through.objects.filter(post_id__in=[r["id"] for r in rows])
+		for post_id, tag_slug in through.values_list("post_id", "tag__slug").order_by("tag__name"):
+			tags_by_post.setdefault(post_id, []).append(tag_slug)
+
+	results = []
+	for row in rows:
+		item = {}
+		for field in fields:
+			if field == "tags":
+				item["tags"] = tags_by_post.get(row["id"], [])
+			elif field == "url":
+				item["url"] = reverse("post-detail", kwargs={"slug": row["slug"]})
+			elif field == "image":
+				item["image"] = image_storage.url(row["image"]) if row["image"] else None
+			else:
+				item[field] = row[FIELD_PATHS[field]]
+		results.append(item)
+	return results, [(row["id"], row["published_at"]) for row in rows]
+
+
+def encode_cursor(published_at, pk):
+	raw = f"{published_at.isoformat()}|{pk}".encode()
+	return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+	padded = cursor + "=" * (-len(cursor) % 4)
+	published_at, pk = base64.urlsafe_b64decode(padded).decode().split("|")
+	return datetime.fromisoformat(published_at), int(pk)
+
+
+class PostListAPIView(View):
+	"""``GET /api/posts/`` - newest first, keyset paginated.
+
+	Query parameters: ``category``, ``tag``, ``fields``, ``limit`` and the
+	opaque ``cursor`` returned as ``next``. Each page is one indexed range
+	scan on ``(published_at, id)`` regardless of how deep the client pages.
+	"""
+
+	def get(self, request):
+		try:
+			fields = parse_fields(request, LIST_FIELDS)
+			limit = min(max(int(request.GET.get("limit", DEFAULT_LIMIT)), 1), MAX_LIMIT)
+		except ValueError as exc:
+			return error_response(request, str(exc), 400)
+
+		qs = api_queryset()
+		if request.GET.get("category"):
+			qs = qs.filter(category__slug=request.GET["category"])
+		if request.GET.get("tag"):
+			qs = qs.filter(tags__slug=request.GET["tag"])
+		cursor = request.GET.get("cursor")
+		if cursor:
+			try:
+				published_at, pk = decode_cursor(cursor)
+			except (ValueError, UnicodeDecodeError):
+				return error_response(request, "Invalid cursor.", 400)
+			qs = qs.filter(
+				Q(published_at__lt=published_at) | Q(published_at=published_at, id__lt=pk)
+			)
+		qs = qs.order_by("-published_at", "-id")
+
+		# One extra row tells us whether another page exists
+		rows, keys = serialize(qs[:limit + 1], fields)
+
+		next_url = None
+		if len(rows) > limit:
+			rows = rows[:limit]
+			last_id, last_published = keys[limit - 1]
+			params = request.GET.copy()
+			params["cursor"] = encode_cursor(last_published, last_id)
+			next_url = request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+		return json_response(request, {"results": rows, "next": next_url})
+
+
+class PostDetailAPIView(View):
+	"""``GET /api/posts/<slug>/`` - one published post; accepts ``fields``."""
+
+	def get(self, request, slug):
+		try:
+			fields = parse_fields(request, DETAIL_FIELDS)
+		except ValueError as exc:
+			return error_response(request, str(exc), 400)
+		rows, _ = serialize(api_queryset().filter(slug=slug), fields)
+		if not rows:
+			return error_response(request, "Not found.", 404)
+		return json_response(request, rows[0])
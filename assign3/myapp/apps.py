@@ -12,6 +12,16 @@ class MyappConfig(AppConfig):
         from django.contrib.auth.models import Group, Permission
         from django.contrib.contenttypes.models import ContentType
         from .models import Post, Comment
+        from . import signals  # noqa: F401 - registers receivers
+        from django.conf import settings
+
+        if settings.TRACING_ENABLED:
+            from . import tracing
+            tracing.install()
+        if settings.SLOW_QUERY_LOG_ENABLED:
+            from django.db.backends.signals import connection_created
+            from . import slow_queries
+            connection_created.connect(slow_queries.attach, dispatch_uid='myapp.slow_queries')
         
         # Auto-create roles if they don't exist
         # Suppress the database access warning - this is intentional
@@ -0,0 +1,57 @@
+"""Month buckets for the date archive.
+
+``ArchiveMonth`` rows are adjusted with ``F()`` updates whenever a post moves
+in or out of a month (publish, unpublish, date change, delete), so the
+sidebar never has to group the posts table.
+"""
+from datetime import datetime
+
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import ArchiveMonth, Post
+
+
+# month_range() needs the first of the following month, and datetime ends
+# with year 9999
+MAX_YEAR = 9998
+
+
+def bucket_for(status, published_at):
+	"""``(year, month)`` a post is counted under, or None if not listed."""
+	if status != Post.PUBLISHED or published_at is None:
+		return None
+	local = timezone.localtime(published_at)
+	return local.year, local.month
+
+
+def adjust(bucket, delta):
+	if bucket is None:
+		return
+	year, month = bucket
+	ArchiveMonth.objects.get_or_create(year=year, month=month)
+	# Clamped at zero: a count that drifted low (e.g. a post unpublished
+	# before the backfill) must not break the unsigned column
+	ArchiveMonth.objects.filter(year=year, month=month).update(
+		post_count=Greatest(F("post_count") + delta, 0)
+	)
+
+
+def move(old_bucket, new_bucket):
+	if old_bucket == new_bucket:
+		return
+	adjust(old_bucket, -1)
+	adjust(new_bucket, 1)
+
+
+def month_range(year, month):
+	"""Half-open ``[start, end)`` datetimes covering one month, for index range scans."""
+	tz = timezone.get_current_timezone()
+	start = datetime(year, month, 1, tzinfo=tz)
+	end = datetime(year + (month == 12), month % 12 + 1, 1, tzinfo=tz)
+	return start, end
+
+
+def sidebar_months():
+	return ArchiveMonth.objects.filter(post_count__gt=0).order_by("-year", "-month")
@@ -0,0 +1,68 @@
+"""Category and tag counts for the posts a home page search matches.
+
+Each facet is one grouped aggregate over the search's result set, used as
+a subquery, so a search costs two extra queries however many categories
+and tags exist. Counts are kept in the search LRU under the same
+generation as the result ids, which means any post, tag-link, category or
+tag write retires them too.
+
+Only values with at least one matching post are returned, so every option
+offered leads somewhere.
+"""
+from django.db.models import Count
+
+from .models import Category, Post, Tag
+from . import search_cache
+
+
+def _category_counts(posts):
+	rows = (
+		Post.objects.filter(id__in=posts.values('id'), category__isnull=False)
+		.values_list('category__slug', 'category__name')
+		.annotate(count=Count('id'))
+		.order_by('-count', 'category__name')
+	)
+	return tuple(rows)
+
+
+def _tag_counts(posts):
+	rows = (
+		Post.tags.through.objects.filter(post_id__in=posts.values('id'))
+		.values_list('tag__slug', 'tag__name')
+		.annotate(count=Count('post_id'))
+		.order_by('-count', 'tag__name')
+	)
+	return tuple(rows)
+
+
+def facet_counts(query, posts):
+	"""``(categories, tags)`` as ``(slug, name, count)`` tuples for ``posts``.
+
+	``query`` is the normalized search that produced ``posts`` and is the
+	cache key.
+	"""
+	key = (search_cache.get_generation(), 'facets', query)
+	facets = search_cache.results.get(key)
+	if facets is None:
+		facets = (_category_counts(posts), _tag_counts(posts))
+		search_cache.results.set(key, facets)
+	return facets
+
+
+def with_selected(counts, model, slug):
+	"""``counts`` plus a zero entry for the selected ``slug`` if it matched nothing.
+
+	Keeps the current filter visible in the form after a search that
+	emptied it.
+	"""
+	if not slug or any(row[0] == slug for row in counts):
+		return counts
+	name = model.objects.filter(slug=slug).values_list('name', flat=True).first()
+	if name is None:
+		return counts
+	return counts + ((slug, name, 0),)
+
+
+def for_search(q, cat, tag, posts):
+	categories, tags = facet_counts((q, cat, tag), posts)
+	return with_selected(categories, Category, cat), with_selected(tags, Tag, tag)
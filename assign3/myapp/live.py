@@ -0,0 +1,198 @@
+"""Server-Sent Events stream of newly approved comments.
+
+Every ASGI worker runs one ``CommentNotifier``. While at least one client is
+connected it polls once per interval for comments approved since its
+high-water mark (``updated_at``), restricted to posts that have listeners,
+and fans the rows out to per-connection queues. The database sees one query
+per worker per interval no matter how many clients are connected, and an
+idle connection is only a suspended generator plus an empty queue.
+
+Approval happens out of band (moderation worker, admin) so there is no
+``post_save`` in this process to hook; ``moderation.set_status`` bumps
+``updated_at`` so the high-water mark sees bulk approvals.
+
+Comments are approved out of id order, and ``updated_at`` is taken when the
+UPDATE runs, not when it commits, so neither an id nor the newest timestamp
+seen is a safe place to resume from. Each event's id is its approval time;
+polls and reconnects both look back ``OVERLAP`` before the mark. The
+notifier drops rows it already sent and the page ignores comment ids it
+already shows.
+
+Only the Procfile's ``live`` process (uvicorn) can hold these connections;
+the WSGI ``web`` process answers 503. Post pages therefore connect to
+``COMMENT_STREAM_URL``, the public URL of the ``live`` process, and leave
+the stream out entirely when it is not set.
+"""
+import asyncio
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Comment, Post
+
+
+KEEPALIVE_SECONDS = 15
+QUEUE_SIZE = 100
+# Longest an approval's transaction is expected to stay open
+OVERLAP = timedelta(seconds=30)
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_mark(moment):
+	"""Microseconds since the epoch; used as the SSE event id."""
+	return str((moment - EPOCH) // timedelta(microseconds=1))
+
+
+def decode_mark(value):
+	"""The time from ``encode_mark``, or None if ``value`` is not one."""
+	try:
+		moment = EPOCH + timedelta(microseconds=int(value))
+		moment - OVERLAP
+	except (TypeError, ValueError, OverflowError):
+		return None
+	return moment
+
+
+def _serialize(row):
+	return {
+		"id": row["id"],
+		"user": row["user__username"],
+		"content": row["content"],
+		"created_at": row["created_at"].isoformat(),
+		"approved_at": encode_mark(row["updated_at"]),
+	}
+
+
+def _comment_rows(queryset):
+	return queryset.order_by("updated_at", "id").values(
+		"id", "post_id", "user__username", "content", "created_at", "updated_at"
+	)
+
+
+class CommentNotifier:
+	def __init__(self):
+		self.listeners = defaultdict(set)
+		self.high_water = None
+		# id -> updated_at of rows sent within the overlap window
+		self.sent = {}
+		self.task = None
+
+	def subscribe(self, post_id):
+		queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+		self.listeners[post_id].add(queue)
+		if self.task is None or self.task.done():
+			self.high_water = timezone.now()
+			self.sent = {}
+			self.task = asyncio.get_running_loop().create_task(self._poll())
+		return queue
+
+	def unsubscribe(self, post_id, queue):
+		queues = self.listeners.get(post_id)
+		if queues is not None:
+			queues.discard(queue)
+			if not queues:
+				del self.listeners[post_id]
+
+	async def _poll(self):
+		interval = getattr(settings, "COMMENT_STREAM_POLL_INTERVAL", 2)
+		while self.listeners:
+			await asyncio.sleep(interval)
+			try:
+				await self._poll_once()
+			except Exception:
+				# A failed poll (e.g. DB restart) is retried on the next tick
+				continue
+
+	async def _poll_once(self):
+		post_ids = list(self.listeners)
+		if not post_ids:
+			return
+		rows = _comment_rows(Comment.objects.filter(
+			post_id__in=post_ids, is_approved=True, updated_at__gt=self.high_water - OVERLAP,
+		))
+		async for row in rows:
+			if self.sent.get(row["id"]) == row["updated_at"]:
+				continue
+			self.sent[row["id"]] = row["updated_at"]
+			self.high_water = max(self.high_water, row["updated_at"])
+			payload = _serialize(row)
+			for queue in list(self.listeners.get(row["post_id"], ())):
+				try:
+					queue.put_nowait(payload)
+				except asyncio.QueueFull:
+					# Slow client: end its stream; EventSource reconnects with
+					# Last-Event-ID and catches up from the database
+					self._drop(row["post_id"], queue)
+		horizon = self.high_water - OVERLAP
+		self.sent = {pk: at for pk, at in self.sent.items() if at > horizon}
+
+	def _drop(self, post_id, queue):
+		self.unsubscribe(post_id, queue)
+		while not queue.empty():
+			queue.get_nowait()
+		queue.put_nowait(None)
+
+
+notifier = CommentNotifier()
+
+
+def _event(payload):
+	return f"id: {payload['approved_at']}\nevent: comment\ndata: {json.dumps(payload)}\n\n"
+
+
+def stream_url(slug):
+	"""Absolute URL of a post's stream on the live process, or None if there is none."""
+	base = getattr(settings, "COMMENT_STREAM_URL", "")
+	if not base:
+		return None
+	return base.rstrip("/") + reverse("comment-stream", args=[slug])
+
+
+async def comment_stream(request, slug):
+	"""``GET /post/<slug>/comments/stream/`` as ``text/event-stream``."""
+	if not isinstance(request, ASGIRequest):
+		# Under WSGI an endless stream would pin a worker; clients stop retrying on 503
+		return HttpResponse("Live comments require the ASGI server.", status=503)
+	post = await Post.objects.published().filter(slug=slug).values("id").afirst()
+	if post is None:
+		raise Http404("Post not found.")
+	post_id = post["id"]
+	# EventSource sends Last-Event-ID on reconnect; the page passes ?since=
+	# with the time it was rendered for the first connection
+	since = decode_mark(request.headers.get("Last-Event-ID") or request.GET.get("since"))
+
+	async def events():
+		queue = notifier.subscribe(post_id)
+		try:
+			yield "retry: 5000\n\n"
+			if since is not None:
+				# Replay what was approved while the client was away
+				missed = _comment_rows(Comment.objects.filter(
+					post_id=post_id, is_approved=True, updated_at__gt=since - OVERLAP,
+				))
+				async for row in missed:
+					yield _event(_serialize(row))
+			while True:
+				try:
+					payload = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+				except asyncio.TimeoutError:
+					yield ": keepalive\n\n"
+					continue
+				if payload is None:
+					return
+				yield _event(payload)
+		finally:
+			notifier.unsubscribe(post_id, queue)
+
+	response = StreamingHttpResponse(events(), content_type="text/event-stream")
+	response["Cache-Control"] = "no-cache"
+	response["X-Accel-Buffering"] = "no"
+	# Pages are served from the web process's origin; the comments are public
+	response["Access-Control-Allow-Origin"] = "*"
+	return response
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from myapp.static_export import export, export_dir
+
+
+class Command(BaseCommand):
+    help = 'Render published posts and the post list to static HTML for a CDN'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None,
+                            help='Directory to write to (default: STATIC_EXPORT_DIR)')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Rendering processes (default: one per CPU)')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Post ids per keyset chunk and rendering task (default: 500)')
+        parser.add_argument('--page-size', type=int, default=10,
+                            help='Posts per index page (default: 10)')
+        parser.add_argument('--full', action='store_true',
+                            help='Ignore the manifest and render every post again')
+
+    def handle(self, *args, **options):
+        output = options['output'] or export_dir()
+        summary = export(
+            output, workers=options['workers'], chunk_size=options['chunk_size'],
+            page_size=options['page_size'], full=options['full'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported to {output}: {summary['rendered']} post(s) rendered, "
+            f"{summary['unchanged']} unchanged, {summary['removed']} removed, {summary['pages']} index page(s)"
+        ))
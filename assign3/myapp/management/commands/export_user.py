@@ -0,0 +1,33 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.user_export import archive_name, stream_archive
+
+
+class Command(BaseCommand):
+    help = "Write a ZIP of a user's profile, posts, comments, applications and images"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--output', default=None,
+                            help='File to write, or - for stdout (default: <username>-export.zip)')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['username']!r}")
+        output = options['output'] or archive_name(user)
+        if output == '-':
+            for chunk in stream_archive(user):
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+        written = 0
+        with open(output, 'wb') as handle:
+            for chunk in stream_archive(user):
+                handle.write(chunk)
+                written += len(chunk)
+        self.stderr.write(self.style.SUCCESS(f'Wrote {written} bytes to {output}'))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.timeline import fan_out_batch
+
+
+class Command(BaseCommand):
+    help = 'Copy newly published posts into the timelines of their followers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Pending posts read per query (default: 100)')
+        parser.add_argument('--insert-size', type=int, default=1000,
+                            help='Timeline rows per INSERT (default: 1000)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, polling for newly published posts')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to sleep between polls with --loop (default: 5)')
+
+    def handle(self, *args, **options):
+        while True:
+            posts_total = entries_total = 0
+            last_id = 0
+            while True:
+                last_id, posts, entries = fan_out_batch(last_id, options['batch_size'], options['insert_size'])
+                if last_id is None:
+                    break
+                posts_total += posts
+                entries_total += entries
+            if posts_total or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Fanned out {posts_total} post(s) into {entries_total} timeline entries'
+                ))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from myapp.view_counts import flush
+
+
+class Command(BaseCommand):
+    help = 'Apply buffered post view counts to the database (run from cron)'
+
+    def handle(self, *args, **kwargs):
+        applied = flush()
+        self.stdout.write(self.style.SUCCESS(f'Flushed {applied} view(s)'))
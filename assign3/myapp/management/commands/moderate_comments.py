@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.moderation import moderate_batch, retrain
+
+
+class Command(BaseCommand):
+    help = 'Classify pending comments in batches and approve or flag them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Comments classified per UPDATE (default: 500)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, polling for new pending comments')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to sleep between polls with --loop (default: 5)')
+        parser.add_argument('--retrain', action='store_true',
+                            help='Rebuild the spam filter from moderated comments first')
+
+    def handle(self, *args, **options):
+        if options['retrain']:
+            retrain()
+            self.stdout.write(self.style.SUCCESS('Spam filter retrained from moderated comments'))
+
+        while True:
+            approved_total = flagged_total = 0
+            last_id = 0
+            while True:
+                last_id, approved, flagged = moderate_batch(last_id, options['batch_size'])
+                if last_id is None:
+                    break
+                approved_total += approved
+                flagged_total += flagged
+            if approved_total or flagged_total or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Approved {approved_total}, flagged {flagged_total} comment(s)'
+                ))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from myapp.models import Post
+from myapp.trash import purge_post
+
+from .purge_unverified import parse_duration
+
+
+class Command(BaseCommand):
+    help = 'Permanently remove soft-deleted posts and their comments in bounded batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', default='1h',
+                            help='Time since the post was deleted, e.g. 7d, 12h, 30m (default: 1h)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows deleted per statement and transaction (default: 1000)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='List the posts that would be purged without deleting anything')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - parse_duration(options['older_than'])
+        batch_size = options['batch_size']
+        # Served by the partial index on deleted_at
+        trashed = Post.all_objects.filter(deleted_at__lt=cutoff).order_by('deleted_at', 'id')
+
+        total = 0
+        # Only ids are held; each post is then purged in its own batches
+        for post_id, slug in list(trashed.values_list('id', 'slug')):
+            if options['dry_run']:
+                self.stdout.write(f'  would purge {slug} (id {post_id})')
+            else:
+                removed = purge_post(post_id, batch_size=batch_size)
+                self.stdout.write(f'  purged {slug} (id {post_id}) and {removed} dependent row(s)')
+            total += 1
+
+        verb = 'Would purge' if options['dry_run'] else 'Purged'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {total} post(s) deleted before {cutoff:%Y-%m-%d %H:%M} UTC'))
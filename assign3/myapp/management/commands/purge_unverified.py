@@ -0,0 +1,76 @@
+import re
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from myapp.models import UserProfile
+
+
+DURATION_RE = re.compile(r'^(\d+)([dhm]?)$')
+UNITS = {'d': 'days', 'h': 'hours', 'm': 'minutes', '': 'days'}
+
+
+def parse_duration(value):
+    match = DURATION_RE.match(value.strip())
+    if not match:
+        raise CommandError(f'Invalid --older-than value "{value}" (use e.g. 7d, 12h or 30m)')
+    amount, unit = match.groups()
+    return timedelta(**{UNITS[unit]: int(amount)})
+
+
+class Command(BaseCommand):
+    help = 'Delete never-verified signups (and their expired tokens) in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', default='7d',
+                            help='Age of the last verification email, e.g. 7d, 12h, 30m (default: 7d)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Profiles examined per transaction (default: 500)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be deleted without deleting anything')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - parse_duration(options['older_than'])
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        # Walks the (email_verified, verification_sent_at) index; profiles that
+        # never recorded a send fall back to their creation time
+        stale = UserProfile.objects.filter(email_verified=False).filter(
+            Q(verification_sent_at__lt=cutoff)
+            | Q(verification_sent_at__isnull=True, created_at__lt=cutoff)
+        )
+
+        last_id = 0
+        total = 0
+        while True:
+            rows = list(
+                stale.filter(id__gt=last_id).order_by('id').values_list('id', 'user_id')[:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            # Never touch accounts that were activated or given staff rights by hand
+            users = User.objects.filter(
+                pk__in=[user_id for _, user_id in rows],
+                is_active=False, is_staff=False, is_superuser=False,
+            )
+            if dry_run:
+                count = users.count()
+            else:
+                # One short transaction per batch keeps locks brief
+                with transaction.atomic():
+                    user_ids = list(users.select_for_update().values_list('pk', flat=True))
+                    User.objects.filter(pk__in=user_ids).delete()
+                count = len(user_ids)
+            total += count
+            self.stdout.write(f'  batch up to profile id {last_id}: {count} account(s)')
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {total} unverified account(s) last emailed before {cutoff:%Y-%m-%d %H:%M} UTC'
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from myapp.related import rebuild_all
+
+
+class Command(BaseCommand):
+    help = 'Recompute the precomputed related-posts lists for every published post'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Posts scored and written per transaction')
+
+    def handle(self, *args, **options):
+        done = rebuild_all(batch_size=options['batch_size'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'Related posts rebuilt for {done} post(s)'))
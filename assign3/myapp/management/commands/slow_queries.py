@@ -0,0 +1,75 @@
+import math
+import time
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand
+
+from myapp.slow_queries import log_files, read_log
+
+from .purge_unverified import parse_duration
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = max(math.ceil(fraction * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class Command(BaseCommand):
+    help = 'Summarise the slow query log by SQL fingerprint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', default=None,
+                            help='Only entries newer than this, e.g. 24h, 7d, 30m (default: whole log)')
+        parser.add_argument('--sort', choices=['total', 'count', 'p95', 'max'], default='total',
+                            help='Ranking column (default: total)')
+        parser.add_argument('--limit', type=int, default=20,
+                            help='Fingerprints to show (default: 20)')
+        parser.add_argument('--plans', action='store_true',
+                            help='Print the captured EXPLAIN plan under each fingerprint')
+
+    def handle(self, *args, **options):
+        cutoff = time.time() - parse_duration(options['since']).total_seconds() if options['since'] else 0
+        durations = defaultdict(list)
+        samples = {}
+        call_sites = defaultdict(Counter)
+        plans = {}
+        for entry in read_log(log_files()):
+            fp = entry.get('fingerprint')
+            if entry.get('type') == 'plan':
+                plans[fp] = entry.get('plan', '')
+                continue
+            if entry.get('ts', 0) < cutoff:
+                continue
+            durations[fp].append(entry['duration_ms'])
+            samples.setdefault(fp, entry.get('sql', ''))
+            call_sites[fp][(entry.get('view'), entry.get('call_site'))] += 1
+
+        if not durations:
+            self.stdout.write('No slow queries logged.')
+            return
+
+        rows = []
+        for fp, values in durations.items():
+            values.sort()
+            rows.append({
+                'fingerprint': fp,
+                'count': len(values),
+                'total': sum(values),
+                'p95': percentile(values, 0.95),
+                'max': values[-1],
+            })
+        rows.sort(key=lambda row: row[options['sort']], reverse=True)
+
+        self.stdout.write(f'{"fingerprint":16}  {"count":>7}  {"total ms":>11}  {"p95 ms":>9}  {"max ms":>9}')
+        for row in rows[:options['limit']]:
+            fp = row['fingerprint']
+            self.stdout.write(self.style.SUCCESS(
+                f'{fp:16}  {row["count"]:>7}  {row["total"]:>11.1f}  {row["p95"]:>9.1f}  {row["max"]:>9.1f}'
+            ))
+            self.stdout.write(f'  {samples[fp][:300]}')
+            for (view, site), count in call_sites[fp].most_common(3):
+                self.stdout.write(f'  {count:>5}x  {view or "-"}  {site or "-"}')
+            if options['plans'] and fp in plans:
+                for line in plans[fp].splitlines():
+                    self.stdout.write(f'    {line}')
@@ -0,0 +1,188 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+
+from .models import Post
+
+
+# Names carrying a content hash (e.g. "cover.3f2a9c1b8e4d.jpg") never change
+# in place, so they can be cached forever by browsers and the CDN.
+HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{8,}\.[A-Za-z0-9]+$")
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PUBLIC_CACHE_CONTROL = "public, max-age=3600"
+PRIVATE_CACHE_CONTROL = "private, max-age=0, must-revalidate"
+
+
+class RangeFileWrapper:
+	"""File-like object that stops reading after ``length`` bytes."""
+
+	def __init__(self, filelike, offset, length):
+		self.filelike = filelike
+		self.filelike.seek(offset)
+		self.remaining = length
+		self.name = filelike.name
+
+	def read(self, size=-1):
+		if self.remaining <= 0:
+			return b""
+		if size < 0 or size > self.remaining:
+			size = self.remaining
+		data = self.filelike.read(size)
+		self.remaining -= len(data)
+		return data
+
+	def close(self):
+		self.filelike.close()
+
+
+def _file_etag(stat):
+	# Same shape nginx uses, derived from the inode metadata so no bytes are read.
+	return '"%x-%x"' % (int(stat.st_mtime), stat.st_size)
+
+
+def _etag_matches(header, etag):
+	if not header:
+		return False
+	if header.strip() == "*":
+		return True
+	candidates = [tag.strip() for tag in header.split(",")]
+	return etag in candidates or f"W/{etag}" in candidates
+
+
+def _parse_range(header, size):
+	"""Return ``(start, end)`` for a single byte range.
+
+	Returns None when the header should be ignored and False when the range
+	cannot be satisfied. Multi-range requests are answered with the full file, which RFC 9110
+	allows and which keeps the fallback path simple.
+	"""
+	match = RANGE_RE.match(header.strip())
+	if not match:
+		return None
+	first, last = match.groups()
+	if not first and not last:
+		return None
+	if first:
+		start = int(first)
+		end = min(int(last), size - 1) if last else size - 1
+	else:
+		# Suffix range: the final N bytes.
+		start = max(size - int(last), 0)
+		end = size - 1
+	if start > end or start >= size:
+		return False
+	return start, end
+
+
+def user_can_view_media(user, name):
+	"""Cheap access check: one indexed lookup on ``Post.image``.
+
+	Files attached to a published post are public. Draft images are visible
+	to their author and staff only; files no post references are hidden.
+	"""
+	if user.is_authenticated and (user.is_staff or user.is_superuser):
+		return True
+	row = Post.objects.filter(image=name).values_list("status", "author_id").first()
+	if row is None:
+		return False
+	status, author_id = row
+	if status == Post.PUBLISHED:
+		return True
+	return user.is_authenticated and author_id == user.id
+
+
+def serve_media(request, path):
+	"""Serve a file from MEDIA_ROOT, offloading the transfer when possible.
+
+	With ``MEDIA_ACCEL_REDIRECT_PREFIX`` set, nginx streams the file from an
+	internal location; with ``MEDIA_SENDFILE_HEADER`` set, Apache/lighttpd do
+	the same from the absolute path. Otherwise Django answers with a
+	``FileResponse`` that honours ``Range``, ``If-None-Match`` and
+	``If-Modified-Since``.
+	"""
+	name = path.lstrip("/")
+	try:
+		fullpath = safe_join(settings.MEDIA_ROOT, name)
+	except SuspiciousFileOperation:
+		raise Http404("Invalid media path.")
+	if not user_can_view_media(request.user, name):
+		raise Http404("Media file not found.")
+	try:
+		stat = os.stat(fullpath)
+	except OSError:
+		raise Http404("Media file not found.")
+	if not os.path.isfile(fullpath):
+		raise Http404("Media file not found.")
+
+	etag = _file_etag(stat)
+	last_modified = http_date(stat.st_mtime)
+	if HASHED_NAME_RE.search(name):
+		cache_control = IMMUTABLE_CACHE_CONTROL
+	elif request.user.is_authenticated:
+		cache_control = PRIVATE_CACHE_CONTROL
+	else:
+		cache_control = PUBLIC_CACHE_CONTROL
+
+	if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+	if if_none_match is not None:
+		not_modified = _etag_matches(if_none_match, etag)
+	else:
+		since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE", ""))
+		not_modified = since is not None and int(stat.st_mtime) <= since
+	if not_modified:
+		response = HttpResponseNotModified()
+		response["ETag"] = etag
+		response["Cache-Control"] = cache_control
+		return response
+
+	accel_prefix = getattr(settings, "MEDIA_ACCEL_REDIRECT_PREFIX", "")
+	sendfile_header = getattr(settings, "MEDIA_SENDFILE_HEADER", "")
+	if accel_prefix or sendfile_header:
+		# The proxy takes care of ranges and the body; only metadata goes back.
+		response = HttpResponse()
+		if accel_prefix:
+			response["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + quote(name)
+		else:
+			response[sendfile_header] = fullpath
+		content_type, _ = mimetypes.guess_type(fullpath)
+		response["Content-Type"] = content_type or "application/octet-stream"
+		response["ETag"] = etag
+		response["Last-Modified"] = last_modified
+		response["Cache-Control"] = cache_control
+		return response
+
+	size = stat.st_size
+	byte_range = None
+	range_header = request.META.get("HTTP_RANGE")
+	if range_header and size:
+		if_range = request.META.get("HTTP_IF_RANGE")
+		if not if_range or if_range in (etag, last_modified):
+			byte_range = _parse_range(range_header, size)
+	if byte_range is False:
+		response = HttpResponse(status=416)
+		response["Content-Range"] = f"bytes */{size}"
+		return response
+
+	filelike = open(fullpath, "rb")
+	if byte_range:
+		start, end = byte_range
+		length = end - start + 1
+		response = FileResponse(RangeFileWrapper(filelike, start, length), status=206)
+		response["Content-Range"] = f"bytes {start}-{end}/{size}"
+		response["Content-Length"] = str(length)
+	else:
+		response = FileResponse(filelike)
+	response["Accept-Ranges"] = "bytes"
+	response["ETag"] = etag
+	response["Last-Modified"] = last_modified
+	response["Cache-Control"] = cache_control
+	return response
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_userprofile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to='posts/'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:13
+
+from django.db import DatabaseError, migrations, models, transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_post_count(apps, schema_editor):
+    Tag = apps.get_model('myapp', 'Tag')
+    Post = apps.get_model('myapp', 'Post')
+    through = Post.tags.through
+    usage = (
+        through.objects.filter(tag_id=OuterRef('pk'))
+        .order_by()
+        .values('tag_id')
+        .annotate(n=Count('*'))
+        .values('n')
+    )
+    Tag.objects.update(post_count=Coalesce(Subquery(usage), Value(0)))
+
+
+def create_prefix_indexes(apps, schema_editor):
+    """Prefix (and, where pg_trgm is available, trigram) indexes on names.
+
+    ``name__istartswith`` compiles to ``UPPER(name::text) LIKE UPPER(...)`` on
+    PostgreSQL, which only a pattern-ops index on that expression can serve.
+    Other backends keep using the unique index on ``name``.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in ('myapp_tag', 'myapp_category'):
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_name_upper_prefix '
+            f'ON {table} (UPPER(name::text) text_pattern_ops)'
+        )
+    try:
+        # Needs the extension to be installed and CREATE privilege; skip otherwise
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError:
+        return
+    for table in ('myapp_tag', 'myapp_category'):
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_name_upper_trgm '
+            f'ON {table} USING gin (UPPER(name::text) gin_trgm_ops)'
+        )
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in ('myapp_tag', 'myapp_category'):
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_name_upper_prefix')
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_name_upper_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_post_image_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_post_count, migrations.RunPython.noop),
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_tag_post_count_typeahead_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedPost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_entries', to='myapp.post')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='myapp.post')),
+            ],
+            options={
+                'ordering': ['post', 'rank'],
+                'indexes': [models.Index(fields=['post', 'rank'], name='myapp_relat_post_id_9f1226_idx')],
+                'constraints': [models.UniqueConstraint(fields=('post', 'related'), name='unique_related_post')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:16
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def backfill_archive_months(apps, schema_editor):
+    Post = apps.get_model('myapp', 'Post')
+    ArchiveMonth = apps.get_model('myapp', 'ArchiveMonth')
+    buckets = (
+        Post.objects.filter(status='published', published_at__isnull=False)
+        .annotate(year=ExtractYear('published_at'), month=ExtractMonth('published_at'))
+        .values('year', 'month')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    ArchiveMonth.objects.bulk_create([
+        ArchiveMonth(year=b['year'], month=b['month'], post_count=b['n']) for b in buckets
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0009_post_view_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('post_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-year', '-month'],
+                'constraints': [models.UniqueConstraint(fields=('year', 'month'), name='unique_archive_month')],
+            },
+        ),
+        migrations.RunPython(backfill_archive_months, migrations.RunPython.noop),
+    ]
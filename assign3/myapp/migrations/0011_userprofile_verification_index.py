@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0010_archivemonth'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['email_verified', 'verification_sent_at'], name='myapp_userp_email_v_b8c447_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def flag_unapproved_comments(apps, schema_editor):
+    # Comments a moderator had already hidden go to the review queue
+    Comment = apps.get_model('myapp', 'Comment')
+    Comment.objects.filter(is_approved=False).update(moderation_status='flagged')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0011_userprofile_verification_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpamToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=40, unique=True)),
+                ('spam_count', models.PositiveIntegerField(default=0)),
+                ('ham_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='moderation_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('flagged', 'Flagged by filter'), ('spam', 'Spam')], default='approved', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['moderation_status', 'id'], name='myapp_comme_moderat_4ee876_idx'),
+        ),
+        migrations.RunPython(flag_unapproved_comments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0012_comment_moderation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['is_approved', 'updated_at'], name='myapp_comme_is_appr_f470ef_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:30
+
+from django.db import DatabaseError, migrations, transaction
+
+
+# Columns searched by the admin changelists with ``icontains``
+SEARCH_COLUMNS = (
+    ('myapp_post', 'title'),
+    ('myapp_post', 'content'),
+    ('myapp_comment', 'content'),
+    ('myapp_authorapplication', 'reason'),
+)
+
+
+def create_search_indexes(apps, schema_editor):
+    """Trigram indexes for admin search on PostgreSQL.
+
+    ``icontains`` compiles to ``UPPER(col::text) LIKE UPPER('%term%')``, which
+    a GIN ``gin_trgm_ops`` index on the same expression can serve for terms
+    of three or more characters. Built concurrently so large tables stay
+    writable; skipped when pg_trgm cannot be installed.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError:
+        return
+    for table, column in SEARCH_COLUMNS:
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {table}_{column}_upper_trgm '
+            f'ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)'
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in SEARCH_COLUMNS:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {table}_{column}_upper_trgm')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('myapp', '0014_post_soft_delete'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0015_admin_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorFollow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TagFollow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('published_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='fanout_status',
+            field=models.CharField(blank=True, choices=[('', 'Not published'), ('pending', 'Waiting for fan-out'), ('done', 'Copied to follower timelines'), ('read', 'Merged into timelines at read time')], default='', editable=False, max_length=8),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('fanout_status', 'pending')), fields=['id'], name='post_fanout_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('fanout_status', 'read')), fields=['-published_at', '-id'], name='post_fanout_read_idx'),
+        ),
+        migrations.AddField(
+            model_name='authorfollow',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='author_followers', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='authorfollow',
+            name='follower',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='followed_authors', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='tagfollow',
+            name='follower',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='followed_tags', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='tagfollow',
+            name='tag',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='followers', to='myapp.tag'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='post',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='myapp.post'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='authorfollow',
+            index=models.Index(fields=['author', 'follower'], name='myapp_autho_author__94b685_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='authorfollow',
+            constraint=models.UniqueConstraint(fields=('follower', 'author'), name='unique_author_follow'),
+        ),
+        migrations.AddIndex(
+            model_name='tagfollow',
+            index=models.Index(fields=['tag', 'follower'], name='myapp_tagfo_tag_id_6547db_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='tagfollow',
+            constraint=models.UniqueConstraint(fields=('follower', 'tag'), name='unique_tag_follow'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-published_at', '-post'], name='timeline_user_published_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_timeline_entry'),
+        ),
+    ]
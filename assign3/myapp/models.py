@@ -1,9 +1,11 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.utils.text import slugify
 from django.urls import reverse
 from django.utils import timezone
 import uuid
+from functools import partial
+
+from .slugs import save_with_unique_slug
 
 
 class TimestampedModel(models.Model):
@@ -23,7 +25,7 @@ class Category(TimestampedModel):
 
 	def save(self, *args, **kwargs):
 		if not self.slug:
-			self.slug = slugify(self.name)
+			return save_with_unique_slug(self, self.name, partial(super().save, *args, **kwargs))
 		super().save(*args, **kwargs)
 
 	def __str__(self) -> str:
@@ -33,19 +35,33 @@ class Category(TimestampedModel):
 class Tag(TimestampedModel):
 	name = models.CharField(max_length=50, unique=True)
 	slug = models.SlugField(max_length=60, unique=True, blank=True)
+	# Denormalized number of posts using the tag; ranks typeahead suggestions
+	post_count = models.PositiveIntegerField(default=0, editable=False)
 
 	class Meta:
 		ordering = ["name"]
 
 	def save(self, *args, **kwargs):
 		if not self.slug:
-			self.slug = slugify(self.name)
+			return save_with_unique_slug(self, self.name, partial(super().save, *args, **kwargs))
 		super().save(*args, **kwargs)
 
 	def __str__(self) -> str:
 		return self.name
 
 
+class PostQuerySet(models.QuerySet):
+	def published(self):
+		return self.filter(status=Post.PUBLISHED)
+
+
+class PostManager(models.Manager.from_queryset(PostQuerySet)):
+	"""Default manager: hides soft-deleted posts everywhere they are queried."""
+
+	def get_queryset(self):
+		return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Post(TimestampedModel):
 	DRAFT = "draft"
 	PUBLISHED = "published"
@@ -54,28 +70,66 @@ class Post(TimestampedModel):
 		(PUBLISHED, "Published"),
 	]
 
+	FANOUT_PENDING = "pending"
+	FANOUT_DONE = "done"
+	FANOUT_READ = "read"
+	FANOUT_CHOICES = [
+		("", "Not published"),
+		(FANOUT_PENDING, "Waiting for fan-out"),
+		(FANOUT_DONE, "Copied to follower timelines"),
+		(FANOUT_READ, "Merged into timelines at read time"),
+	]
+
 	title = models.CharField(max_length=200)
 	slug = models.SlugField(max_length=220, unique=True, blank=True)
 	author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="posts")
 	content = models.TextField()
-	image = models.ImageField(upload_to='posts/', null=True, blank=True)
+	image = models.ImageField(upload_to='posts/', null=True, blank=True, db_index=True)
 	category = models.ForeignKey(
 		Category, on_delete=models.SET_NULL, null=True, blank=True, related_name="posts"
 	)
 	tags = models.ManyToManyField(Tag, blank=True, related_name="posts")
 	status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=DRAFT)
 	published_at = models.DateTimeField(null=True, blank=True)
+	# Flushed in batches from the cache by myapp.view_counts
+	view_count = models.PositiveBigIntegerField(default=0, editable=False)
+	# Set by myapp.trash; the rows are removed later by purge_deleted_posts
+	deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+	# Delivery to follower timelines; see myapp.timeline
+	fanout_status = models.CharField(max_length=8, choices=FANOUT_CHOICES, blank=True, default="", editable=False)
+
+	objects = PostManager()
+	all_objects = PostQuerySet.as_manager()
+
+	WRITE_BEHIND_FIELDS = ("view_count", "fanout_status")
 
 	class Meta:
 		ordering = ["-published_at", "-created_at"]
 		indexes = [
 			models.Index(fields=["status", "published_at"]),
 			models.Index(fields=["slug"]),
+			models.Index(fields=["status", "-view_count"]),
+			models.Index(
+				fields=["deleted_at"], condition=models.Q(deleted_at__isnull=False), name="post_deleted_at_idx"
+			),
+			# Work queue of the fanout_timelines worker
+			models.Index(fields=["id"], condition=models.Q(fanout_status="pending"), name="post_fanout_pending_idx"),
+			# Posts merged into timelines at read time, newest first
+			models.Index(
+				fields=["-published_at", "-id"], condition=models.Q(fanout_status="read"), name="post_fanout_read_idx"
+			),
 		]
 
 	def save(self, *args, **kwargs):
+		if not self._state.adding and kwargs.get("update_fields") is None:
+			# These are written by UPDATEs elsewhere; saving a stale
+			# in-memory copy must not overwrite them.
+			kwargs["update_fields"] = [
+				f.name for f in self._meta.concrete_fields
+				if not f.primary_key and f.name not in self.WRITE_BEHIND_FIELDS
+			]
 		if not self.slug:
-			self.slug = slugify(self.title)
+			return save_with_unique_slug(self, self.title, partial(super().save, *args, **kwargs))
 		super().save(*args, **kwargs)
 
 	def get_absolute_url(self):
@@ -85,19 +139,149 @@ class Post(TimestampedModel):
 		return self.title
 
 
+class RelatedPost(models.Model):
+	"""Precomputed "related posts" for a post, ranked by weighted tag overlap."""
+	post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="related_entries")
+	related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+	score = models.FloatField()
+	rank = models.PositiveSmallIntegerField()
+
+	class Meta:
+		ordering = ["post", "rank"]
+		constraints = [
+			models.UniqueConstraint(fields=["post", "related"], name="unique_related_post"),
+		]
+		indexes = [
+			models.Index(fields=["post", "rank"]),
+		]
+
+	def __str__(self) -> str:
+		return f"{self.post_id} -> {self.related_id} ({self.score:.2f})"
+
+
+class AuthorFollow(models.Model):
+	"""A user following everything an author publishes."""
+	follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name="followed_authors")
+	# Indexed by the (author, follower) index below, which fan-out reads
+	author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="author_followers", db_index=False)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=["follower", "author"], name="unique_author_follow"),
+		]
+		indexes = [
+			models.Index(fields=["author", "follower"]),
+		]
+
+	def __str__(self) -> str:
+		return f"{self.follower_id} follows author {self.author_id}"
+
+
+class TagFollow(models.Model):
+	"""A user following every post carrying a tag."""
+	follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name="followed_tags")
+	tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name="followers", db_index=False)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=["follower", "tag"], name="unique_tag_follow"),
+		]
+		indexes = [
+			models.Index(fields=["tag", "follower"]),
+		]
+
+	def __str__(self) -> str:
+		return f"{self.follower_id} follows tag {self.tag_id}"
+
+
+class TimelineEntry(models.Model):
+	"""A post delivered to one user's personalized feed by fan-out."""
+	# Leading column of the timeline index, so no index of its own
+	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+", db_index=False)
+	post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="timeline_entries")
+	# Copied from the post so a feed page is one range scan of the index below
+	published_at = models.DateTimeField()
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=["user", "post"], name="unique_timeline_entry"),
+		]
+		indexes = [
+			models.Index(fields=["user", "-published_at", "-post"], name="timeline_user_published_idx"),
+		]
+
+	def __str__(self) -> str:
+		return f"{self.post_id} in timeline of {self.user_id}"
+
+
+class ArchiveMonth(models.Model):
+	"""Published-post count per calendar month, kept current by signals."""
+	year = models.PositiveSmallIntegerField()
+	month = models.PositiveSmallIntegerField()
+	post_count = models.PositiveIntegerField(default=0)
+
+	class Meta:
+		ordering = ["-year", "-month"]
+		constraints = [
+			models.UniqueConstraint(fields=["year", "month"], name="unique_archive_month"),
+		]
+
+	def get_absolute_url(self):
+		return reverse("archive-month", kwargs={"year": self.year, "month": self.month})
+
+	def __str__(self) -> str:
+		return f"{self.year}-{self.month:02d} ({self.post_count})"
+
+
 class Comment(TimestampedModel):
+	PENDING = "pending"
+	APPROVED = "approved"
+	FLAGGED = "flagged"
+	SPAM = "spam"
+	MODERATION_CHOICES = [
+		(PENDING, "Pending"),
+		(APPROVED, "Approved"),
+		(FLAGGED, "Flagged by filter"),
+		(SPAM, "Spam"),
+	]
+
 	post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="comments")
 	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="comments")
 	content = models.TextField()
 	is_approved = models.BooleanField(default=True)
+	# Set by the moderate_comments worker or a moderator; is_approved follows it
+	moderation_status = models.CharField(max_length=10, choices=MODERATION_CHOICES, default=APPROVED)
 
 	class Meta:
 		ordering = ["created_at"]
+		indexes = [
+			models.Index(fields=["moderation_status", "id"]),
+			# High-water scan of the live comment stream
+			models.Index(fields=["is_approved", "updated_at"]),
+		]
 
 	def __str__(self) -> str:
 		return f"Comment by {self.user} on {self.post}"
 
 
+class SpamToken(models.Model):
+	"""Naive Bayes token counts learned from moderated comments.
+
+	The row with ``token == DOCUMENTS`` holds the number of spam and ham
+	comments trained on, which the classifier uses as class priors.
+	"""
+	DOCUMENTS = "__documents__"
+
+	token = models.CharField(max_length=40, unique=True)
+	spam_count = models.PositiveIntegerField(default=0)
+	ham_count = models.PositiveIntegerField(default=0)
+
+	def __str__(self) -> str:
+		return f"{self.token} (spam={self.spam_count}, ham={self.ham_count})"
+
+
 class AuthorApplication(TimestampedModel):
 	"""Model to track user applications to become authors"""
 	PENDING = 'pending'
@@ -136,6 +320,12 @@ class UserProfile(TimestampedModel):
 	email_verified = models.BooleanField(default=False)
 	verification_token = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
 	verification_sent_at = models.DateTimeField(null=True, blank=True)
+
+	class Meta:
+		indexes = [
+			# Serves purge_unverified's scan for stale, never-verified signups
+			models.Index(fields=['email_verified', 'verification_sent_at']),
+		]
 	
 	def is_verification_expired(self):
 		"""Check if verification link has expired (1 hour)"""
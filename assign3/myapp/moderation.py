@@ -0,0 +1,187 @@
+"""Asynchronous comment moderation with a naive Bayes spam filter.
+
+New comments are stored as ``pending`` and hidden. ``manage.py
+moderate_comments`` takes pending comments in id order, scores a whole
+batch against token counts loaded with one query, and applies the verdicts
+with one ``UPDATE`` per outcome. Moderator decisions (approve / mark spam)
+feed back into the token counts.
+"""
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Comment, Post, SpamToken
+from .page_cache import bump_post_version
+from .stats import invalidate_author_stats
+
+
+TOKEN_RE = re.compile(r"[a-z0-9']{2,30}")
+URL_RE = re.compile(r"https?://|www\.", re.IGNORECASE)
+
+
+def tokenize(text):
+	"""Distinct lowercase word tokens plus a coarse link-count feature."""
+	tokens = set(TOKEN_RE.findall(text.lower()))
+	links = len(URL_RE.findall(text))
+	tokens.add(f"__links_{min(links, 3)}__")
+	return tokens
+
+
+def spam_threshold():
+	return getattr(settings, "COMMENT_SPAM_THRESHOLD", 0.9)
+
+
+def load_counts(tokens):
+	rows = SpamToken.objects.filter(token__in=set(tokens) | {SpamToken.DOCUMENTS})
+	return {row.token: (row.spam_count, row.ham_count) for row in rows}
+
+
+def spam_probability(tokens, counts):
+	"""P(spam | tokens) with Laplace smoothing, computed in log space."""
+	spam_docs, ham_docs = counts.get(SpamToken.DOCUMENTS, (0, 0))
+	if not spam_docs or not ham_docs:
+		# Nothing to compare against yet: let everything through
+		return 0.0
+	log_spam = math.log(spam_docs / (spam_docs + ham_docs))
+	log_ham = math.log(ham_docs / (spam_docs + ham_docs))
+	for token in tokens:
+		spam_count, ham_count = counts.get(token, (0, 0))
+		log_spam += math.log((spam_count + 1) / (spam_docs + 2))
+		log_ham += math.log((ham_count + 1) / (ham_docs + 2))
+	diff = max(min(log_ham - log_spam, 700), -700)
+	return 1 / (1 + math.exp(diff))
+
+
+def _tally(texts):
+	token_counts = Counter()
+	for text in texts:
+		token_counts.update(tokenize(text))
+	token_counts[SpamToken.DOCUMENTS] = len(texts)
+	# Group tokens by amount so each distinct amount is one UPDATE
+	by_amount = {}
+	for token, amount in token_counts.items():
+		by_amount.setdefault(amount, []).append(token)
+	return by_amount
+
+
+def train(texts, spam):
+	"""Add ``texts`` to the spam or ham counts with bulk upserts."""
+	if not texts:
+		return
+	by_amount = _tally(texts)
+	field = "spam_count" if spam else "ham_count"
+	with transaction.atomic():
+		SpamToken.objects.bulk_create(
+			[SpamToken(token=token) for tokens in by_amount.values() for token in tokens], ignore_conflicts=True
+		)
+		for amount, tokens in by_amount.items():
+			SpamToken.objects.filter(token__in=tokens).update(**{field: F(field) + amount})
+
+
+def untrain(texts, spam):
+	"""Take ``texts`` back out of the spam or ham counts.
+
+	Counts stop at zero: comments the worker approved on its own were never
+	trained on until the next ``retrain``.
+	"""
+	if not texts:
+		return
+	field = "spam_count" if spam else "ham_count"
+	with transaction.atomic():
+		for amount, tokens in _tally(texts).items():
+			SpamToken.objects.filter(token__in=tokens).update(**{field: Greatest(F(field) - amount, 0)})
+
+
+def _after_visibility_change(comment_ids):
+	"""Refresh caches that a bulk ``UPDATE`` (which sends no signals) skipped."""
+	posts = Post.objects.filter(comments__id__in=comment_ids).distinct().values_list("slug", "author_id")
+	for slug, author_id in posts:
+		bump_post_version(slug)
+		invalidate_author_stats(author_id)
+
+
+def set_status(comment_ids, status):
+	"""Move comments to ``status`` in one UPDATE and keep ``is_approved`` in step.
+
+	``updated_at`` is set explicitly (``update()`` skips ``auto_now``) so the
+	live comment stream picks up approvals.
+	"""
+	if not comment_ids:
+		return 0
+	updated = Comment.objects.filter(pk__in=comment_ids).update(
+		moderation_status=status,
+		is_approved=(status == Comment.APPROVED),
+		updated_at=timezone.now(),
+	)
+	transaction.on_commit(lambda: _after_visibility_change(comment_ids))
+	return updated
+
+
+def moderate_batch(after_id=0, batch_size=500):
+	"""Classify one keyset batch of pending comments.
+
+	Returns ``(last_id, approved, flagged)``; ``last_id`` is None when there
+	was nothing left to do.
+	"""
+	batch = list(
+		Comment.objects.filter(moderation_status=Comment.PENDING, id__gt=after_id)
+		.order_by("id")
+		.values_list("id", "content")[:batch_size]
+	)
+	if not batch:
+		return None, 0, 0
+	tokenized = [(pk, tokenize(content)) for pk, content in batch]
+	counts = load_counts(set().union(*(tokens for _, tokens in tokenized)))
+	threshold = spam_threshold()
+	approved, flagged = [], []
+	for pk, tokens in tokenized:
+		(flagged if spam_probability(tokens, counts) >= threshold else approved).append(pk)
+	with transaction.atomic():
+		# Only rows still pending, in case a moderator got there first
+		pending = Comment.objects.filter(moderation_status=Comment.PENDING)
+		approved = list(pending.filter(pk__in=approved).values_list("pk", flat=True))
+		flagged = list(pending.filter(pk__in=flagged).values_list("pk", flat=True))
+		set_status(approved, Comment.APPROVED)
+		set_status(flagged, Comment.FLAGGED)
+	return batch[-1][0], len(approved), len(flagged)
+
+
+def review(comment_ids, spam):
+	"""Record a moderator's verdict and learn from it; returns the number changed.
+
+	Only comments whose status actually changes are trained on, so reviewing
+	the same comment twice does not count its tokens twice. A comment moving
+	between spam and approved is taken out of its old class first.
+	"""
+	status = Comment.SPAM if spam else Comment.APPROVED
+	with transaction.atomic():
+		changing = list(
+			Comment.objects.select_for_update().filter(pk__in=list(comment_ids))
+			.exclude(moderation_status=status).values_list("pk", "moderation_status", "content")
+		)
+		untrain([content for _, previous, content in changing if previous == Comment.SPAM], spam=True)
+		untrain([content for _, previous, content in changing if previous == Comment.APPROVED], spam=False)
+		updated = set_status([pk for pk, _, _ in changing], status)
+		train([content for _, _, content in changing], spam=spam)
+	return updated
+
+
+def retrain(batch_size=1000):
+	"""Rebuild the token counts from every spam and approved comment."""
+	with transaction.atomic():
+		SpamToken.objects.all().delete()
+		for status, spam in ((Comment.SPAM, True), (Comment.APPROVED, False)):
+			texts = Comment.objects.filter(moderation_status=status).values_list("content", flat=True)
+			chunk = []
+			for text in texts.iterator(chunk_size=batch_size):
+				chunk.append(text)
+				if len(chunk) >= batch_size:
+					train(chunk, spam=spam)
+					chunk = []
+			train(chunk, spam=spam)
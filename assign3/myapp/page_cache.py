@@ -0,0 +1,104 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+
+VERSION_KEY = "post-version:{slug}"
+PAGE_KEY = "post-page:{slug}:{version}"
+
+
+def _new_version():
+	# Seeding from the clock means an evicted version key never falls back to
+	# a number an older cached page was stored under.
+	return time.time_ns()
+
+
+def get_post_version(slug):
+	key = VERSION_KEY.format(slug=slug)
+	version = cache.get(key)
+	if version is None:
+		cache.add(key, _new_version(), None)
+		version = cache.get(key)
+	return version
+
+
+def bump_post_version(slug):
+	"""Invalidate every cached rendering of the post with this slug."""
+	key = VERSION_KEY.format(slug=slug)
+	try:
+		cache.incr(key)
+	except ValueError:
+		cache.set(key, _new_version(), None)
+
+
+def is_cacheable_request(request):
+	"""Only anonymous GETs without session or messages state are shared.
+
+	A session or messages cookie means the page may carry flash messages or
+	per-user markup, so those requests always take the normal path.
+	"""
+	if request.method not in ("GET", "HEAD"):
+		return False
+	if request.GET:
+		return False
+	cookies = request.COOKIES
+	if settings.SESSION_COOKIE_NAME in cookies:
+		return False
+	if getattr(settings, "MESSAGE_COOKIE_NAME", "messages") in cookies:
+		return False
+	return not request.user.is_authenticated
+
+
+def _patch_public_headers(response):
+	patch_cache_control(
+		response,
+		public=True,
+		max_age=settings.POST_PAGE_BROWSER_MAX_AGE,
+		s_maxage=settings.POST_PAGE_CDN_MAX_AGE,
+	)
+	patch_vary_headers(response, ("Cookie",))
+
+
+def get_cached_response(request, slug):
+	if not is_cacheable_request(request):
+		return None
+	key = PAGE_KEY.format(slug=slug, version=get_post_version(slug))
+	cached = cache.get(key)
+	if cached is None:
+		return None
+	content, content_type = cached
+	response = HttpResponse(content, content_type=content_type)
+	response["X-Page-Cache"] = "hit"
+	_patch_public_headers(response)
+	return response
+
+
+def store_response(request, slug, response):
+	"""Cache ``response`` once rendered, if nothing user-specific leaked in."""
+	if not is_cacheable_request(request):
+		return response
+	# Read the version before rendering so an edit that lands mid-render
+	# stores under the old version instead of poisoning the new one.
+	key = PAGE_KEY.format(slug=slug, version=get_post_version(slug))
+
+	def _store(rendered):
+		if rendered.status_code != 200 or rendered.cookies:
+			return
+		if request.META.get("CSRF_COOKIE_NEEDS_UPDATE"):
+			return
+		cache.set(
+			key,
+			(rendered.content, rendered["Content-Type"]),
+			settings.POST_PAGE_CACHE_TIMEOUT,
+		)
+		rendered["X-Page-Cache"] = "miss"
+		_patch_public_headers(rendered)
+
+	if hasattr(response, "add_post_render_callback"):
+		response.add_post_render_callback(_store)
+	else:
+		_store(response)
+	return response
@@ -0,0 +1,219 @@
+"""On-demand request profiling.
+
+With ``PROFILING_ENABLED`` off the middleware raises ``MiddlewareNotUsed``
+and is dropped from the stack, so it costs nothing. When on, a request is
+run under ``cProfile`` if it carries a valid signed ``?__profile=`` token
+(handed out to staff on ``/profiles/``) or falls into the random
+``PROFILE_SAMPLE_RATE`` sample. Only one request per process is profiled
+at a time; others run normally.
+
+Each capture is a ``<id>.prof`` (pstats format, loadable by snakeviz and
+friends) plus a ``<id>.json`` summary in ``PROFILE_DIR``. Only the newest
+``PROFILE_RING_SIZE`` captures are kept.
+"""
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, Http404
+from django.utils import timezone
+from django.views.generic import TemplateView, View
+
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PARAM = "__profile"
+TOKEN_SALT = "myapp.profiling"
+TOKEN_MAX_AGE = 60 * 60
+SUMMARY_FUNCTIONS = 20
+DETAIL_FUNCTIONS = 60
+CAPTURE_ID_RE = re.compile(r"^\d+-\d+$")
+
+# cProfile cannot run two profilers in one process at once (3.12+)
+_profiling = threading.Lock()
+
+
+def make_token(user):
+	return signing.dumps({"user": user.pk}, salt=TOKEN_SALT)
+
+
+def _token_is_valid(token):
+	try:
+		signing.loads(token, salt=TOKEN_SALT, max_age=TOKEN_MAX_AGE)
+	except signing.BadSignature:
+		return False
+	return True
+
+
+def profile_dir():
+	return Path(getattr(settings, "PROFILE_DIR", Path(settings.BASE_DIR) / "profiles"))
+
+
+def _label(func):
+	filename, line, name = func
+	if filename == "~":
+		return name
+	path = Path(filename)
+	try:
+		path = path.relative_to(settings.BASE_DIR)
+	except ValueError:
+		path = Path(*path.parts[-2:])
+	return f"{path}:{line}({name})"
+
+
+def top_functions(stats, limit):
+	"""``[{function, calls, tottime, cumtime}]`` by cumulative time."""
+	rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+	return [
+		{"function": _label(func), "calls": nc, "tottime": tt, "cumtime": ct}
+		for func, (cc, nc, tt, ct, callers) in rows
+	]
+
+
+def _write_atomic(path, write):
+	tmp = path.with_suffix(path.suffix + ".tmp")
+	write(tmp)
+	os.replace(tmp, path)
+
+
+def _prune(directory, keep):
+	captures = sorted(directory.glob("*.json"), key=lambda p: p.name, reverse=True)
+	for meta in captures[keep:]:
+		for path in (meta, meta.with_suffix(".prof")):
+			try:
+				path.unlink()
+			except FileNotFoundError:
+				pass
+
+
+def save_capture(profiler, request, response, elapsed, trigger):
+	directory = profile_dir()
+	directory.mkdir(parents=True, exist_ok=True)
+	# Zero-padded time first so names sort oldest to newest
+	capture_id = f"{time.time_ns():020d}-{os.getpid()}"
+	profiler.create_stats()
+	stats = pstats.Stats(profiler)
+	_write_atomic(directory / f"{capture_id}.prof", lambda tmp: stats.dump_stats(tmp))
+	summary = {
+		"id": capture_id,
+		"method": request.method,
+		"path": request.path,
+		"status": response.status_code,
+		"duration_ms": round(elapsed * 1000, 2),
+		"captured_at": timezone.now().strftime("%Y-%m-%d %H:%M:%S UTC"),
+		"trigger": trigger,
+		"top": top_functions(stats, SUMMARY_FUNCTIONS),
+	}
+	_write_atomic(directory / f"{capture_id}.json", lambda tmp: tmp.write_text(json.dumps(summary)))
+	_prune(directory, getattr(settings, "PROFILE_RING_SIZE", 50))
+	return capture_id
+
+
+def list_captures():
+	captures = []
+	for meta in sorted(profile_dir().glob("*.json"), key=lambda p: p.name, reverse=True):
+		try:
+			captures.append(json.loads(meta.read_text()))
+		except (OSError, ValueError):
+			# Pruned or half-written by another worker
+			continue
+	return captures
+
+
+class ProfilingMiddleware:
+	def __init__(self, get_response):
+		if not getattr(settings, "PROFILING_ENABLED", False):
+			raise MiddlewareNotUsed
+		self.get_response = get_response
+		self.sample_rate = getattr(settings, "PROFILE_SAMPLE_RATE", 0)
+
+	def _trigger(self, request):
+		token = request.GET.get(TOKEN_PARAM)
+		if token:
+			return "token" if _token_is_valid(token) else None
+		if self.sample_rate and random.random() < self.sample_rate:
+			return "sample"
+		return None
+
+	def __call__(self, request):
+		trigger = self._trigger(request)
+		if trigger is None or not _profiling.acquire(blocking=False):
+			return self.get_response(request)
+		try:
+			profiler = cProfile.Profile()
+			started = time.perf_counter()
+			response = profiler.runcall(self.get_response, request)
+			elapsed = time.perf_counter() - started
+		finally:
+			_profiling.release()
+		try:
+			capture_id = save_capture(profiler, request, response, elapsed, trigger)
+		except OSError:
+			logger.warning("Could not save request profile", exc_info=True)
+			return response
+		if trigger == "token":
+			response["X-Profile-Id"] = capture_id
+		return response
+
+
+class StaffRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
+	def test_func(self):
+		user = self.request.user
+		return user.is_staff or user.is_superuser
+
+
+class ProfileListView(StaffRequiredMixin, TemplateView):
+	"""Recent captures, plus a signed link for profiling a given path."""
+	template_name = "profiles.html"
+
+	def get_context_data(self, **kwargs):
+		ctx = super().get_context_data(**kwargs)
+		ctx["enabled"] = getattr(settings, "PROFILING_ENABLED", False)
+		ctx["captures"] = list_captures()
+		path = self.request.GET.get("path", "").strip()
+		if path.startswith("/") and not path.startswith("//"):
+			sep = "&" if "?" in path else "?"
+			ctx["profile_url"] = self.request.build_absolute_uri(
+				f"{path}{sep}{TOKEN_PARAM}={make_token(self.request.user)}"
+			)
+		ctx["path"] = path
+		return ctx
+
+
+def _capture_path(capture_id, suffix):
+	if not CAPTURE_ID_RE.match(capture_id):
+		raise Http404("No such capture.")
+	path = profile_dir() / f"{capture_id}{suffix}"
+	if not path.exists():
+		raise Http404("No such capture.")
+	return path
+
+
+class ProfileDetailView(StaffRequiredMixin, TemplateView):
+	template_name = "profile_detail.html"
+
+	def get_context_data(self, **kwargs):
+		ctx = super().get_context_data(**kwargs)
+		capture_id = self.kwargs["capture_id"]
+		ctx["capture"] = json.loads(_capture_path(capture_id, ".json").read_text())
+		stats = pstats.Stats(str(_capture_path(capture_id, ".prof")))
+		ctx["functions"] = top_functions(stats, DETAIL_FUNCTIONS)
+		ctx["total_calls"] = stats.total_calls
+		return ctx
+
+
+class ProfileDownloadView(StaffRequiredMixin, View):
+	def get(self, request, capture_id):
+		path = _capture_path(capture_id, ".prof")
+		return FileResponse(path.open("rb"), as_attachment=True, filename=path.name)
@@ -0,0 +1,217 @@
+import math
+import time
+from dataclasses import dataclass
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+@dataclass(frozen=True)
+class Rate:
+	"""At most ``limit`` requests per ``scope`` in any ``period``.
+
+	``scope`` is ``"user"`` (falls back to the IP for anonymous requests),
+	``"ip"`` or ``"global"``. ``rate`` uses the ``"5/m"`` notation.
+	"""
+	rate: str
+	scope: str = "ip"
+
+	@property
+	def limit(self):
+		return int(self.rate.split("/")[0])
+
+	@property
+	def period(self):
+		return PERIODS[self.rate.split("/")[1]]
+
+
+def client_ip(request):
+	# Behind Railway/nginx the proxy appends the real peer to X-Forwarded-For;
+	# the rightmost entry is the only one the client cannot forge.
+	if getattr(settings, "RATELIMIT_USE_X_FORWARDED_FOR", False):
+		forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+		if forwarded:
+			return forwarded.split(",")[-1].strip()
+	return request.META.get("REMOTE_ADDR", "")
+
+
+def _identity(request, scope):
+	if scope == "global":
+		return "all"
+	if scope == "user" and request.user.is_authenticated:
+		return f"u{request.user.pk}"
+	return f"ip{client_ip(request)}"
+
+
+def _count(key, ttl):
+	cache.add(key, 0, ttl)
+	try:
+		return cache.incr(key)
+	except ValueError:
+		# Evicted between add and incr; count this request as the first.
+		cache.set(key, 1, ttl)
+		return 1
+
+
+def consume(request, group, rate):
+	"""Count one request; return seconds to wait, or 0 if allowed.
+
+	A sliding window: the count for the current fixed window is added to the
+	previous window's count, weighted by how much of it still overlaps the
+	last ``period``. A plain fixed window would let up to twice the rate
+	through around a window edge. Each check is one atomic ``add`` plus
+	``incr`` and one ``get`` against the shared cache, so workers never race
+	on a read-modify-write.
+	"""
+	now = time.time()
+	window, elapsed = divmod(now, rate.period)
+	window = int(window)
+	prefix = f"rl:{group}:{rate.scope}:{_identity(request, rate.scope)}"
+	key = f"{prefix}:{window}"
+	# Kept for two periods so the next window can still weigh this one
+	used = _count(key, 2 * rate.period + 1)
+	previous = cache.get(f"{prefix}:{window - 1}", 0)
+	overlap = 1 - elapsed / rate.period
+	if previous * overlap + used <= rate.limit:
+		return 0
+	# A rejected request uses up nothing, so a client that keeps retrying
+	# is let in as soon as the window has room again
+	try:
+		cache.decr(key)
+	except ValueError:
+		pass
+	used -= 1
+	if used >= rate.limit:
+		# This window alone is full; wait until enough of it has slid out
+		wait = rate.period - elapsed + rate.period * (1 - (rate.limit - 1) / used)
+	else:
+		wait = rate.period * (1 - (rate.limit - used - 1) / previous) - elapsed
+	return max(1, math.ceil(wait))
+
+
+def too_many_requests(retry_after):
+	response = HttpResponse(
+		"Too many requests. Please slow down and try again shortly.",
+		status=429,
+		content_type="text/plain; charset=utf-8",
+	)
+	response["Retry-After"] = str(retry_after)
+	return response
+
+
+def overloaded():
+	response = HttpResponse(
+		"The server is busy. Please try again in a moment.",
+		status=503,
+		content_type="text/plain; charset=utf-8",
+	)
+	response["Retry-After"] = "1"
+	return response
+
+
+class ConcurrencyBudget:
+	"""Cap on requests of one group in flight across all workers.
+
+	The counter key expires so a worker killed mid-request cannot leak a slot
+	for longer than ``ttl`` seconds. Every acquire pushes the expiry out again,
+	so the key does not lapse under steady traffic, and a release never takes
+	the count below zero if it did lapse.
+	"""
+
+	def __init__(self, group, limit, ttl=60):
+		self.key = f"rl:inflight:{group}"
+		self.limit = limit
+		self.ttl = ttl
+		self.acquired = False
+
+	def acquire(self):
+		in_flight = _count(self.key, self.ttl)
+		cache.touch(self.key, self.ttl)
+		self.acquired = True
+		if in_flight > self.limit:
+			self.release()
+			return False
+		return True
+
+	def release(self):
+		if not self.acquired:
+			return
+		self.acquired = False
+		try:
+			if cache.decr(self.key) < 0:
+				# The key expired while this request ran; undo rather than
+				# leave a negative count that would admit extra requests
+				cache.incr(self.key)
+		except ValueError:
+			pass
+
+
+def check_limits(request, group, rates, methods):
+	"""Return a 429 response if any rate is exceeded, else None."""
+	if not getattr(settings, "RATELIMIT_ENABLE", True):
+		return None
+	if request.method not in methods:
+		return None
+	for rate in rates:
+		retry_after = consume(request, group, rate)
+		if retry_after:
+			return too_many_requests(retry_after)
+	return None
+
+
+def _run_with_budget(request, group, concurrency, methods, handler):
+	if not concurrency or not getattr(settings, "RATELIMIT_ENABLE", True) or request.method not in methods:
+		return handler()
+	budget = ConcurrencyBudget(group, concurrency)
+	if not budget.acquire():
+		return overloaded()
+	try:
+		return handler()
+	finally:
+		budget.release()
+
+
+def ratelimit(*rates, group=None, methods=("POST",), concurrency=None):
+	"""Decorator for function views; see :class:`RateLimitMixin`."""
+	def decorator(view_func):
+		name = group or f"{view_func.__module__}.{view_func.__qualname__}"
+
+		@wraps(view_func)
+		def _wrapped(request, *args, **kwargs):
+			limited = check_limits(request, name, rates, methods)
+			if limited is not None:
+				return limited
+			return _run_with_budget(
+				request, name, concurrency, methods,
+				lambda: view_func(request, *args, **kwargs),
+			)
+		return _wrapped
+	return decorator
+
+
+class RateLimitMixin:
+	"""Throttle a class-based view before any form work happens.
+
+	Checks run in ``dispatch`` so a rejected request never reaches form
+	validation, password hashing or the database. ``ratelimit_concurrency``
+	sheds load with a 503 once that many requests of the view are in flight.
+	"""
+	ratelimit_rates = ()
+	ratelimit_methods = ("POST",)
+	ratelimit_group = None
+	ratelimit_concurrency = None
+
+	def dispatch(self, request, *args, **kwargs):
+		group = self.ratelimit_group or f"{type(self).__module__}.{type(self).__name__}"
+		limited = check_limits(request, group, self.ratelimit_rates, self.ratelimit_methods)
+		if limited is not None:
+			return limited
+		return _run_with_budget(
+			request, group, self.ratelimit_concurrency, self.ratelimit_methods,
+			lambda: super(RateLimitMixin, self).dispatch(request, *args, **kwargs),
+		)
@@ -0,0 +1,172 @@
+"""Related posts by IDF-weighted tag overlap.
+
+``Post.tags.through`` is the inverted index: it is keyed (and indexed) on
+``tag_id``, so the posts sharing a tag are one index lookup away. Scores
+are computed offline or on tag changes and stored in ``RelatedPost`` so the
+detail page reads them with a single indexed query.
+"""
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Post, RelatedPost
+
+
+# Same-category candidates get this added to their tag score
+CATEGORY_BONUS = 0.5
+# Tags on more published posts than this carry almost no signal and would
+# make candidate generation scan huge posting lists, so they are skipped.
+MAX_TAG_POSTS = 5000
+
+
+def related_count():
+	return getattr(settings, "RELATED_POSTS_COUNT", 5)
+
+
+def idf(doc_freq, total):
+	return math.log(1 + total / doc_freq)
+
+
+def rank_candidates(tag_ids, category_id, postings, doc_freq, total, candidate_meta, exclude_id):
+	"""Score candidates and return the top ``(post_id, score)`` pairs.
+
+	``postings`` maps tag id -> iterable of post ids, ``candidate_meta`` maps
+	post id -> ``(category_id, published_at)``; recency breaks ties.
+	"""
+	scores = defaultdict(float)
+	for tag_id in tag_ids:
+		df = doc_freq.get(tag_id, 0)
+		if not df or df > MAX_TAG_POSTS:
+			continue
+		weight = idf(df, total)
+		for post_id in postings.get(tag_id, ()):
+			if post_id != exclude_id:
+				scores[post_id] += weight
+	if category_id is not None:
+		for post_id in scores:
+			if candidate_meta.get(post_id, (None, None))[0] == category_id:
+				scores[post_id] += CATEGORY_BONUS
+
+	def sort_key(item):
+		post_id, score = item
+		published_at = candidate_meta.get(post_id, (None, None))[1]
+		return (-score, -(published_at.timestamp() if published_at else 0), -post_id)
+
+	return sorted(scores.items(), key=sort_key)[:related_count()]
+
+
+def _published_through():
+	return Post.tags.through.objects.filter(post__status=Post.PUBLISHED, post__deleted_at__isnull=True)
+
+
+def _store(post_id, ranked):
+	RelatedPost.objects.filter(post_id=post_id).delete()
+	RelatedPost.objects.bulk_create([
+		RelatedPost(post_id=post_id, related_id=related_id, score=score, rank=rank)
+		for rank, (related_id, score) in enumerate(ranked)
+	])
+
+
+def published_total():
+	return Post.objects.published().count()
+
+
+def refresh_related(post_id, total=None):
+	"""Recompute one post's related list from the inverted index.
+
+	``total`` is the number of published posts; callers refreshing several
+	posts count once and pass it in. Returns the ids of the related posts so
+	callers can refresh them too.
+	"""
+	row = Post.objects.filter(pk=post_id).values_list("status", "category_id").first()
+	if row is None:
+		return []
+	status, category_id = row
+	if status != Post.PUBLISHED:
+		RelatedPost.objects.filter(post_id=post_id).delete()
+		return []
+
+	tag_ids = list(Post.tags.through.objects.filter(post_id=post_id).values_list("tag_id", flat=True))
+	through = _published_through()
+	doc_freq = dict(
+		through.filter(tag_id__in=tag_ids)
+		.values("tag_id").annotate(n=Count("post_id")).values_list("tag_id", "n")
+	)
+	scan = [t for t in tag_ids if 0 < doc_freq.get(t, 0) <= MAX_TAG_POSTS]
+	postings = defaultdict(list)
+	for tag_id, other_id in through.filter(tag_id__in=scan).values_list("tag_id", "post_id"):
+		postings[tag_id].append(other_id)
+	candidate_ids = {pid for ids in postings.values() for pid in ids} - {post_id}
+	candidate_meta = {
+		pk: (cat, published_at)
+		for pk, cat, published_at in Post.objects.filter(pk__in=candidate_ids)
+		.values_list("pk", "category_id", "published_at")
+	}
+	if total is None:
+		total = published_total()
+	ranked = rank_candidates(tag_ids, category_id, postings, doc_freq, total, candidate_meta, post_id)
+	with transaction.atomic():
+		_store(post_id, ranked)
+	return [related_id for related_id, _ in ranked]
+
+
+def refresh_related_and_neighbours(post_id):
+	"""Refresh a post plus everything it is now (or was) related to.
+
+	Overlap is symmetric, so the posts on either side of the old and new
+	lists are the ones whose rankings can move.
+	"""
+	before = set(RelatedPost.objects.filter(post_id=post_id).values_list("related_id", flat=True))
+	total = published_total()
+	after = set(refresh_related(post_id, total))
+	for other_id in before | after:
+		refresh_related(other_id, total)
+	return before | after | {post_id}
+
+
+def rebuild_all(batch_size=500, stdout=None):
+	"""Recompute every published post's related list.
+
+	The posting lists are loaded once and then scored in batches of posts,
+	each written in its own short transaction.
+	"""
+	total = published_total()
+	postings = defaultdict(list)
+	post_tags = defaultdict(list)
+	rows = _published_through().values_list("tag_id", "post_id").iterator(chunk_size=5000)
+	for tag_id, post_id in rows:
+		postings[tag_id].append(post_id)
+		post_tags[post_id].append(tag_id)
+	doc_freq = {tag_id: len(ids) for tag_id, ids in postings.items()}
+	meta = {
+		pk: (cat, published_at)
+		for pk, cat, published_at in Post.objects.published()
+		.values_list("pk", "category_id", "published_at").iterator(chunk_size=5000)
+	}
+
+	post_ids = sorted(meta)
+	done = 0
+	for start in range(0, len(post_ids), batch_size):
+		batch = post_ids[start:start + batch_size]
+		entries = []
+		for post_id in batch:
+			ranked = rank_candidates(
+				post_tags.get(post_id, ()), meta[post_id][0], postings,
+				doc_freq, total, meta, post_id,
+			)
+			entries.extend(
+				RelatedPost(post_id=post_id, related_id=related_id, score=score, rank=rank)
+				for rank, (related_id, score) in enumerate(ranked)
+			)
+		with transaction.atomic():
+			RelatedPost.objects.filter(post_id__in=batch).delete()
+			RelatedPost.objects.bulk_create(entries)
+		done += len(batch)
+		if stdout is not None:
+			stdout.write(f"  {done}/{len(post_ids)} posts")
+	# Drafts and removed posts keep no stale lists around
+	RelatedPost.objects.exclude(post__status=Post.PUBLISHED, post__deleted_at__isnull=True).delete()
+	return done
@@ -0,0 +1,92 @@
+"""Cached id lists for searches on the home page.
+
+A search is keyed by its normalized query (case-folded, whitespace
+collapsed, plus the category and tag filters) and the current search
+generation. The generation lives in the shared cache and is bumped on any
+post, tag-link, category or tag write, so every worker stops using old
+results at once without having to find and delete them.
+
+Result lists are kept per process in an LRU of ``SEARCH_CACHE_SIZE``
+entries; lists from older generations simply age out. Only ids are stored,
+so a page hydrates its ten posts with one ``in_bulk``.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+GENERATION_KEY = "search:generation"
+# Cached in place of an id list when a query matched too many posts
+TOO_MANY = "too-many"
+
+
+def get_generation():
+	generation = cache.get(GENERATION_KEY)
+	if generation is None:
+		# Seeded from the clock so an evicted key never repeats an old number
+		cache.add(GENERATION_KEY, time.time_ns(), None)
+		generation = cache.get(GENERATION_KEY)
+	return generation
+
+
+def bump_generation():
+	try:
+		cache.incr(GENERATION_KEY)
+	except ValueError:
+		cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def normalize(q, category="", tag=""):
+	return (" ".join(q.casefold().split()), category.strip().lower(), tag.strip().lower())
+
+
+class LRUCache:
+	"""Thread-safe mapping that drops the least recently used entry when full."""
+
+	def __init__(self, max_size):
+		self.max_size = max_size
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+
+	def get(self, key):
+		with self.lock:
+			try:
+				self.entries.move_to_end(key)
+			except KeyError:
+				return None
+			return self.entries[key]
+
+	def set(self, key, value):
+		with self.lock:
+			self.entries[key] = value
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.max_size:
+				self.entries.popitem(last=False)
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+
+results = LRUCache(getattr(settings, "SEARCH_CACHE_SIZE", 256))
+
+
+def cached_ids(query, compute):
+	"""Result ids for a normalized ``query``, computing them on a miss.
+
+	``compute`` returns an iterable of ids in display order. Returns None for
+	result sets longer than ``SEARCH_CACHE_MAX_IDS``; those are not worth
+	holding and the caller should page the queryset as usual.
+	"""
+	key = (get_generation(), query)
+	ids = results.get(key)
+	if ids is None:
+		limit = getattr(settings, "SEARCH_CACHE_MAX_IDS", 1000)
+		ids = list(compute()[:limit + 1])
+		# A tuple, so callers cannot mutate the shared entry
+		ids = TOO_MANY if len(ids) > limit else tuple(ids)
+		results.set(key, ids)
+	return None if ids == TOO_MANY else ids
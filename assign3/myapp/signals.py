@@ -0,0 +1,151 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import archive
+from . import search_cache
+from . import timeline
+from .models import Category, Comment, Post, RelatedPost, Tag
+from .page_cache import bump_post_version
+from .related import refresh_related_and_neighbours
+from .stats import invalidate_author_stats
+from .typeahead import refresh_tag_counts
+
+
+def _bump_on_commit(slugs):
+	# Bumping after commit keeps a concurrent render from caching the old
+	# rows under the new version.
+	slugs = [slug for slug in slugs if slug]
+	if slugs:
+		transaction.on_commit(lambda: [bump_post_version(slug) for slug in slugs])
+
+
+def _on_commit(func, *args):
+	transaction.on_commit(lambda: func(*args))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_page(sender, instance, **kwargs):
+	_bump_on_commit([instance.slug])
+	_on_commit(invalidate_author_stats, instance.author_id)
+
+
+@receiver(pre_delete, sender=Post)
+def refresh_tag_counts_on_post_delete(sender, instance, **kwargs):
+	# The through rows are gone by post_delete, so capture the tags first.
+	tag_ids = list(instance.tags.values_list("pk", flat=True))
+	if tag_ids:
+		_on_commit(refresh_tag_counts, tag_ids)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def refresh_tag_counts_on_tags(sender, instance, action, reverse, pk_set, **kwargs):
+	if reverse:
+		if action in ("post_add", "post_remove", "post_clear"):
+			refresh_tag_counts([instance.pk])
+	elif action == "pre_clear":
+		instance._cleared_tag_ids = list(instance.tags.values_list("pk", flat=True))
+	elif action == "post_clear":
+		refresh_tag_counts(getattr(instance, "_cleared_tag_ids", []))
+	elif action in ("post_add", "post_remove"):
+		refresh_tag_counts(pk_set)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_post_page_on_tags(sender, instance, action, reverse, pk_set, **kwargs):
+	if not reverse:
+		if action in ("post_add", "post_remove", "post_clear"):
+			_bump_on_commit([instance.slug])
+		return
+	# Tag side of the relation: every affected post needs a new version.
+	if action == "pre_clear":
+		posts = Post.objects.filter(tags=instance)
+	elif action in ("post_add", "post_remove"):
+		posts = Post.objects.filter(pk__in=pk_set)
+	else:
+		return
+	_bump_on_commit(list(posts.values_list("slug", flat=True)))
+
+
+@receiver(post_save, sender=Comment)
+def invalidate_post_page_on_comment(sender, instance, created, **kwargs):
+	# No post_delete receiver here: it would stop Django from fast-deleting
+	# comments when a post is removed. Edits (including unapproving) still bump.
+	post = instance.post
+	if instance.is_approved or not created:
+		_bump_on_commit([post.slug])
+	_on_commit(invalidate_author_stats, post.author_id)
+
+
+def _refresh_related(post_id):
+	refreshed = refresh_related_and_neighbours(post_id)
+	for slug in Post.objects.filter(pk__in=refreshed).values_list("slug", flat=True):
+		bump_post_version(slug)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def refresh_related_on_tags(sender, instance, action, reverse, pk_set, **kwargs):
+	if action not in ("post_add", "post_remove", "post_clear"):
+		return
+	if reverse:
+		# Tag-side edits touch many posts at once; leave those to
+		# ``manage.py rebuild_related``.
+		return
+	_on_commit(_refresh_related, instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def refresh_related_on_publish(sender, instance, **kwargs):
+	# Newly published posts need a list; unpublished ones drop theirs.
+	if instance.status != Post.PUBLISHED:
+		RelatedPost.objects.filter(post_id=instance.pk).delete()
+	elif not RelatedPost.objects.filter(post_id=instance.pk).exists():
+		_on_commit(_refresh_related, instance.pk)
+
+
+@receiver(pre_save, sender=Post)
+def remember_archive_bucket(sender, instance, **kwargs):
+	old = None
+	if instance.pk:
+		old = Post.all_objects.filter(pk=instance.pk).values_list("status", "published_at").first()
+	instance._old_archive_bucket = archive.bucket_for(*old) if old else None
+	instance._old_publication = old
+
+
+@receiver(post_save, sender=Post)
+def update_archive_on_save(sender, instance, **kwargs):
+	archive.move(
+		getattr(instance, "_old_archive_bucket", None),
+		archive.bucket_for(instance.status, instance.published_at),
+	)
+
+
+@receiver(post_delete, sender=Post)
+def update_archive_on_delete(sender, instance, **kwargs):
+	archive.adjust(archive.bucket_for(instance.status, instance.published_at), -1)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Tag)
+def invalidate_search_results(sender, **kwargs):
+	_on_commit(search_cache.bump_generation)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_search_results_on_tags(sender, action, **kwargs):
+	if action in ("post_add", "post_remove", "post_clear"):
+		_on_commit(search_cache.bump_generation)
+
+
+@receiver(post_save, sender=Post)
+def update_timelines_on_save(sender, instance, created, **kwargs):
+	timeline.post_saved(instance, None if created else getattr(instance, "_old_publication", None))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def update_timelines_on_tags(sender, instance, action, reverse, pk_set, **kwargs):
+	if action == "post_add":
+		timeline.tags_added(pk_set if reverse else [instance.pk])
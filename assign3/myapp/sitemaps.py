@@ -0,0 +1,107 @@
+"""Sitemap index and streamed post sitemaps.
+
+Shard ``n`` holds the published posts with ``n * SHARD_SIZE <= id <
+(n + 1) * SHARD_SIZE``. Because ids are unique no shard can exceed the
+50,000-URL limit, and each shard is a keyset range on the primary key
+that is streamed row by row, so memory stays flat however many posts exist.
+"""
+from datetime import timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db.models import F, Max
+from django.http import Http404, HttpResponseNotModified, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.generic import View
+
+from .models import Post
+
+
+SHARD_SIZE = 50000
+INDEX_CACHE_KEY = "sitemap:index"
+INDEX_CACHE_TIMEOUT = 60 * 60
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+
+def _w3c(dt):
+	return dt.astimezone(dt_timezone.utc).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+
+def shard_bounds(shard):
+	return shard * SHARD_SIZE, (shard + 1) * SHARD_SIZE
+
+
+def shard_lastmods():
+	"""``[(shard, last_modified)]`` for every non-empty shard, cached."""
+	shards = cache.get(INDEX_CACHE_KEY)
+	if shards is None:
+		shards = list(
+			Post.objects.published()
+			.annotate(shard=F("id") / SHARD_SIZE)
+			.values("shard")
+			.annotate(lastmod=Max("updated_at"))
+			.order_by("shard")
+			.values_list("shard", "lastmod")
+		)
+		cache.set(INDEX_CACHE_KEY, shards, INDEX_CACHE_TIMEOUT)
+	return shards
+
+
+def _not_modified(request, last_modified):
+	since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE", ""))
+	return since is not None and int(last_modified.timestamp()) <= since
+
+
+class SitemapIndexView(View):
+	def get(self, request):
+		shards = shard_lastmods()
+
+		def generate():
+			yield XML_HEADER
+			yield f'<sitemapindex xmlns="{SITEMAP_NS}">\n'
+			for shard, lastmod in shards:
+				loc = escape(request.build_absolute_uri(reverse("sitemap-posts", kwargs={"shard": shard})))
+				yield f"<sitemap><loc>{loc}</loc><lastmod>{_w3c(lastmod)}</lastmod></sitemap>\n"
+			yield "</sitemapindex>\n"
+
+		response = StreamingHttpResponse(generate(), content_type="application/xml")
+		if shards:
+			response["Last-Modified"] = http_date(max(lm for _, lm in shards).timestamp())
+		return response
+
+
+class PostSitemapView(View):
+	"""One shard, streamed with ``.values_list().iterator()``."""
+
+	def get(self, request, shard):
+		low, high = shard_bounds(shard)
+		rows = Post.objects.published().filter(id__gte=low, id__lt=high)
+		last_modified = rows.aggregate(lastmod=Max("updated_at"))["lastmod"]
+		if last_modified is None:
+			raise Http404("Empty sitemap shard.")
+		if _not_modified(request, last_modified):
+			return HttpResponseNotModified()
+
+		base = request.build_absolute_uri("/").rstrip("/")
+
+		def generate():
+			yield XML_HEADER
+			yield f'<urlset xmlns="{SITEMAP_NS}">\n'
+			entries = rows.order_by("id").values_list("slug", "updated_at").iterator(chunk_size=2000)
+			buffer = []
+			for slug, updated_at in entries:
+				loc = escape(base + reverse("post-detail", kwargs={"slug": slug}))
+				buffer.append(f"<url><loc>{loc}</loc><lastmod>{_w3c(updated_at)}</lastmod></url>\n")
+				if len(buffer) >= 500:
+					yield "".join(buffer)
+					buffer = []
+			buffer.append("</urlset>\n")
+			yield "".join(buffer)
+
+		response = StreamingHttpResponse(generate(), content_type="application/xml")
+		response["Last-Modified"] = http_date(last_modified.timestamp())
+		response["Cache-Control"] = "public, max-age=3600"
+		return response
@@ -0,0 +1,226 @@
+"""Slow query log with fingerprints, call sites and EXPLAIN plans.
+
+When ``SLOW_QUERY_LOG_ENABLED`` is set, every new database connection gets
+an execute wrapper that times each statement. Statements at or over
+``SLOW_QUERY_THRESHOLD_MS`` are appended as JSON lines to
+``SLOW_QUERY_LOG`` with:
+
+- a fingerprint of the SQL with literals and ``IN`` lists collapsed;
+- the first stack frame in the project's own code (e.g.
+  ``myapp/views.py:87 in get_queryset``) and the view being served;
+- for the first occurrence of each fingerprint in a process, an ``EXPLAIN``
+  run by a background thread on its own connection, so the request that
+  hit the slow query does not wait for it.
+
+``manage.py slow_queries`` aggregates the log by fingerprint.
+"""
+import hashlib
+import json
+import logging
+import queue
+import re
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections
+
+
+MAX_SQL = 4000
+MAX_FINGERPRINTS = 10000
+EXPLAIN_QUEUE_SIZE = 100
+EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")
+# Instrumentation frames that must not be reported as the call site
+SKIP_MODULES = {__name__, "myapp.tracing", "myapp.profiling"}
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_PLACEHOLDER_RE = re.compile(r"%s|\$\d+")
+_SPACE_RE = re.compile(r"\s+")
+
+_view = ContextVar("slow_query_view", default=None)
+_local = threading.local()
+_explained = set()
+_explain_queue = queue.Queue(maxsize=EXPLAIN_QUEUE_SIZE)
+_explain_thread = None
+_lock = threading.Lock()
+_logger = None
+
+
+def normalize(sql):
+	"""SQL with every literal and placeholder replaced by ``?``."""
+	sql = _STRING_RE.sub("?", sql)
+	sql = _PLACEHOLDER_RE.sub("?", sql)
+	sql = _NUMBER_RE.sub("?", sql)
+	sql = _IN_LIST_RE.sub("IN (...)", sql)
+	return _SPACE_RE.sub(" ", sql).strip()
+
+
+def fingerprint(normalized):
+	return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def call_site():
+	"""First frame in project code, as ``path:line in func``."""
+	base = str(settings.BASE_DIR)
+	frame = sys._getframe(1)
+	while frame is not None:
+		filename = frame.f_code.co_filename
+		if (
+			filename.startswith(base) and "site-packages" not in filename
+			and frame.f_globals.get("__name__") not in SKIP_MODULES
+		):
+			return f"{Path(filename).relative_to(base)}:{frame.f_lineno} in {frame.f_code.co_name}"
+		frame = frame.f_back
+	return None
+
+
+def _get_logger():
+	global _logger
+	if _logger is None:
+		path = Path(log_path())
+		path.parent.mkdir(parents=True, exist_ok=True)
+		logger = logging.getLogger("myapp.slow_queries.log")
+		logger.propagate = False
+		logger.setLevel(logging.INFO)
+		handler = RotatingFileHandler(
+			path,
+			maxBytes=getattr(settings, "SLOW_QUERY_LOG_MAX_BYTES", 10 * 1024 * 1024),
+			backupCount=getattr(settings, "SLOW_QUERY_LOG_BACKUPS", 5),
+		)
+		handler.setFormatter(logging.Formatter("%(message)s"))
+		logger.addHandler(handler)
+		_logger = logger
+	return _logger
+
+
+def log_path():
+	return getattr(settings, "SLOW_QUERY_LOG", Path(settings.BASE_DIR) / "logs" / "slow_queries.jsonl")
+
+
+def _write(entry):
+	_get_logger().info(json.dumps(entry, separators=(",", ":"), default=str))
+
+
+def _explain_worker():
+	_local.explaining = True
+	while True:
+		alias, fp, sql, params = _explain_queue.get()
+		connection = connections[alias]
+		try:
+			prefix = connection.ops.explain_query_prefix()
+			with connection.cursor() as cursor:
+				cursor.execute(f"{prefix} {sql}", params)
+				plan = "\n".join(" ".join(str(col) for col in row) for row in cursor.fetchall())
+		except (DatabaseError, TypeError, ValueError) as exc:
+			plan = f"EXPLAIN failed: {exc}"
+		finally:
+			connection.close_if_unusable_or_obsolete()
+		_write({"type": "plan", "ts": time.time(), "fingerprint": fp, "alias": alias, "plan": plan})
+
+
+def _queue_explain(alias, fp, sql, params):
+	global _explain_thread
+	with _lock:
+		if fp in _explained or len(_explained) >= MAX_FINGERPRINTS:
+			return
+		_explained.add(fp)
+		if _explain_thread is None:
+			_explain_thread = threading.Thread(target=_explain_worker, name="slow-query-explain", daemon=True)
+			_explain_thread.start()
+	try:
+		_explain_queue.put_nowait((alias, fp, sql, params))
+	except queue.Full:
+		# Try again the next time this query is slow
+		with _lock:
+			_explained.discard(fp)
+
+
+class SlowQueryLogger:
+	def __init__(self, alias, threshold_ms):
+		self.alias = alias
+		self.threshold = threshold_ms / 1000
+
+	def __call__(self, execute, sql, params, many, context):
+		if getattr(_local, "explaining", False):
+			return execute(sql, params, many, context)
+		started = time.perf_counter()
+		try:
+			return execute(sql, params, many, context)
+		finally:
+			elapsed = time.perf_counter() - started
+			if elapsed >= self.threshold:
+				self.record(sql, params, many, elapsed)
+
+	def record(self, sql, params, many, elapsed):
+		normalized = normalize(sql)[:MAX_SQL]
+		fp = fingerprint(normalized)
+		_write({
+			"type": "query",
+			"ts": time.time(),
+			"fingerprint": fp,
+			"duration_ms": round(elapsed * 1000, 3),
+			"alias": self.alias,
+			"sql": normalized,
+			"call_site": call_site(),
+			"view": _view.get(),
+			"many": many,
+		})
+		if not many and sql.lstrip().upper().startswith(EXPLAINABLE):
+			_queue_explain(self.alias, fp, sql, params)
+
+
+def attach(sender, connection, **kwargs):
+	"""``connection_created`` receiver: time every statement on the new connection."""
+	if not any(isinstance(w, SlowQueryLogger) for w in connection.execute_wrappers):
+		threshold = getattr(settings, "SLOW_QUERY_THRESHOLD_MS", 200)
+		# At the bottom of the stack: execute_wrapper() blocks that are already
+		# open (e.g. the tracer's) pop from the end when they exit
+		connection.execute_wrappers.insert(0, SlowQueryLogger(connection.alias, threshold))
+
+
+class SlowQueryViewMiddleware:
+	"""Remembers the resolved view so slow queries can name it."""
+
+	def __init__(self, get_response):
+		if not getattr(settings, "SLOW_QUERY_LOG_ENABLED", False):
+			raise MiddlewareNotUsed
+		self.get_response = get_response
+
+	def __call__(self, request):
+		token = _view.set(None)
+		try:
+			return self.get_response(request)
+		finally:
+			_view.reset(token)
+
+	def process_view(self, request, view_func, view_args, view_kwargs):
+		view = getattr(view_func, "view_class", view_func)
+		_view.set(f"{view.__module__}.{view.__qualname__}")
+
+
+def read_log(paths):
+	"""Yield the JSON entries from the log and its rotated backups, oldest first."""
+	for path in paths:
+		try:
+			handle = open(path)
+		except FileNotFoundError:
+			continue
+		with handle:
+			for line in handle:
+				try:
+					yield json.loads(line)
+				except ValueError:
+					continue
+
+
+def log_files():
+	path = Path(log_path())
+	backups = getattr(settings, "SLOW_QUERY_LOG_BACKUPS", 5)
+	return [path.with_name(f"{path.name}.{n}") for n in range(backups, 0, -1)] + [path]
@@ -0,0 +1,98 @@
+"""Unique slug allocation for ``Post``, ``Category`` and ``Tag``.
+
+A new slug is ``slugify(text)`` or, when that is taken, ``<base>-<n>`` with
+``n`` one past the highest suffix in use. The taken slugs are read with one
+prefix query, which the ``varchar_pattern_ops`` index Django creates for
+unique slug columns on PostgreSQL serves. Two writers can still pick the
+same slug between that read and their INSERT, so the save runs in a
+savepoint and is retried with a fresh suffix on an ``IntegrityError``.
+"""
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+
+# Every round of a race has a winner, so this many writers always succeed
+MAX_ATTEMPTS = 10
+# Bases per prefix query in allocate_slugs
+BATCH_SIZE = 200
+# Room left after the base for "-" plus the suffix digits
+SUFFIX_ROOM = 8
+
+
+def base_slug(model, text, field="slug"):
+	max_length = model._meta.get_field(field).max_length
+	base = slugify(text)[:max_length - SUFFIX_ROOM].strip("-")
+	# Titles with no sluggable characters fall back to the model name
+	return base or model._meta.model_name
+
+
+def _highest_suffixes(model, bases, field="slug"):
+	"""``{base: highest n in use}``, -1 when free, 0 when only ``base`` is taken.
+
+	One query per call, however many bases are asked for.
+	"""
+	condition = Q()
+	for base in bases:
+		condition |= Q(**{field: base}) | Q(**{f"{field}__startswith": f"{base}-"})
+	highest = {base: -1 for base in bases}
+	patterns = {base: re.compile(rf"^{re.escape(base)}(?:-(\d+))?$") for base in bases}
+	for slug in model._base_manager.filter(condition).values_list(field, flat=True):
+		for base, pattern in patterns.items():
+			match = pattern.match(slug)
+			if match:
+				suffix = int(match.group(1)) if match.group(1) else 0
+				highest[base] = max(highest[base], suffix)
+	return highest
+
+
+def _with_suffix(base, highest):
+	# "-1" is never handed out, so the second "Weekly Update" is weekly-update-2
+	return base if highest < 0 else f"{base}-{max(highest, 1) + 1}"
+
+
+def next_free_slug(model, text, field="slug"):
+	base = base_slug(model, text, field)
+	return _with_suffix(base, _highest_suffixes(model, [base], field)[base])
+
+
+def save_with_unique_slug(instance, text, save, field="slug"):
+	"""Pick a free slug for ``instance`` and call ``save()``, retrying on a race.
+
+	Each attempt runs in a savepoint, so a lost race does not break the
+	caller's transaction. An ``IntegrityError`` that is not about the slug
+	is re-raised straight away.
+	"""
+	model = type(instance)
+	for attempt in range(MAX_ATTEMPTS):
+		slug = next_free_slug(model, text, field)
+		setattr(instance, field, slug)
+		try:
+			with transaction.atomic():
+				return save()
+		except IntegrityError:
+			if attempt == MAX_ATTEMPTS - 1 or not model._base_manager.filter(**{field: slug}).exists():
+				setattr(instance, field, "")
+				raise
+
+
+def allocate_slugs(model, texts, field="slug"):
+	"""Unique slugs for many new rows at once, e.g. before ``bulk_create``.
+
+	Reads the taken slugs with one query per ``BATCH_SIZE`` distinct bases
+	and numbers duplicates within ``texts`` as well. Rows inserted
+	concurrently are not seen, so the bulk insert should still be prepared
+	to fail.
+	"""
+	bases = [base_slug(model, text, field) for text in texts]
+	distinct = sorted(set(bases))
+	highest = {}
+	for start in range(0, len(distinct), BATCH_SIZE):
+		highest.update(_highest_suffixes(model, distinct[start:start + BATCH_SIZE], field))
+	slugs = []
+	for base in bases:
+		slugs.append(_with_suffix(base, highest[base]))
+		highest[base] = max(highest[base], 1) + 1 if highest[base] >= 0 else 0
+	return slugs
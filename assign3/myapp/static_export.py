@@ -0,0 +1,221 @@
+"""Static export of the public site for a CDN.
+
+``manage.py export_static`` writes every published post to
+``post/<slug>/index.html`` and the post list to ``home/index.html`` and
+``home/page/<n>/index.html``, mirroring the live URLs, so the tree can be
+synced to a bucket and served without Django. Pages are rendered with the
+live templates as an anonymous reader would see them.
+
+Post ids are walked in keyset chunks of ``chunk_size``; each chunk's posts
+that changed are rendered by one task in a pool of worker processes. A post changed
+when its ``updated_at``, slug, approved comments, category, tags or related
+posts differ from ``manifest.json`` left by the previous export; unchanged posts are not
+rendered again, and posts that were unpublished or deleted have their
+directories removed. The index pages are rebuilt whenever any post did.
+"""
+import json
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Count, Max, Q
+from django.http import HttpRequest
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from .models import Comment, Post, RelatedPost
+
+
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 2
+
+
+def export_dir():
+	return Path(getattr(settings, "STATIC_EXPORT_DIR", Path(settings.BASE_DIR) / "static_export"))
+
+
+def _write_atomic(path, text):
+	path.parent.mkdir(parents=True, exist_ok=True)
+	tmp = path.with_name(path.name + ".tmp")
+	tmp.write_text(text, encoding="utf-8")
+	os.replace(tmp, path)
+
+
+def _render(template, ctx, path):
+	request = HttpRequest()
+	request.method = "GET"
+	request.path = request.path_info = path
+	request.user = AnonymousUser()
+	return render_to_string(template, {**ctx, "static_export": True}, request=request)
+
+
+def _output_path(root, url):
+	return Path(root) / url.strip("/") / "index.html"
+
+
+def render_posts(root, post_ids):
+	"""Render the given posts; returns ``{id: slug}`` for those written."""
+	posts = Post.objects.published().filter(pk__in=post_ids).select_related("author", "category").prefetch_related("tags")
+	comments = {}
+	for comment in Comment.objects.filter(post_id__in=post_ids, is_approved=True).select_related("user").order_by("created_at"):
+		comments.setdefault(comment.post_id, []).append(comment)
+	related = {}
+	entries = RelatedPost.objects.filter(
+		post_id__in=post_ids, related__status=Post.PUBLISHED, related__deleted_at__isnull=True,
+	).select_related("related").order_by("post_id", "rank")
+	for entry in entries:
+		related.setdefault(entry.post_id, []).append(entry.related)
+	written = {}
+	for post in posts:
+		url = post.get_absolute_url()
+		html = _render("post_detail.html", {
+			"post": post,
+			"object": post,
+			"comments": comments.get(post.pk, []),
+			"related_posts": related.get(post.pk, []),
+		}, url)
+		_write_atomic(_output_path(root, url), html)
+		written[post.pk] = post.slug
+	return written
+
+
+def _page_url(number):
+	home = reverse("home")
+	return home if number == 1 else f"{home}page/{number}/"
+
+
+def render_index_page(root, number, num_pages, post_ids):
+	posts = Post.objects.select_related("author", "category").prefetch_related("tags").in_bulk(post_ids)
+	url = _page_url(number)
+	html = _render("static_index.html", {
+		"posts": [posts[pk] for pk in post_ids if pk in posts],
+		"number": number,
+		"num_pages": num_pages,
+		"previous_url": _page_url(number - 1) if number > 1 else None,
+		"next_url": _page_url(number + 1) if number < num_pages else None,
+	}, url)
+	_write_atomic(_output_path(root, url), html)
+	return number
+
+
+def load_manifest(root):
+	try:
+		manifest = json.loads((Path(root) / MANIFEST).read_text())
+	except (OSError, ValueError):
+		return {"posts": {}, "pages": 0}
+	if manifest.get("version") != MANIFEST_VERSION:
+		return {"posts": {}, "pages": 0}
+	return manifest
+
+
+def _signature(updated_at, comment_count, last_comment, category_id, tag_ids, related_ids):
+	# Tag and related-post changes do not touch the post row, so their ids
+	# are part of the signature too
+	return "|".join((
+		updated_at.isoformat(), str(comment_count), last_comment.isoformat() if last_comment else "",
+		str(category_id or ""), ",".join(map(str, sorted(tag_ids))), ",".join(map(str, related_ids)),
+	))
+
+
+def _ids_by_post(rows):
+	ids = {}
+	for post_id, other_id in rows:
+		ids.setdefault(post_id, []).append(other_id)
+	return ids
+
+
+def _chunks(chunk_size):
+	"""Yield ``[(id, slug, signature)]`` for published posts in keyset chunks of ids."""
+	approved = Q(comments__is_approved=True)
+	last_id = 0
+	while True:
+		rows = list(
+			Post.objects.published().filter(pk__gt=last_id).order_by("pk")
+			.annotate(comment_count=Count("comments", filter=approved), last_comment=Max("comments__updated_at", filter=approved))
+			.values_list("pk", "slug", "updated_at", "comment_count", "last_comment", "category_id")[:chunk_size]
+		)
+		if not rows:
+			return
+		post_ids = [row[0] for row in rows]
+		tags = _ids_by_post(Post.tags.through.objects.filter(post_id__in=post_ids).values_list("post_id", "tag_id"))
+		# Same filter and order as render_posts
+		related = _ids_by_post(
+			RelatedPost.objects.filter(
+				post_id__in=post_ids, related__status=Post.PUBLISHED, related__deleted_at__isnull=True,
+			).order_by("post_id", "rank").values_list("post_id", "related_id")
+		)
+		yield [
+			(pk, slug, _signature(*rest, tags.get(pk, ()), related.get(pk, ())))
+			for pk, slug, *rest in rows
+		]
+		last_id = rows[-1][0]
+
+
+def _index_pages(page_size):
+	ids = Post.objects.published().order_by("-published_at", "-id").values_list("pk", flat=True)
+	page = []
+	for pk in ids.iterator(chunk_size=2000):
+		page.append(pk)
+		if len(page) == page_size:
+			yield page
+			page = []
+	if page:
+		yield page
+
+
+def _remove(root, url):
+	shutil.rmtree(Path(root) / url.strip("/"), ignore_errors=True)
+
+
+def export(root=None, workers=None, chunk_size=500, page_size=10, full=False):
+	"""Bring the tree under ``root`` up to date; returns a summary dict."""
+	root = Path(root or export_dir())
+	root.mkdir(parents=True, exist_ok=True)
+	manifest = load_manifest(root)
+	old = {} if full else manifest["posts"]
+	old_pages = manifest["pages"]
+	current = {}
+	# Spawned rather than forked, so no worker inherits this process's open
+	# database connection; each sets Django up before unpickling its tasks
+	pool = ProcessPoolExecutor(
+		max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=django.setup,
+	)
+	with pool:
+		futures = []
+		for chunk in _chunks(chunk_size):
+			changed = []
+			for pk, slug, signature in chunk:
+				current[str(pk)] = {"slug": slug, "signature": signature}
+				previous = old.get(str(pk))
+				if previous != current[str(pk)]:
+					changed.append(pk)
+					if previous and previous["slug"] != slug:
+						_remove(root, reverse("post-detail", kwargs={"slug": previous["slug"]}))
+			if changed:
+				futures.append(pool.submit(render_posts, str(root), changed))
+		rendered = sum(len(future.result()) for future in futures)
+
+		removed = [entry["slug"] for pk, entry in old.items() if pk not in current]
+		for slug in removed:
+			_remove(root, reverse("post-detail", kwargs={"slug": slug}))
+
+		num_pages = old_pages
+		if full or rendered or removed or not (root / "home" / "index.html").exists():
+			pages = list(_index_pages(page_size))
+			num_pages = max(len(pages), 1)
+			futures = [
+				pool.submit(render_index_page, str(root), number, num_pages, ids)
+				for number, ids in enumerate(pages or [[]], start=1)
+			]
+			for future in futures:
+				future.result()
+			for number in range(num_pages + 1, old_pages + 1):
+				_remove(root, _page_url(number))
+
+	_write_atomic(root / MANIFEST, json.dumps({"version": MANIFEST_VERSION, "posts": current, "pages": num_pages}))
+	return {"rendered": rendered, "removed": len(removed), "unchanged": len(current) - rendered, "pages": num_pages}
@@ -0,0 +1,38 @@
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+
+from .models import Post
+
+
+AUTHOR_STATS_KEY = "author-stats:{user_id}"
+AUTHOR_STATS_TIMEOUT = 60 * 60
+
+
+def compute_author_stats(user_id):
+	"""All dashboard numbers for one author in a single aggregate query.
+
+	Comments are LEFT JOINed, so the post counts use ``distinct`` to stay
+	correct when a post has several comments.
+	"""
+	published = Q(status=Post.PUBLISHED)
+	return Post.objects.filter(author_id=user_id).aggregate(
+		total=Count("id", distinct=True),
+		published=Count("id", filter=published, distinct=True),
+		drafts=Count("id", filter=Q(status=Post.DRAFT), distinct=True),
+		latest_published_at=Max("published_at", filter=published),
+		total_comments=Count("comments", distinct=True),
+		approved_comments=Count("comments", filter=Q(comments__is_approved=True), distinct=True),
+	)
+
+
+def get_author_stats(user_id):
+	key = AUTHOR_STATS_KEY.format(user_id=user_id)
+	stats = cache.get(key)
+	if stats is None:
+		stats = compute_author_stats(user_id)
+		cache.set(key, stats, AUTHOR_STATS_TIMEOUT)
+	return stats
+
+
+def invalidate_author_stats(user_id):
+	cache.delete(AUTHOR_STATS_KEY.format(user_id=user_id))
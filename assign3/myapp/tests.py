@@ -1,3 +1,1312 @@
-from django.test import TestCase
+import asyncio
+import json
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.http import Http404, HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+	archive, facets, live, moderation, page_cache, profiling, ratelimit, search_cache, slow_queries, static_export,
+	timeline, tracing, view_counts,
+)
+from .management.commands import import_users
+from .media import serve_media
+from .models import ArchiveMonth, AuthorFollow, Category, Comment, Post, RelatedPost, SpamToken, Tag, TimelineEntry, UserProfile
+from .related import rank_candidates, refresh_related, refresh_related_and_neighbours
+from .slugs import allocate_slugs
+from .stats import get_author_stats
+from .trash import move_to_trash, purge_post
+from .user_export import stream_archive
+from .views import HomeView
+
+
+class MediaServingTests(TestCase):
+	def setUp(self):
+		self.media_root = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+		self.enterContext(override_settings(
+			MEDIA_ROOT=self.media_root, MEDIA_ACCEL_REDIRECT_PREFIX="", MEDIA_SENDFILE_HEADER="",
+		))
+		with open(f"{self.media_root}/cover.jpg", "wb") as handle:
+			handle.write(bytes(range(100)))
+		author = User.objects.create_user("author", password="pw")
+		self.post = Post.objects.create(
+			title="Cover", content="x", author=author, image="cover.jpg", status=Post.PUBLISHED,
+		)
+
+	def get(self, path="cover.jpg", **headers):
+		request = RequestFactory().get(f"/media/{path}", **headers)
+		request.user = AnonymousUser()
+		return serve_media(request, path)
+
+	def body(self, response):
+		return b"".join(response.streaming_content)
+
+	def test_full_file(self):
+		response = self.get()
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response["Accept-Ranges"], "bytes")
+		self.assertEqual(self.body(response), bytes(range(100)))
+
+	def test_byte_range(self):
+		response = self.get(HTTP_RANGE="bytes=10-19")
+		self.assertEqual(response.status_code, 206)
+		self.assertEqual(response["Content-Range"], "bytes 10-19/100")
+		self.assertEqual(self.body(response), bytes(range(10, 20)))
+
+	def test_suffix_range(self):
+		response = self.get(HTTP_RANGE="bytes=-5")
+		self.assertEqual(response["Content-Range"], "bytes 95-99/100")
+		self.assertEqual(self.body(response), bytes(range(95, 100)))
+
+	def test_unsatisfiable_range(self):
+		response = self.get(HTTP_RANGE="bytes=200-")
+		self.assertEqual(response.status_code, 416)
+		self.assertEqual(response["Content-Range"], "bytes */100")
+
+	def test_stale_if_range_sends_whole_file(self):
+		response = self.get(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"')
+		self.assertEqual(response.status_code, 200)
+
+	def test_etag_revalidation(self):
+		etag = self.get()["ETag"]
+		self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+	def test_accel_redirect_sends_no_body(self):
+		with override_settings(MEDIA_ACCEL_REDIRECT_PREFIX="/protected-media/"):
+			response = self.get()
+		self.assertEqual(response["X-Accel-Redirect"], "/protected-media/cover.jpg")
+		self.assertEqual(response.content, b"")
+
+	def test_draft_images_are_hidden(self):
+		Post.objects.filter(pk=self.post.pk).update(status=Post.DRAFT)
+		with self.assertRaises(Http404):
+			self.get()
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
+class PostPageCacheTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.author = User.objects.create_user("author", password="pw")
+		self.post = Post.objects.create(title="Cached", content="first", author=self.author, status=Post.PUBLISHED)
+		self.url = self.post.get_absolute_url()
+
+	def test_anonymous_readers_share_one_rendering(self):
+		first = self.client.get(self.url)
+		self.assertEqual(first["X-Page-Cache"], "miss")
+		self.assertIn("public", first["Cache-Control"])
+		second = self.client.get(self.url)
+		self.assertEqual(second["X-Page-Cache"], "hit")
+		self.assertEqual(second.content, first.content)
+
+	def test_edit_invalidates_the_cached_page(self):
+		self.client.get(self.url)
+		self.post.content = "second"
+		with self.captureOnCommitCallbacks(execute=True):
+			self.post.save()
+		response = self.client.get(self.url)
+		self.assertEqual(response["X-Page-Cache"], "miss")
+		self.assertContains(response, "second")
+
+	def test_session_cookie_bypasses_the_cache(self):
+		self.client.get(self.url)
+		self.client.cookies["sessionid"] = "abc"
+		response = self.client.get(self.url)
+		self.assertNotIn("X-Page-Cache", response)
+
+	def test_logged_in_readers_bypass_the_cache(self):
+		self.client.get(self.url)
+		self.client.force_login(self.author)
+		response = self.client.get(self.url)
+		self.assertNotIn("X-Page-Cache", response)
+
+	def test_response_setting_a_csrf_cookie_is_not_stored(self):
+		request = RequestFactory().get(self.url)
+		request.user = AnonymousUser()
+		request.META["CSRF_COOKIE_NEEDS_UPDATE"] = True
+		page_cache.store_response(request, self.post.slug, HttpResponse("token"))
+		request.META.pop("CSRF_COOKIE_NEEDS_UPDATE")
+		self.assertIsNone(page_cache.get_cached_response(request, self.post.slug))
+
+
+class RateLimitTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.request = RequestFactory().post("/", REMOTE_ADDR="10.0.0.1")
+		self.request.user = AnonymousUser()
+
+	def consume_at(self, now, rate):
+		with mock.patch("myapp.ratelimit.time.time", return_value=now):
+			return ratelimit.consume(self.request, "test", rate)
+
+	def test_requests_over_the_limit_wait(self):
+		rate = ratelimit.Rate("3/m")
+		self.assertEqual([self.consume_at(6000, rate) for _ in range(3)], [0, 0, 0])
+		self.assertGreater(self.consume_at(6000, rate), 0)
+
+	def test_no_double_burst_at_a_window_edge(self):
+		rate = ratelimit.Rate("10/m")
+		for _ in range(10):
+			self.assertEqual(self.consume_at(6059, rate), 0)
+		# A fixed window would hand out another ten here
+		retry_after = self.consume_at(6061, rate)
+		self.assertGreater(retry_after, 0)
+		self.assertEqual(self.consume_at(6061 + retry_after, rate), 0)
+
+	def test_comment_view_answers_429(self):
+		author = User.objects.create_user("author", password="pw")
+		post = Post.objects.create(title="Open", content="x", author=author, status=Post.PUBLISHED)
+		self.client.force_login(author)
+		url = reverse("comment-create", args=[post.slug])
+		for _ in range(10):
+			self.assertEqual(self.client.post(url, {"content": "hi"}).status_code, 302)
+		response = self.client.post(url, {"content": "hi"})
+		self.assertEqual(response.status_code, 429)
+		self.assertIn("Retry-After", response)
+
+	def test_budget_sheds_requests_over_the_limit(self):
+		first, second = ratelimit.ConcurrencyBudget("signup", 1), ratelimit.ConcurrencyBudget("signup", 1)
+		self.assertTrue(first.acquire())
+		self.assertFalse(second.acquire())
+		first.release()
+		self.assertTrue(second.acquire())
+
+	def test_budget_never_goes_negative_after_expiry(self):
+		budgets = [ratelimit.ConcurrencyBudget("signup", 2) for _ in range(2)]
+		for budget in budgets:
+			self.assertTrue(budget.acquire())
+		cache.delete(budgets[0].key)
+		for budget in budgets:
+			budget.release()
+		extra = [ratelimit.ConcurrencyBudget("signup", 2) for _ in range(3)]
+		self.assertEqual([budget.acquire() for budget in extra], [True, True, False])
+
+
+class PostAPITests(TestCase):
+	def setUp(self):
+		author = User.objects.create_user("author", password="pw")
+		at = datetime(2024, 5, 1, tzinfo=dt_timezone.utc)
+		# Pairs share a timestamp so the cursor has to break ties on id
+		self.posts = [
+			Post.objects.create(
+				title=f"Post {n}", content="x", author=author, status=Post.PUBLISHED,
+				published_at=at + timedelta(hours=n // 2),
+			)
+			for n in range(5)
+		]
+		Post.objects.create(title="Draft", content="x", author=author)
+
+	def test_cursor_walks_every_post_once(self):
+		seen = []
+		url = reverse("api-post-list") + "?limit=2&fields=id"
+		while url:
+			data = self.client.get(url).json()
+			seen += [row["id"] for row in data["results"]]
+			url = data["next"]
+		expected = Post.objects.published().order_by("-published_at", "-id").values_list("id", flat=True)
+		self.assertEqual(seen, list(expected))
+
+	def test_fields_are_selectable(self):
+		data = self.client.get(reverse("api-post-list"), {"fields": "slug,url", "limit": 1}).json()
+		self.assertEqual(data["results"], [{"slug": "post-4", "url": "/post/post-4/"}])
+
+	def test_bad_parameters_are_400(self):
+		response = self.client.get(reverse("api-post-list"), {"fields": "password"})
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(response["Cache-Control"], "no-store")
+		self.assertNotIn("ETag", response)
+		self.assertEqual(self.client.get(reverse("api-post-list"), {"cursor": "!!"}).status_code, 400)
+
+	def test_only_success_is_publicly_cacheable(self):
+		self.assertEqual(self.client.get(reverse("api-post-detail", args=["post-0"]))["Cache-Control"], "public, max-age=60")
+		self.assertEqual(self.client.get(reverse("api-post-detail", args=["missing"]))["Cache-Control"], "no-store")
+
+	def test_image_is_a_url(self):
+		Post.objects.filter(slug="post-0").update(image="posts/cover.jpg")
+		url = reverse("api-post-detail", args=["post-0"])
+		self.assertEqual(self.client.get(url, {"fields": "image"}).json(), {"image": "/media/posts/cover.jpg"})
+		url = reverse("api-post-detail", args=["post-1"])
+		self.assertEqual(self.client.get(url, {"fields": "image"}).json(), {"image": None})
+
+	def test_etag_revalidation(self):
+		url = reverse("api-post-detail", args=["post-0"])
+		etag = self.client.get(url)["ETag"]
+		self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+		Post.objects.filter(slug="post-0").update(title="Renamed")
+		self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+	def test_drafts_are_not_served(self):
+		self.assertEqual(self.client.get(reverse("api-post-detail", args=["draft"])).status_code, 404)
+
+
+class AuthorStatsTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.author = User.objects.create_user("author", password="pw")
+		self.post = Post.objects.create(title="One", content="x", author=self.author, status=Post.PUBLISHED)
+		Post.objects.create(title="Two", content="x", author=self.author)
+		for approved in (True, True, False):
+			Comment.objects.create(post=self.post, user=self.author, content="c", is_approved=approved)
+
+	def test_counts_in_one_query(self):
+		with self.assertNumQueries(1):
+			stats = get_author_stats(self.author.pk)
+		self.assertEqual(
+			{k: stats[k] for k in ("total", "published", "drafts", "total_comments", "approved_comments")},
+			{"total": 2, "published": 1, "drafts": 1, "total_comments": 3, "approved_comments": 2},
+		)
+		with self.assertNumQueries(0):
+			get_author_stats(self.author.pk)
+
+	def test_new_post_refreshes_the_cached_stats(self):
+		get_author_stats(self.author.pk)
+		with self.captureOnCommitCallbacks(execute=True):
+			Post.objects.create(title="Three", content="x", author=self.author)
+		self.assertEqual(get_author_stats(self.author.pk)["drafts"], 2)
+
+
+class RelatedPostTests(TestCase):
+	def test_rare_tags_outweigh_common_ones(self):
+		postings = {1: [10, 11], 2: [11, 12, 13, 14, 15, 16, 17, 18]}
+		doc_freq = {1: 2, 2: 8}
+		ranked = rank_candidates([1, 2], None, postings, doc_freq, 20, {}, exclude_id=99)
+		self.assertEqual(ranked[0][0], 11)
+		self.assertEqual(ranked[1][0], 10)
+
+	def test_same_category_breaks_even_scores(self):
+		postings = {1: [10, 11]}
+		meta = {10: (None, None), 11: (7, None)}
+		ranked = rank_candidates([1], 7, postings, {1: 2}, 20, meta, exclude_id=99)
+		self.assertEqual([pk for pk, _ in ranked], [11, 10])
+
+	def test_refresh_stores_ranked_published_posts(self):
+		author = User.objects.create_user("author", password="pw")
+		python, web = Tag.objects.create(name="Python"), Tag.objects.create(name="Web")
+		news = Category.objects.create(name="News")
+
+		def post(title, tags, status=Post.PUBLISHED, category=None):
+			created = Post.objects.create(title=title, content="x", author=author, status=status, category=category)
+			created.tags.set(tags)
+			return created
+
+		source = post("Source", [python, web], category=news)
+		both = post("Both", [python, web])
+		one = post("One", [web], category=news)
+		post("Draft", [python, web], status=Post.DRAFT)
+		post("Unrelated", [])
+
+		self.assertEqual(refresh_related(source.pk), [both.pk, one.pk])
+		self.assertEqual(
+			list(RelatedPost.objects.filter(post=source).order_by("rank").values_list("related_id", flat=True)),
+			[both.pk, one.pk],
+		)
+
+		# One count of published posts for the post and all its neighbours
+		with mock.patch("myapp.related.published_total", return_value=4) as published_total:
+			self.assertEqual(refresh_related_and_neighbours(source.pk), {source.pk, both.pk, one.pk})
+		published_total.assert_called_once_with()
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
+class ViewCountTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		author = User.objects.create_user("author", password="pw")
+		self.post = Post.objects.create(title="Viewed", content="x", author=author, status=Post.PUBLISHED)
+
+	def view_count(self):
+		return Post.objects.get(pk=self.post.pk).view_count
+
+	def test_views_are_applied_once(self):
+		for _ in range(3):
+			view_counts.record_view(self.post.slug)
+		self.assertEqual(self.view_count(), 0)
+		self.assertEqual(view_counts.flush(), 3)
+		self.assertEqual(view_counts.flush(), 0)
+		self.assertEqual(self.view_count(), 3)
+
+	def test_views_after_a_flush_are_listed_again(self):
+		view_counts.record_view(self.post.slug)
+		view_counts.flush()
+		view_counts.record_view(self.post.slug)
+		view_counts.record_view(self.post.slug)
+		self.assertEqual(view_counts.flush(), 2)
+		self.assertEqual(self.view_count(), 3)
+
+	def test_slot_written_after_a_flush_is_not_lost(self):
+		# A writer has taken its slot but not yet stored the slug in it
+		view_counts._incr(view_counts.COUNT_KEY.format(slug=self.post.slug))
+		cache.add(view_counts.MARKED_KEY.format(slug=self.post.slug), 1)
+		slot = view_counts._incr(view_counts.DIRTY_SEQ_KEY)
+		self.assertEqual(view_counts.flush(), 0)
+		cache.set(view_counts.DIRTY_KEY.format(slot=slot), self.post.slug)
+		self.assertEqual(view_counts.flush(), 1)
+		view_counts.record_view(self.post.slug)
+		self.assertEqual(view_counts.flush(), 1)
+		self.assertEqual(self.view_count(), 2)
+
+	def test_abandoned_slots_are_dropped(self):
+		view_counts._incr(view_counts.DIRTY_SEQ_KEY)
+		view_counts.flush()
+		with mock.patch("myapp.view_counts.time.time", return_value=time.time() + view_counts.GAP_TIMEOUT + 1):
+			view_counts.flush()
+		self.assertEqual(cache.get(view_counts.GAPS_KEY), {})
+
+	def test_most_viewed_orders_by_count(self):
+		other = Post.objects.create(title="Popular", content="x", author=self.post.author, status=Post.PUBLISHED)
+		view_counts.record_view(self.post.slug)
+		for _ in range(2):
+			view_counts.record_view(other.slug)
+		view_counts.flush()
+		self.assertEqual(list(view_counts.most_viewed()), [other, self.post])
+
+
+class ArchiveTests(TestCase):
+	def setUp(self):
+		self.author = User.objects.create_user("author", password="pw")
+		self.client.force_login(self.author)
+
+	def publish(self, title, published_at):
+		with self.captureOnCommitCallbacks(execute=True):
+			return Post.objects.create(
+				title=title, content="x", author=self.author, status=Post.PUBLISHED, published_at=published_at,
+			)
+
+	def test_month_page_lists_that_month_only(self):
+		self.publish("May", datetime(2024, 5, 31, 23, 59, tzinfo=dt_timezone.utc))
+		self.publish("June", datetime(2024, 6, 1, tzinfo=dt_timezone.utc))
+		response = self.client.get(reverse("archive-month", args=[2024, 5]))
+		self.assertEqual([post.title for post in response.context["posts"]], ["May"])
+
+	def test_buckets_follow_publication(self):
+		post = self.publish("May", datetime(2024, 5, 2, tzinfo=dt_timezone.utc))
+		self.assertEqual([(m.year, m.month, m.post_count) for m in archive.sidebar_months()], [(2024, 5, 1)])
+		post.status = Post.DRAFT
+		with self.captureOnCommitCallbacks(execute=True):
+			post.save()
+		self.assertEqual(list(archive.sidebar_months()), [])
+
+	def test_drifted_counts_do_not_go_negative(self):
+		post = self.publish("May", datetime(2024, 5, 2, tzinfo=dt_timezone.utc))
+		ArchiveMonth.objects.filter(year=2024, month=5).update(post_count=0)
+		post.status = Post.DRAFT
+		with self.captureOnCommitCallbacks(execute=True):
+			post.save()
+		self.assertEqual(ArchiveMonth.objects.get(year=2024, month=5).post_count, 0)
+
+	def test_out_of_range_months_are_404(self):
+		for year, month in ((2024, 13), (2024, 0), (0, 1), (9999, 12)):
+			response = self.client.get(reverse("archive-month", args=[year, month]))
+			self.assertEqual(response.status_code, 404, (year, month))
+		self.assertEqual(self.client.get(reverse("archive-month", args=[archive.MAX_YEAR, 12])).status_code, 200)
+
+
+class SitemapTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		author = User.objects.create_user("author", password="pw")
+		self.post = Post.objects.create(title="Mapped", content="x", author=author, status=Post.PUBLISHED)
+		Post.objects.create(title="Hidden", content="x", author=author)
+
+	def body(self, response):
+		return b"".join(response.streaming_content).decode()
+
+	def test_index_lists_the_shard(self):
+		body = self.body(self.client.get(reverse("sitemap-index")))
+		self.assertIn("/sitemap-posts-0.xml</loc>", body)
+
+	def test_shard_lists_published_posts(self):
+		response = self.client.get(reverse("sitemap-posts", args=[0]))
+		body = self.body(response)
+		self.assertIn("/post/mapped/</loc>", body)
+		self.assertNotIn("hidden", body)
+		self.assertEqual(
+			self.client.get(reverse("sitemap-posts", args=[0]), HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code,
+			304,
+		)
+
+	def test_empty_shards_are_404(self):
+		self.assertEqual(self.client.get(reverse("sitemap-posts", args=[5])).status_code, 404)
+
+
+class PurgeUnverifiedTests(TestCase):
+	def signup(self, username, days_ago, verified=False, **fields):
+		user = User.objects.create_user(username, password="pw", is_active=verified, **fields)
+		UserProfile.objects.create(
+			user=user, email_verified=verified,
+			verification_sent_at=timezone.now() - timedelta(days=days_ago),
+		)
+		return user
+
+	def test_only_stale_unverified_accounts_go(self):
+		self.signup("stale", 10)
+		self.signup("recent", 1)
+		self.signup("verified", 10, verified=True)
+		self.signup("staff", 10, is_staff=True)
+		call_command("purge_unverified", "--older-than", "7d", "--batch-size", "1", stdout=StringIO())
+		self.assertEqual(
+			set(User.objects.values_list("username", flat=True)), {"recent", "verified", "staff"},
+		)
+
+	def test_dry_run_deletes_nothing(self):
+		self.signup("stale", 10)
+		out = StringIO()
+		call_command("purge_unverified", "--dry-run", stdout=out)
+		self.assertIn("Would delete 1", out.getvalue())
+		self.assertTrue(User.objects.filter(username="stale").exists())
+
+
+class ModerationTests(TestCase):
+	def setUp(self):
+		self.author = User.objects.create_user("author", password="pw")
+		self.post = Post.objects.create(title="Open", content="x", author=self.author, status=Post.PUBLISHED)
+
+	def comment(self, content, status=Comment.PENDING):
+		return Comment.objects.create(
+			post=self.post, user=self.author, content=content,
+			moderation_status=status, is_approved=status == Comment.APPROVED,
+		)
+
+	def counts(self, token):
+		return SpamToken.objects.filter(token=token).values_list("spam_count", "ham_count").first()
+
+	def test_review_counts_only_changed_comments(self):
+		comments = [self.comment("nice post"), self.comment("thanks", Comment.APPROVED)]
+		self.assertEqual(moderation.review([c.pk for c in comments], spam=False), 1)
+		self.assertEqual(moderation.review([c.pk for c in comments], spam=False), 0)
+		self.assertEqual(self.counts("nice"), (0, 1))
+
+	def test_reclassifying_moves_the_tokens(self):
+		comment = self.comment("cheap pills")
+		moderation.review([comment.pk], spam=False)
+		self.assertEqual(self.counts("pills"), (0, 1))
+		moderation.review([comment.pk], spam=True)
+		self.assertEqual(self.counts("pills"), (1, 0))
+		self.assertEqual(self.counts(SpamToken.DOCUMENTS), (1, 0))
+
+	def test_untrain_stops_at_zero(self):
+		comment = self.comment("never trained", Comment.APPROVED)
+		moderation.review([comment.pk], spam=True)
+		self.assertEqual(self.counts("trained"), (1, 0))
+
+	def test_worker_flags_spam_and_approves_the_rest(self):
+		moderation.train(["buy cheap pills http://spam.example"] * 5, spam=True)
+		moderation.train(["great write-up, thanks for sharing"] * 5, spam=False)
+		spam, ham = self.comment("cheap pills http://spam.example"), self.comment("thanks for sharing")
+		self.assertEqual(moderation.moderate_batch()[1:], (1, 1))
+		spam.refresh_from_db()
+		ham.refresh_from_db()
+		self.assertEqual((spam.moderation_status, spam.is_approved), (Comment.FLAGGED, False))
+		self.assertEqual((ham.moderation_status, ham.is_approved), (Comment.APPROVED, True))
+
+
+class LiveCommentTests(TestCase):
+	def setUp(self):
+		self.author = User.objects.create_user("author", password="pw")
+		self.post = Post.objects.create(title="Live", content="x", author=self.author, status=Post.PUBLISHED)
+		self.now = timezone.now()
+
+	def approve(self, content, at):
+		comment = Comment.objects.create(post=self.post, user=self.author, content=content)
+		Comment.objects.filter(pk=comment.pk).update(is_approved=True, updated_at=at)
+		return comment.pk
+
+	async def replayed(self, since):
+		"""Ids of the comments the stream replays to a client reconnecting at ``since``."""
+		response = await AsyncClient().get(
+			reverse("comment-stream", args=[self.post.slug]), headers={"Last-Event-ID": live.encode_mark(since)},
+		)
+		chunks = response.streaming_content
+		ids = []
+		# The replay is over once the stream falls back to keepalives
+		with mock.patch.object(live, "KEEPALIVE_SECONDS", 0.01):
+			try:
+				while not (chunk := await asyncio.wait_for(anext(chunks), 10)).startswith(b":"):
+					for line in chunk.decode().splitlines():
+						if line.startswith("data: "):
+							ids.append(json.loads(line.removeprefix("data: "))["id"])
+			finally:
+				await chunks.aclose()
+		return ids
+
+	@override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
+	def test_pages_only_open_a_configured_stream(self):
+		url = reverse("post-detail", args=[self.post.slug])
+		cache.clear()
+		self.assertNotContains(self.client.get(url), "EventSource")
+		cache.clear()
+		with override_settings(COMMENT_STREAM_URL="https://live.example.com/"):
+			response = self.client.get(url)
+		self.assertContains(response, 'data-stream="https://live.example.com/post/live/comments/stream/"')
+		self.assertContains(response, "EventSource")
+
+	def test_wsgi_requests_are_refused(self):
+		response = self.client.get(reverse("comment-stream", args=[self.post.slug]))
+		self.assertEqual(response.status_code, 503)
+
+	def test_marks_round_trip(self):
+		self.assertEqual(live.decode_mark(live.encode_mark(self.now)), self.now)
+		self.assertIsNone(live.decode_mark("soon"))
+		self.assertIsNone(live.decode_mark(str(-10 ** 18)))
+
+	async def test_reconnect_replays_older_ids_approved_later(self):
+		# Approved out of id order: the client has seen the newer comment only
+		older = await Comment.objects.acreate(post=self.post, user=self.author, content="older")
+		await sync_to_async(self.approve)("seen", self.now - live.OVERLAP * 2)
+		await Comment.objects.filter(pk=older.pk).aupdate(is_approved=True, updated_at=self.now)
+		self.assertEqual(await self.replayed(self.now - live.OVERLAP), [older.pk])
+
+	async def test_reconnect_replays_late_commits_within_the_overlap(self):
+		late = await sync_to_async(self.approve)("late", self.now - live.OVERLAP / 2)
+		await sync_to_async(self.approve)("old", self.now - live.OVERLAP * 2)
+		self.assertEqual(await self.replayed(self.now), [late])
+
+
+class TrashTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.author = User.objects.create_user("author", password="pw", is_staff=True)
+		self.post = Post.objects.create(title="Doomed", content="x", author=self.author, status=Post.PUBLISHED)
+		self.post.tags.add(Tag.objects.create(name="Python"))
+		for _ in range(3):
+			Comment.objects.create(post=self.post, user=self.author, content="c", is_approved=True)
+
+	def test_delete_view_hides_the_post_everywhere(self):
+		self.client.force_login(self.author)
+		with self.captureOnCommitCallbacks(execute=True):
+			response = self.client.post(reverse("post-delete", args=[self.post.slug]))
+		self.assertRedirects(response, reverse("dashboard"), fetch_redirect_response=False)
+		self.assertEqual(self.client.get(self.post.get_absolute_url()).status_code, 404)
+		self.assertEqual(self.client.get(reverse("api-post-detail", args=[self.post.slug])).status_code, 404)
+		self.assertNotContains(self.client.get(reverse("home")), "Doomed")
+		self.assertFalse(Post.objects.filter(pk=self.post.pk).exists())
+		# Nothing is removed until the purge
+		self.assertEqual(Comment.objects.filter(post_id=self.post.pk).count(), 3)
+
+	def test_trashing_twice_is_a_no_op(self):
+		self.assertTrue(move_to_trash(self.post))
+		self.assertFalse(move_to_trash(self.post))
+
+	def test_purge_removes_rows_in_batches(self):
+		move_to_trash(self.post)
+		self.assertEqual(purge_post(self.post.pk, batch_size=2), 4)
+		self.assertFalse(Post.all_objects.filter(pk=self.post.pk).exists())
+		self.assertFalse(Comment.objects.filter(post_id=self.post.pk).exists())
+		self.assertTrue(Tag.objects.filter(name="Python").exists())
+
+	def test_purge_leaves_live_posts_alone(self):
+		purge_post(self.post.pk)
+		self.assertTrue(Post.objects.filter(pk=self.post.pk).exists())
+
+	def test_command_purges_only_old_deletions(self):
+		move_to_trash(self.post)
+		call_command("purge_deleted_posts", "--older-than", "1h", stdout=StringIO())
+		self.assertTrue(Post.all_objects.filter(pk=self.post.pk).exists())
+		Post.all_objects.filter(pk=self.post.pk).update(deleted_at=timezone.now() - timedelta(hours=2))
+		call_command("purge_deleted_posts", "--older-than", "1h", stdout=StringIO())
+		self.assertFalse(Post.all_objects.filter(pk=self.post.pk).exists())
+
+
+class AdminChangelistTests(TestCase):
+	def setUp(self):
+		self.admin = User.objects.create_superuser("admin", password="pw")
+		self.client.force_login(self.admin)
+		for month in (4, 5):
+			with self.captureOnCommitCallbacks(execute=True):
+				Post.objects.create(
+					title=f"Month {month}", content="x", author=self.admin, status=Post.PUBLISHED,
+					published_at=datetime(2024, month, 10, tzinfo=dt_timezone.utc),
+				)
+
+	def changelist(self, **params):
+		return self.client.get(reverse("admin:myapp_post_changelist"), params)
+
+	def test_month_filter_offers_buckets_and_filters(self):
+		response = self.changelist(published="2024-05")
+		self.assertEqual([post.title for post in response.context["cl"].result_list], ["Month 5"])
+		self.assertContains(response, "2024-04 (1)")
+
+	def test_bad_months_are_ignored(self):
+		for value in ("9999-12", "2024-13", "soon"):
+			self.assertEqual(len(self.changelist(published=value).context["cl"].result_list), 2, value)
+
+	def test_author_filter(self):
+		other = User.objects.create_user("other", password="pw")
+		Post.objects.create(title="Other", content="x", author=other)
+		response = self.changelist(author__id__exact=other.pk)
+		self.assertEqual([post.title for post in response.context["cl"].result_list], ["Other"])
+
+	def test_moderation_queue_reviews_comments(self):
+		post = Post.objects.get(title="Month 5")
+		comment = Comment.objects.create(post=post, user=self.admin, content="hello", moderation_status=Comment.PENDING)
+		url = reverse("admin:myapp_comment_moderation")
+		self.assertContains(self.client.get(url), "hello")
+		self.client.post(url, {"comment": [comment.pk], "verdict": "approve"})
+		comment.refresh_from_db()
+		self.assertEqual(comment.moderation_status, Comment.APPROVED)
+
+
+class ProfilingTests(TestCase):
+	def setUp(self):
+		directory = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+		self.enterContext(override_settings(
+			PROFILING_ENABLED=True, PROFILE_DIR=Path(directory), PROFILE_SAMPLE_RATE=0, PROFILE_RING_SIZE=2,
+		))
+		self.staff = User.objects.create_user("staff", password="pw", is_staff=True)
+		self.middleware = profiling.ProfilingMiddleware(lambda request: HttpResponse("ok"))
+
+	def run_request(self, token=None):
+		params = {profiling.TOKEN_PARAM: token} if token else {}
+		return self.middleware(RequestFactory().get("/home/", params))
+
+	def test_signed_token_captures_the_request(self):
+		response = self.run_request(profiling.make_token(self.staff))
+		capture_id = response["X-Profile-Id"]
+		self.assertEqual([c["id"] for c in profiling.list_captures()], [capture_id])
+		self.client.force_login(self.staff)
+		self.assertContains(self.client.get(reverse("profile-detail", args=[capture_id])), "/home/")
+		download = self.client.get(reverse("profile-download", args=[capture_id]))
+		self.assertEqual(download["Content-Disposition"], f'attachment; filename="{capture_id}.prof"')
+
+	def test_requests_without_a_valid_token_run_normally(self):
+		self.assertNotIn("X-Profile-Id", self.run_request())
+		self.assertNotIn("X-Profile-Id", self.run_request("forged"))
+		self.assertEqual(profiling.list_captures(), [])
+
+	def test_only_the_newest_captures_are_kept(self):
+		token = profiling.make_token(self.staff)
+		ids = [self.run_request(token)["X-Profile-Id"] for _ in range(3)]
+		self.assertEqual([c["id"] for c in profiling.list_captures()], ids[:0:-1])
+
+	def test_pages_are_staff_only(self):
+		self.client.force_login(User.objects.create_user("reader", password="pw"))
+		self.assertEqual(self.client.get(reverse("profiles")).status_code, 403)
+
+
+class TracingTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		tracing.install()
+		self.enterContext(override_settings(TRACING_ENABLED=True, TRACE_SAMPLE_RATE=0, TRACE_FORCE_SECRET="s3cret"))
+		self.exporter = self.enterContext(mock.patch.object(tracing, "_exporter", mock.Mock()))
+
+	def exported_spans(self):
+		return [
+			span
+			for call in self.exporter.info.call_args_list
+			for span in json.loads(call.args[0])["resourceSpans"][0]["scopeSpans"][0]["spans"]
+		]
+
+	def run_request(self, **headers):
+		middleware = tracing.TracingMiddleware(lambda request: HttpResponse("ok"))
+		return middleware(RequestFactory().get("/home/", headers=headers))
+
+	def test_force_header_needs_the_shared_secret(self):
+		self.assertNotIn("X-Trace-Id", self.run_request(x_force_trace="1"))
+		self.assertIn("X-Trace-Id", self.run_request(x_force_trace="s3cret"))
+		with override_settings(TRACE_FORCE_SECRET=""):
+			self.assertNotIn("X-Trace-Id", self.run_request(x_force_trace=""))
+		self.assertEqual(len(self.exporter.info.call_args_list), 1)
+
+	def test_signup_mail_thread_joins_the_request_trace(self):
+		response = self.client.post(reverse("signup"), {
+			"username": "newbie", "email": "newbie@example.com",
+			"password1": "a-long-passphrase-1", "password2": "a-long-passphrase-1",
+		}, headers={"x-force-trace": "s3cret"})
+		self.assertEqual(response.status_code, 302)
+		deadline = time.monotonic() + 5
+		while not any(s["name"] == "mail.send" for s in self.exported_spans()) and time.monotonic() < deadline:
+			time.sleep(0.01)
+		spans = self.exported_spans()
+		mail = next(s for s in spans if s["name"] == "mail.send")
+		root = next(s for s in spans if "parentSpanId" not in s)
+		self.assertEqual(mail["traceId"], response["X-Trace-Id"])
+		self.assertEqual(mail["parentSpanId"], root["spanId"])
+		self.assertEqual(len([s for s in spans if s["name"] == "mail.send"]), 1)
+
+
+class SlowQueryLogTests(TestCase):
+	def setUp(self):
+		self.written = []
+		self.enterContext(mock.patch.object(slow_queries, "_write", self.written.append))
+		self.enterContext(mock.patch.object(slow_queries, "_explained", set()))
+
+	def test_normalize_collapses_literals_and_in_lists(self):
+		sql = "SELECT * FROM t WHERE a = 'it''s' AND b IN (1, 2, 3) AND c = %s AND d > 2.5"
+		self.assertEqual(slow_queries.normalize(sql), "SELECT * FROM t WHERE a = ? AND b IN (...) AND c = ? AND d > ?")
+		self.assertEqual(
+			slow_queries.fingerprint(slow_queries.normalize("SELECT 1 FROM t WHERE id IN (%s, %s)")),
+			slow_queries.fingerprint(slow_queries.normalize("SELECT 1 FROM t WHERE id IN (%s)")),
+		)
+
+	def test_slow_statement_records_call_site_view_and_queues_explain(self):
+		token = slow_queries._view.set("myapp.views.PostListView")
+		self.addCleanup(slow_queries._view.reset, token)
+		with mock.patch.object(slow_queries, "_queue_explain") as queue_explain:
+			with connection.execute_wrapper(slow_queries.SlowQueryLogger("default", 0)):
+				list(Post.objects.filter(pk__in=[1, 2, 3]))
+		entry, = self.written
+		self.assertEqual(entry["type"], "query")
+		self.assertIn("IN (...)", entry["sql"])
+		self.assertEqual(entry["view"], "myapp.views.PostListView")
+		self.assertTrue(entry["call_site"].startswith("myapp/tests.py:"))
+		queue_explain.assert_called_once()
+
+	def test_fast_statements_are_not_logged(self):
+		with connection.execute_wrapper(slow_queries.SlowQueryLogger("default", 60000)):
+			list(Post.objects.all())
+		self.assertEqual(self.written, [])
+
+	def test_each_fingerprint_is_explained_once(self):
+		slow_queries._queue_explain("default", "abc", "SELECT 1", ())
+		slow_queries._queue_explain("default", "abc", "SELECT 1", ())
+		deadline = time.monotonic() + 5
+		while not self.written and time.monotonic() < deadline:
+			time.sleep(0.01)
+		time.sleep(0.05)
+		self.assertEqual([(e["type"], e["fingerprint"]) for e in self.written], [("plan", "abc")])
+
+	def test_command_ranks_fingerprints(self):
+		directory = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+		path = Path(directory) / "slow.jsonl"
+		now = time.time()
+		entries = [
+			{"type": "query", "ts": now, "fingerprint": "many", "duration_ms": 250, "sql": "SELECT a", "view": "v", "call_site": "c"},
+			{"type": "query", "ts": now, "fingerprint": "many", "duration_ms": 300, "sql": "SELECT a", "view": "v", "call_site": "c"},
+			{"type": "query", "ts": now, "fingerprint": "once", "duration_ms": 900, "sql": "SELECT b"},
+			{"type": "query", "ts": now - 7200, "fingerprint": "old", "duration_ms": 5000, "sql": "SELECT c"},
+			{"type": "plan", "ts": now, "fingerprint": "once", "plan": "SCAN t"},
+		]
+		path.write_text("\n".join(json.dumps(e) for e in entries) + "\nnot json\n")
+		out = StringIO()
+		with override_settings(SLOW_QUERY_LOG=path, SLOW_QUERY_LOG_BACKUPS=0):
+			call_command("slow_queries", "--since", "1h", "--sort", "count", "--plans", stdout=out)
+		lines = out.getvalue().splitlines()
+		ranked = [line.split()[0] for line in lines if line.startswith(("many", "once", "old"))]
+		self.assertEqual(ranked, ["many", "once"])
+		self.assertIn("2x  v  c", out.getvalue())
+		self.assertIn("    SCAN t", lines)
+
+
+class SearchCacheTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		search_cache.results.clear()
+		self.author = User.objects.create_user("writer", password="pw")
+		self.client.force_login(self.author)
+		for n in range(12):
+			Post.objects.create(title=f"Django tip {n}", content="x", author=self.author, status=Post.PUBLISHED)
+		Post.objects.create(title="Gardening", content="x", author=self.author, status=Post.PUBLISHED)
+
+	def search(self, q, **params):
+		return self.client.get(reverse("home"), {"q": q, **params})
+
+	def test_normalize_folds_case_and_whitespace(self):
+		self.assertEqual(search_cache.normalize("  Django   TIPS ", " News", "Web "), ("django tips", "news", "web"))
+
+	def test_lru_drops_the_least_recently_used_entry(self):
+		lru = search_cache.LRUCache(2)
+		lru.set("a", 1)
+		lru.set("b", 2)
+		lru.get("a")
+		lru.set("c", 3)
+		self.assertEqual((lru.get("a"), lru.get("b"), lru.get("c")), (1, None, 3))
+
+	def test_cached_ids_compute_once_per_generation(self):
+		compute = mock.Mock(return_value=[3, 2, 1])
+		self.assertEqual(search_cache.cached_ids(("q", "", ""), compute), (3, 2, 1))
+		search_cache.cached_ids(("q", "", ""), compute)
+		self.assertEqual(compute.call_count, 1)
+		search_cache.bump_generation()
+		search_cache.cached_ids(("q", "", ""), compute)
+		self.assertEqual(compute.call_count, 2)
+
+	@override_settings(SEARCH_CACHE_MAX_IDS=2)
+	def test_broad_queries_are_not_cached(self):
+		self.assertIsNone(search_cache.cached_ids(("q", "", ""), lambda: [1, 2, 3]))
+		response = self.search("django")
+		self.assertEqual(response.context["paginator"].count, 12)
+		self.assertEqual(len(response.context["posts"]), 10)
+
+	def test_cached_pages_hydrate_posts_in_order(self):
+		first = self.search("DJANGO")
+		self.assertEqual(first.context["paginator"].count, 12)
+		with mock.patch.object(HomeView, "filtered_posts", wraps=HomeView.filtered_posts, autospec=True) as filtered:
+			second = self.search("  django ", page=2)
+			# Only the facets touch the queryset; the id list came from the cache
+			self.assertEqual(filtered.call_count, 1)
+		self.assertEqual([p.title for p in second.context["posts"]], ["Django tip 1", "Django tip 0"])
+
+	def test_post_writes_retire_cached_results(self):
+		self.assertEqual(self.search("gardening").context["paginator"].count, 1)
+		with self.captureOnCommitCallbacks(execute=True):
+			Post.objects.create(title="Gardening again", content="x", author=self.author, status=Post.PUBLISHED)
+		self.assertEqual(self.search("gardening").context["paginator"].count, 2)
+
+
+class FacetTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		search_cache.results.clear()
+		self.author = User.objects.create_user("writer", password="pw")
+		self.client.force_login(self.author)
+		self.news, self.howto, empty = (Category.objects.create(name=n) for n in ("News", "Howto", "Empty"))
+		self.python, self.web = Tag.objects.create(name="Python"), Tag.objects.create(name="Web")
+
+		def post(title, category, tags, status=Post.PUBLISHED):
+			p = Post.objects.create(title=title, content="x", author=self.author, status=status, category=category)
+			p.tags.set(tags)
+
+		post("Django news", self.news, [self.python, self.web])
+		post("Django release", self.news, [self.python])
+		post("Django howto", self.howto, [self.web])
+		post("Django draft", self.howto, [self.python], status=Post.DRAFT)
+		post("Cooking", empty, [])
+
+	def facets_for(self, **params):
+		response = self.client.get(reverse("home"), params)
+		return response.context["category_facets"], response.context["tag_facets"]
+
+	def test_counts_cover_only_matching_published_posts(self):
+		categories, tags = self.facets_for(q="django")
+		self.assertEqual(categories, (("news", "News", 2), ("howto", "Howto", 1)))
+		self.assertEqual(tags, (("python", "Python", 2), ("web", "Web", 2)))
+
+	def test_selected_filter_stays_listed_with_zero(self):
+		categories, tags = self.facets_for(q="django", category="news", tag="web")
+		self.assertEqual(categories, (("news", "News", 1),))
+		categories, _ = self.facets_for(q="cooking", category="news")
+		self.assertEqual(categories, (("news", "News", 0),))
+
+	def test_counts_are_cached_until_the_next_write(self):
+		posts = Post.objects.published()
+		with self.assertNumQueries(2):
+			facets.facet_counts(("", "", ""), posts)
+		with self.assertNumQueries(0):
+			facets.facet_counts(("", "", ""), posts)
+		with self.captureOnCommitCallbacks(execute=True):
+			Post.objects.get(title="Cooking").tags.add(self.web)
+		self.assertIn(("web", "Web", 3), facets.facet_counts(("", "", ""), posts)[1])
+
+	def test_form_offers_counts(self):
+		response = self.client.get(reverse("home"), {"q": "django"})
+		self.assertContains(response, "News (2)")
+		self.assertNotContains(response, "Empty (")
+
+
+class FeedTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.reader = User.objects.create_user("reader", password="pw")
+		self.author = User.objects.create_user("author", password="pw")
+		self.other = User.objects.create_user("other", password="pw")
+		self.python = Tag.objects.create(name="Python")
+		self.start = timezone.now() - timedelta(days=1)
+		self.count = 0
+		self.client.force_login(self.reader)
+
+	def publish(self, author, tags=()):
+		self.count += 1
+		post = Post.objects.create(
+			title=f"Post {self.count}", content="x", author=author, status=Post.PUBLISHED,
+			published_at=self.start + timedelta(minutes=self.count),
+		)
+		post.tags.set(tags)
+		return post
+
+	def feed_titles(self, **params):
+		return [p.title for p in self.client.get(reverse("feed"), params).context["posts"]]
+
+	def test_following_backfills_and_new_posts_fan_out(self):
+		self.publish(self.author)
+		self.client.post(reverse("follow-author", args=["author"]), {"action": "follow"})
+		self.assertEqual(self.feed_titles(), ["Post 1"])
+		post = self.publish(self.author)
+		self.assertEqual(Post.objects.get(pk=post.pk).fanout_status, Post.FANOUT_PENDING)
+		call_command("fanout_timelines", stdout=StringIO())
+		self.assertEqual(self.feed_titles(), ["Post 2", "Post 1"])
+		self.assertEqual(Post.objects.get(pk=post.pk).fanout_status, Post.FANOUT_DONE)
+
+	@override_settings(TIMELINE_FANOUT_LIMIT=0)
+	def test_posts_over_the_limit_merge_at_read_time(self):
+		timeline.follow_author(self.reader, self.author)
+		post = self.publish(self.author)
+		call_command("fanout_timelines", stdout=StringIO())
+		self.assertEqual(Post.objects.get(pk=post.pk).fanout_status, Post.FANOUT_READ)
+		self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+		self.assertEqual(self.feed_titles(), ["Post 1"])
+
+	def test_pages_merge_delivered_and_read_time_posts_without_gaps(self):
+		timeline.follow_author(self.reader, self.author)
+		timeline.follow_tag(self.reader, self.python)
+		for n in range(5):
+			self.publish(self.author if n % 2 else self.other, tags=[self.python] if n == 2 else [])
+		call_command("fanout_timelines", stdout=StringIO())
+		# Post 4 skips fan-out and is only found by the read-time merge
+		Post.objects.filter(title="Post 4").update(fanout_status=Post.FANOUT_READ)
+		TimelineEntry.objects.filter(post__title="Post 4").delete()
+		seen, cursor = [], None
+		while True:
+			posts, cursor = timeline.feed_page(self.reader, cursor, size=1)
+			seen += [p.title for p in posts]
+			if cursor is None:
+				break
+		self.assertEqual(seen, ["Post 4", "Post 3", "Post 2"])
+		newest = Post.objects.get(title="Post 4")
+		cursor = timeline.encode_cursor(newest.published_at, newest.pk)
+		self.assertEqual(timeline.decode_cursor(cursor), (newest.published_at, newest.pk))
+		self.assertEqual(self.feed_titles(before=cursor), ["Post 3", "Post 2"])
+		self.assertEqual(self.feed_titles(before="garbage"), ["Post 4", "Post 3", "Post 2"])
+
+	def test_unfollow_keeps_posts_another_follow_covers(self):
+		self.publish(self.author, tags=[self.python])
+		self.publish(self.author)
+		timeline.follow_author(self.reader, self.author)
+		timeline.follow_tag(self.reader, self.python)
+		self.client.post(reverse("follow-author", args=["author"]), {"action": "unfollow"})
+		self.assertEqual(self.feed_titles(), ["Post 1"])
+
+	def test_unpublishing_withdraws_the_post(self):
+		timeline.follow_author(self.reader, self.author)
+		post = self.publish(self.author)
+		call_command("fanout_timelines", stdout=StringIO())
+		post.status = Post.DRAFT
+		post.save()
+		self.assertEqual(self.feed_titles(), [])
+
+	def test_follow_views(self):
+		url = reverse("follow-tag", args=["python"])
+		response = self.client.post(url, {"action": "follow", "next": "https://evil.example/"})
+		self.assertRedirects(response, reverse("feed"), fetch_redirect_response=False)
+		self.assertTrue(self.reader.followed_tags.filter(tag=self.python).exists())
+		self.assertEqual(self.client.post(reverse("follow-tag", args=["nope"])).status_code, 404)
+		self.assertEqual(self.client.post(reverse("follow-author", args=["nobody"])).status_code, 404)
+		self.client.post(reverse("follow-author", args=["reader"]), {"action": "follow"})
+		self.assertFalse(AuthorFollow.objects.filter(follower=self.reader).exists())
+
+
+class InlineExecutor:
+	"""Stands in for a command's process pool, so its tasks see the test database."""
+
+	def __init__(self, *args, **kwargs):
+		pass
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		return False
+
+	def submit(self, fn, *args):
+		future = Future()
+		future.set_result(fn(*args))
+		return future
+
+	def map(self, fn, *iterables, chunksize=1):
+		return map(fn, *iterables)
+
+
+class StaticExportTests(TestCase):
+	def setUp(self):
+		self.root = Path(tempfile.mkdtemp())
+		self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+		self.enterContext(mock.patch.object(static_export, "ProcessPoolExecutor", InlineExecutor))
+		author = User.objects.create_user("writer", password="pw")
+		self.post = Post.objects.create(title="Exported", content="x", author=author, status=Post.PUBLISHED)
+		self.other = Post.objects.create(title="Neighbour", content="x", author=author, status=Post.PUBLISHED)
+		self.draft = Post.objects.create(title="Hidden", content="x", author=author, status=Post.DRAFT)
+
+	def export(self, **kwargs):
+		return static_export.export(self.root, **kwargs)
+
+	def page(self, post):
+		return (self.root / post.get_absolute_url().strip("/") / "index.html").read_text()
+
+	def test_first_export_renders_published_posts_and_index(self):
+		summary = self.export()
+		self.assertEqual((summary["rendered"], summary["pages"]), (2, 1))
+		self.assertIn("Exported", self.page(self.post))
+		self.assertFalse((self.root / self.draft.get_absolute_url().strip("/")).exists())
+		self.assertIn("Neighbour", (self.root / "home" / "index.html").read_text())
+
+	def test_unchanged_posts_are_skipped(self):
+		self.export()
+		self.assertEqual(self.export()["rendered"], 0)
+
+	def test_tag_category_and_related_changes_rerender(self):
+		self.export()
+		self.post.tags.add(Tag.objects.create(name="Python"))
+		self.assertEqual(self.export()["rendered"], 1)
+		self.assertIn("#Python", self.page(self.post))
+		Post.objects.filter(pk=self.post.pk).update(category=Category.objects.create(name="News"))
+		self.assertEqual(self.export()["rendered"], 1)
+		self.assertIn("News", self.page(self.post))
+		RelatedPost.objects.create(post=self.post, related=self.other, score=1.0, rank=1)
+		self.assertEqual(self.export()["rendered"], 1)
+		self.assertIn("Related Posts", self.page(self.post))
+
+	def test_unpublished_posts_are_removed(self):
+		self.export()
+		Post.objects.filter(pk=self.other.pk).update(status=Post.DRAFT)
+		self.assertEqual(self.export()["removed"], 1)
+		self.assertFalse((self.root / self.other.get_absolute_url().strip("/")).exists())
+
+
+class UserExportTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		media_root = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+		self.enterContext(override_settings(MEDIA_ROOT=media_root))
+		(Path(media_root) / "posts").mkdir()
+		(Path(media_root) / "posts" / "cover.jpg").write_bytes(b"jpeg bytes")
+		self.writer = User.objects.create_user("writer", password="pw", email="writer@example.com")
+		self.post = Post.objects.create(
+			title="Exported", content="Body text", author=self.writer, status=Post.PUBLISHED, image="posts/cover.jpg",
+		)
+		Post.objects.create(title="Lost image", content="x", author=self.writer, image="posts/missing.jpg")
+		Comment.objects.create(post=self.post, user=self.writer, content="my comment")
+
+	def open_archive(self, response):
+		self.assertEqual(response["Content-Type"], "application/zip")
+		return zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+
+	def test_own_archive_streams_every_file(self):
+		self.client.force_login(self.writer)
+		with self.open_archive(self.client.get(reverse("user-export"))) as archive:
+			self.assertIsNone(archive.testzip())
+			names = archive.namelist()
+			self.assertEqual(json.loads(archive.read("profile.json"))["email"], "writer@example.com")
+			self.assertEqual({p["title"] for p in json.loads(archive.read("posts.json"))}, {"Exported", "Lost image"})
+			self.assertEqual(json.loads(archive.read("comments.json"))[0]["content"], "my comment")
+			self.assertIn("Body text", archive.read(f"posts/{self.post.slug}.md").decode())
+			self.assertEqual(archive.read("media/posts/cover.jpg"), b"jpeg bytes")
+		# An image missing from storage is left out, not added empty
+		self.assertNotIn("media/posts/missing.jpg", names)
+
+	def test_other_users_archives_are_staff_only(self):
+		url = reverse("user-export-admin", args=["writer"])
+		self.client.force_login(User.objects.create_user("reader", password="pw"))
+		self.assertEqual(self.client.get(url).status_code, 404)
+		self.client.force_login(User.objects.create_user("staff", password="pw", is_staff=True))
+		response = self.client.get(url)
+		self.assertEqual(response["Content-Disposition"], 'attachment; filename="writer-export.zip"')
+		with self.open_archive(response) as archive:
+			self.assertIn("media/posts/cover.jpg", archive.namelist())
+		self.assertEqual(self.client.get(reverse("user-export-admin", args=["nobody"])).status_code, 404)
+
+	def test_generator_yields_bounded_chunks(self):
+		with mock.patch("myapp.user_export.CHUNK_SIZE", 16):
+			chunks = list(stream_archive(self.writer))
+		self.assertGreater(len(chunks), 2)
+		with zipfile.ZipFile(BytesIO(b"".join(chunks))) as archive:
+			self.assertIsNone(archive.testzip())
+
+
+class ImportUsersTests(TestCase):
+	def setUp(self):
+		for name in import_users.ROLES:
+			Group.objects.get_or_create(name=name)
+		self.enterContext(mock.patch.object(import_users, "ProcessPoolExecutor", InlineExecutor))
+		directory = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+		self.path = Path(directory) / "users.csv"
+
+	def run_import(self, rows, *args):
+		self.path.write_text("username,email,password,role\n" + "".join(f"{row}\n" for row in rows))
+		out, err = StringIO(), StringIO()
+		call_command("import_users", str(self.path), "--workers", "1", *args, stdout=out, stderr=err)
+		return out.getvalue(), err.getvalue()
+
+	def test_creates_users_and_sends_verification_mail(self):
+		out, err = self.run_import([
+			"ann,ann@example.com,a-long-passphrase-1,author",
+			"bob,bob@example.com,a-long-passphrase-2,",
+			"ann,dup@example.com,a-long-passphrase-3,",
+			"bad,not-an-email,a-long-passphrase-4,",
+		], "--base-url", "https://example.com")
+		self.assertIn("Created 2 user(s), skipped 2 row(s)", out)
+		self.assertIn("line 4: skipped", err)
+		self.assertIn("line 5: skipped", err)
+		ann = User.objects.get(username="ann")
+		self.assertFalse(ann.is_active)
+		self.assertTrue(ann.check_password("a-long-passphrase-1"))
+		self.assertTrue(User.objects.get(username="bob").has_usable_password())
+		self.assertEqual(list(ann.groups.values_list("name", flat=True)), ["Author"])
+		self.assertEqual(sorted(m.to[0] for m in mail.outbox), ["ann@example.com", "bob@example.com"])
+		self.assertIn("https://example.com/accounts/verify/", mail.outbox[0].body)
+
+	def test_rows_without_a_password_are_skipped(self):
+		for args in (("--verified",), ("--base-url", "https://example.com")):
+			User.objects.filter(username="ann").delete()
+			mail.outbox = []
+			out, err = self.run_import(["ann,ann@example.com,a-long-passphrase-1,", "bob,bob@example.com,,"], *args)
+			self.assertIn("Created 1 user(s), skipped 1 row(s)", out)
+			self.assertIn("line 3: skipped, a password is required", err)
+			self.assertFalse(User.objects.filter(username="bob").exists())
+			self.assertEqual([m.to for m in mail.outbox], [] if "--verified" in args else [["ann@example.com"]])
+		self.assertFalse(User.objects.get(username="ann").profile.email_verified)
+
+	def test_a_name_taken_after_validation_fails_only_its_batch(self):
+		validate = import_users.Command.validate
+
+		def validate_then_register(command, batch, *args):
+			valid = validate(command, batch, *args)
+			if batch[0][0] == 2:
+				User.objects.create_user("ann", password="pw")
+			return valid
+
+		with mock.patch.object(import_users.Command, "validate", validate_then_register):
+			out, err = self.run_import([
+				"ann,ann@example.com,a-long-passphrase-1,",
+				"bob,bob@example.com,a-long-passphrase-2,",
+				"cat,cat@example.com,a-long-passphrase-3,",
+			], "--verified", "--batch-size", "2")
+		self.assertIn("lines 2-3: batch of 2 not imported", err)
+		self.assertIn("Created 1 user(s), skipped 2 row(s)", out)
+		self.assertEqual(sorted(User.objects.values_list("username", flat=True)), ["ann", "cat"])
+
+	def test_dry_run_creates_nothing(self):
+		out, _ = self.run_import(["ann,ann@example.com,a-long-passphrase-1,"], "--dry-run")
+		self.assertIn("1 valid row(s), 0 skipped", out)
+		self.assertFalse(User.objects.exists())
+
+
+class TypeaheadTests(TestCase):
+	def setUp(self):
+		self.author = User.objects.create_user("author", password="pw")
+		self.python, self.pytest, self.web = (Tag.objects.create(name=n) for n in ("Python", "Pytest", "Web"))
+		self.post = self.make_post(self.python, self.pytest)
+		self.make_post(self.python)
+
+	def make_post(self, *tags, status=Post.PUBLISHED):
+		post = Post.objects.create(title="T", content="x", author=self.author, status=status)
+		post.tags.set(tags)
+		return post
+
+	def counts(self):
+		return dict(Tag.objects.values_list("name", "post_count"))
+
+	def test_prefix_matches_ranked_by_usage(self):
+		self.client.force_login(self.author)
+		url = reverse("typeahead-tags")
+		self.assertEqual(self.client.get(url, {"q": "py"}).json()["results"], [
+			{"slug": "python", "name": "Python", "count": 2},
+			{"slug": "pytest", "name": "Pytest", "count": 1},
+		])
+		self.assertEqual(len(self.client.get(url, {"q": "py", "limit": 0}).json()["results"]), 1)
+		self.assertEqual(len(self.client.get(url, {"q": "py", "limit": "x"}).json()["results"]), 2)
+		self.assertEqual(self.client.get(url, {"q": "  "}).json()["results"], [])
+		self.assertEqual(self.client.get(reverse("typeahead-categories"), {"q": "zz"}).json()["results"], [])
+
+	def test_limit_is_clamped(self):
+		self.client.force_login(self.author)
+		for n in range(30):
+			Tag.objects.create(name=f"Py{n:02}")
+		response = self.client.get(reverse("typeahead-tags"), {"q": "py", "limit": 500})
+		self.assertEqual(len(response.json()["results"]), 25)
+
+	def test_login_required(self):
+		self.assertEqual(self.client.get(reverse("typeahead-tags"), {"q": "py"}).status_code, 302)
+
+	def test_counts_follow_tag_changes(self):
+		self.post.tags.add(self.web)
+		self.assertEqual(self.counts(), {"Python": 2, "Pytest": 1, "Web": 1})
+		self.post.tags.remove(self.python, self.web)
+		self.assertEqual(self.counts(), {"Python": 1, "Pytest": 1, "Web": 0})
+		self.post.tags.clear()
+		self.assertEqual(self.counts(), {"Python": 1, "Pytest": 0, "Web": 0})
+		self.web.posts.add(self.post)
+		self.assertEqual(self.counts()["Web"], 1)
+
+	def test_counts_survive_publish_and_unpublish(self):
+		# Drafts use their tags too, so status changes leave the counts alone
+		self.post.status = Post.DRAFT
+		self.post.save()
+		self.assertEqual(self.counts(), {"Python": 2, "Pytest": 1, "Web": 0})
+		self.post.status = Post.PUBLISHED
+		self.post.save()
+		self.assertEqual(self.counts(), {"Python": 2, "Pytest": 1, "Web": 0})
+
+	def test_soft_and_hard_deletes_drop_counts(self):
+		with self.captureOnCommitCallbacks(execute=True):
+			move_to_trash(self.post)
+		self.assertEqual(self.counts(), {"Python": 1, "Pytest": 0, "Web": 0})
+		with self.captureOnCommitCallbacks(execute=True):
+			Post.objects.exclude(pk=self.post.pk).delete()
+		self.assertEqual(self.counts(), {"Python": 0, "Pytest": 0, "Web": 0})
+
+
+class SlugAllocationTests(TestCase):
+	def setUp(self):
+		self.author = User.objects.create_user("author", password="pw")
+
+	def test_duplicate_titles_get_numbered_suffixes(self):
+		slugs = [
+			Post.objects.create(title="Weekly Update", content="x", author=self.author).slug
+			for _ in range(3)
+		]
+		self.assertEqual(slugs, ["weekly-update", "weekly-update-2", "weekly-update-3"])
+
+	def test_similar_prefixes_are_not_counted(self):
+		Post.objects.create(title="Weekly Update Roundup", content="x", author=self.author)
+		post = Post.objects.create(title="Weekly Update", content="x", author=self.author)
+		self.assertEqual(post.slug, "weekly-update")
+
+	def test_allocate_slugs_numbers_within_the_batch(self):
+		Tag.objects.create(name="Python")
+		with self.assertNumQueries(1):
+			slugs = allocate_slugs(Tag, ["Python", "Django", "python", "Django"])
+		self.assertEqual(slugs, ["python-2", "django", "python-3", "django-2"])
+
+
+class ConcurrentSlugAllocationTests(TransactionTestCase):
+	"""Writers racing for the same title, each on its own connection."""
+	writers = 8
+
+	def test_concurrent_saves_never_collide(self):
+		if connection.vendor == "sqlite" and connection.is_in_memory_db():
+			self.skipTest("needs a database that accepts concurrent writers")
+		author = User.objects.create_user("author", password="pw")
+		barrier = threading.Barrier(self.writers)
+		errors = []
+
+		def write():
+			try:
+				barrier.wait()
+				Post.objects.create(title="Weekly Update", content="x", author=author)
+			except Exception as exc:
+				errors.append(exc)
+			finally:
+				connection.close()
+
+		threads = [threading.Thread(target=write) for _ in range(self.writers)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		self.assertEqual(errors, [])
+		slugs = set(Post.objects.values_list("slug", flat=True))
+		self.assertEqual(len(slugs), self.writers)
+		self.assertIn("weekly-update", slugs)
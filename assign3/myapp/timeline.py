@@ -0,0 +1,217 @@
+"""Personalized timelines: follows, fan-out on write and the feed query.
+
+Users follow authors and tags. Publishing a post marks it ``pending``, and
+``manage.py fanout_timelines`` copies it into a ``TimelineEntry`` row for
+every follower of its author or any of its tags. A page of the feed is then
+one range scan of the ``(user, published_at)`` index instead of an OR-join
+across ``Post.author`` and ``Post.tags``.
+
+A post that would reach more than ``TIMELINE_FANOUT_LIMIT`` followers is
+not copied at all: it is marked ``read`` and merged into each follower's
+page at read time from a partial index of such posts. That caps the rows a
+single publish can write. The decision is stored on the post, so changing
+the limit later never loses or duplicates anything.
+
+Following backfills the newest ``TIMELINE_BACKFILL`` posts; unfollowing
+removes the entries no remaining follow accounts for. Unpublishing or
+trashing a post deletes its entries.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import AuthorFollow, Post, TagFollow, TimelineEntry
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def fanout_limit():
+	return getattr(settings, "TIMELINE_FANOUT_LIMIT", 5000)
+
+
+def followers_of(post):
+	"""Ids of everyone following ``post``'s author or one of its tags."""
+	tag_ids = Post.tags.through.objects.filter(post_id=post.pk).values("tag_id")
+	by_author = AuthorFollow.objects.filter(author_id=post.author_id).values_list("follower_id", flat=True)
+	by_tag = TagFollow.objects.filter(tag_id__in=tag_ids).values_list("follower_id", flat=True)
+	# UNION drops users reached through more than one follow
+	return by_author.exclude(follower_id=post.author_id).union(by_tag.exclude(follower_id=post.author_id))
+
+
+def fan_out(post_id, batch_size=1000):
+	"""Deliver one pending post; returns the number of timeline rows written.
+
+	The post row is locked for the duration, so an unpublish that lands
+	meanwhile waits and then removes what was written.
+	"""
+	with transaction.atomic():
+		post = (
+			Post.objects.select_for_update()
+			.filter(pk=post_id, status=Post.PUBLISHED, fanout_status=Post.FANOUT_PENDING)
+			.only("id", "author_id", "published_at", "created_at")
+			.first()
+		)
+		if post is None:
+			return 0
+		limit = fanout_limit()
+		user_ids = list(followers_of(post)[:limit + 1])
+		if len(user_ids) > limit:
+			Post.objects.filter(pk=post_id).update(fanout_status=Post.FANOUT_READ)
+			return 0
+		published_at = post.published_at or post.created_at
+		TimelineEntry.objects.bulk_create(
+			[TimelineEntry(user_id=user_id, post_id=post_id, published_at=published_at) for user_id in user_ids],
+			batch_size=batch_size, ignore_conflicts=True,
+		)
+		Post.objects.filter(pk=post_id).update(fanout_status=Post.FANOUT_DONE)
+	return len(user_ids)
+
+
+def fan_out_batch(last_id, limit, batch_size=1000):
+	"""Fan out up to ``limit`` pending posts after ``last_id``.
+
+	Returns ``(last_id, posts, entries)``; ``last_id`` is None once nothing
+	is left.
+	"""
+	post_ids = list(
+		Post.objects.filter(fanout_status=Post.FANOUT_PENDING, pk__gt=last_id)
+		.order_by("pk").values_list("pk", flat=True)[:limit]
+	)
+	if not post_ids:
+		return None, 0, 0
+	entries = sum(fan_out(post_id, batch_size) for post_id in post_ids)
+	return post_ids[-1], len(post_ids), entries
+
+
+def withdraw(post_id):
+	"""Take a post out of every timeline, e.g. when it is unpublished."""
+	TimelineEntry.objects.filter(post_id=post_id).delete()
+	Post.all_objects.filter(pk=post_id).exclude(fanout_status="").update(fanout_status="")
+
+
+def post_saved(post, old_publication):
+	"""Queue, move or withdraw ``post`` after a save.
+
+	``old_publication`` is the ``(status, published_at)`` the row had before
+	the save, or None for a new post.
+	"""
+	was_published = old_publication is not None and old_publication[0] == Post.PUBLISHED
+	if post.status != Post.PUBLISHED or post.deleted_at is not None:
+		if was_published:
+			withdraw(post.pk)
+	elif not was_published:
+		Post.all_objects.filter(pk=post.pk, fanout_status="").update(fanout_status=Post.FANOUT_PENDING)
+	elif old_publication[1] != post.published_at:
+		TimelineEntry.objects.filter(post_id=post.pk).update(published_at=post.published_at or post.created_at)
+
+
+def tags_added(post_ids):
+	"""Send already delivered posts to the followers of their new tags."""
+	Post.objects.filter(pk__in=post_ids, fanout_status=Post.FANOUT_DONE).update(fanout_status=Post.FANOUT_PENDING)
+
+
+def _backfill(user, posts):
+	backfill = getattr(settings, "TIMELINE_BACKFILL", 50)
+	# Posts delivered at read time already show up without a copy
+	rows = (
+		posts.published().exclude(fanout_status=Post.FANOUT_READ).exclude(author=user)
+		.order_by("-published_at", "-id").values_list("id", "published_at", "created_at")[:backfill]
+	)
+	TimelineEntry.objects.bulk_create(
+		[TimelineEntry(user=user, post_id=pk, published_at=at or created) for pk, at, created in rows],
+		ignore_conflicts=True,
+	)
+
+
+def _prune(user, entries):
+	"""Delete ``entries`` of ``user`` that no remaining follow accounts for."""
+	entries.exclude(
+		post__author__in=AuthorFollow.objects.filter(follower=user).values("author_id")
+	).exclude(
+		post__tags__in=TagFollow.objects.filter(follower=user).values("tag_id")
+	).delete()
+
+
+def follow_author(user, author):
+	if user.pk == author.pk:
+		return False
+	with transaction.atomic():
+		_, created = AuthorFollow.objects.get_or_create(follower=user, author=author)
+		if created:
+			_backfill(user, Post.objects.filter(author=author))
+	return created
+
+
+def unfollow_author(user, author):
+	with transaction.atomic():
+		deleted, _ = AuthorFollow.objects.filter(follower=user, author=author).delete()
+		if deleted:
+			_prune(user, TimelineEntry.objects.filter(user=user, post__author=author))
+	return bool(deleted)
+
+
+def follow_tag(user, tag):
+	with transaction.atomic():
+		_, created = TagFollow.objects.get_or_create(follower=user, tag=tag)
+		if created:
+			_backfill(user, Post.objects.filter(tags=tag))
+	return created
+
+
+def unfollow_tag(user, tag):
+	with transaction.atomic():
+		deleted, _ = TagFollow.objects.filter(follower=user, tag=tag).delete()
+		if deleted:
+			_prune(user, TimelineEntry.objects.filter(user=user, post__tags=tag))
+	return bool(deleted)
+
+
+def encode_cursor(published_at, post_id):
+	return f"{(published_at - EPOCH) // timedelta(microseconds=1)}-{post_id}"
+
+
+def decode_cursor(cursor):
+	"""``(published_at, post_id)`` from ``encode_cursor``, or None if malformed."""
+	micros, _, post_id = (cursor or "").partition("-")
+	try:
+		return EPOCH + timedelta(microseconds=int(micros)), int(post_id)
+	except (ValueError, OverflowError):
+		return None
+
+
+def _before(cursor, at_field, id_field):
+	if cursor is None:
+		return Q()
+	at, pk = cursor
+	return Q(**{f"{at_field}__lt": at}) | Q(**{at_field: at, f"{id_field}__lt": pk})
+
+
+def feed_page(user, cursor=None, size=20):
+	"""One page of ``user``'s feed, newest first.
+
+	``cursor`` is the ``(published_at, post_id)`` of the last post on the
+	previous page. Returns ``(posts, next_cursor)``, with ``next_cursor``
+	None on the last page.
+	"""
+	delivered = list(
+		TimelineEntry.objects.filter(_before(cursor, "published_at", "post_id"), user=user)
+		.order_by("-published_at", "-post_id").values_list("published_at", "post_id")[:size + 1]
+	)
+	merged = list(
+		Post.objects.published()
+		.filter(_before(cursor, "published_at", "id"), fanout_status=Post.FANOUT_READ, published_at__isnull=False)
+		.filter(
+			Q(author__in=AuthorFollow.objects.filter(follower=user).values("author_id"))
+			| Q(tags__in=TagFollow.objects.filter(follower=user).values("tag_id"))
+		)
+		.exclude(author=user).distinct()
+		.order_by("-published_at", "-id").values_list("published_at", "id")[:size + 1]
+	)
+	rows = sorted(set(delivered) | set(merged), reverse=True)
+	next_cursor = rows[size - 1] if len(rows) > size else None
+	ids = [pk for _, pk in rows[:size]]
+	posts = Post.objects.select_related("author", "category").prefetch_related("tags").in_bulk(ids)
+	return [posts[pk] for pk in ids if pk in posts], next_cursor
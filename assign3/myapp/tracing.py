@@ -0,0 +1,309 @@
+"""In-process request tracing written to a local JSON-lines file.
+
+``TracingMiddleware`` opens a server span per sampled request; SQL
+statements, template renders, cache calls and outgoing mail become child
+spans. A request is traced when its ``X-Force-Trace`` header carries the
+``TRACE_FORCE_SECRET``, when an incoming W3C ``traceparent`` is marked
+sampled, or when it falls into the ``TRACE_SAMPLE_RATE`` head sample.
+Unsampled requests only pay for one context-variable lookup per
+instrumented call.
+
+Threads started with ``contextvars.copy_context().run`` keep the request's
+trace; their spans that finish after the response has been exported are
+written as a later line with the same trace id.
+
+Each finished trace is one line in ``TRACE_FILE`` shaped like an OTLP/JSON
+``ExportTraceServiceRequest``, so it can be replayed into any OTLP
+collector later; the file rotates at ``TRACE_FILE_MAX_BYTES``. With
+``TRACING_ENABLED`` off nothing is patched and the middleware removes
+itself.
+"""
+import hmac
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+FORCE_HEADER = "HTTP_X_FORCE_TRACE"
+SERVICE_NAME = "pen-and-paper"
+MAX_SPANS = 2000
+MAX_STATEMENT = 2000
+
+# OTLP span kinds and status codes
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+STATUS_OK, STATUS_ERROR = 1, 2
+
+CACHE_METHODS = ("get", "set", "add", "delete", "get_many", "set_many", "delete_many", "incr", "decr", "touch")
+
+_trace = ContextVar("trace", default=None)
+_parent = ContextVar("parent_span", default=None)
+_exporter = None
+
+
+def _random_id(nbytes):
+	return os.urandom(nbytes).hex()
+
+
+def _attribute(key, value):
+	if isinstance(value, bool):
+		typed = {"boolValue": value}
+	elif isinstance(value, int):
+		typed = {"intValue": str(value)}
+	elif isinstance(value, float):
+		typed = {"doubleValue": value}
+	else:
+		typed = {"stringValue": str(value)}
+	return {"key": key, "value": typed}
+
+
+class Span:
+	__slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start", "end", "attributes", "status", "exported")
+
+	def __init__(self, trace, name, kind, parent_id, attributes):
+		self.trace = trace
+		self.span_id = _random_id(8)
+		self.parent_id = parent_id
+		self.name = name
+		self.kind = kind
+		self.attributes = attributes
+		self.status = STATUS_OK
+		self.start = time.time_ns()
+		self.end = None
+		self.exported = False
+
+	def to_otlp(self):
+		span = {
+			"traceId": self.trace.trace_id,
+			"spanId": self.span_id,
+			"name": self.name,
+			"kind": self.kind,
+			"startTimeUnixNano": str(self.start),
+			"endTimeUnixNano": str(self.end or time.time_ns()),
+			"attributes": [_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+			"status": {"code": self.status},
+		}
+		if self.parent_id:
+			span["parentSpanId"] = self.parent_id
+		return span
+
+
+class Trace:
+	def __init__(self, trace_id=None, parent_id=None):
+		self.trace_id = trace_id or _random_id(16)
+		self.remote_parent = parent_id
+		self.spans = []
+		self.dropped = 0
+		self.finished = False
+		self.lock = threading.Lock()
+
+	def add(self, span):
+		if len(self.spans) >= MAX_SPANS:
+			self.dropped += 1
+			return False
+		self.spans.append(span)
+		return True
+
+	def to_otlp(self, spans):
+		return {"resourceSpans": [{
+			"resource": {"attributes": [_attribute("service.name", SERVICE_NAME)]},
+			"scopeSpans": [{
+				"scope": {"name": "myapp.tracing"},
+				"spans": [span.to_otlp() for span in spans],
+			}],
+		}]}
+
+	def take_finished(self):
+		"""Ended spans not exported yet; marks the trace as finished."""
+		with self.lock:
+			self.finished = True
+			spans = [span for span in self.spans if span.end is not None and not span.exported]
+			for span in spans:
+				span.exported = True
+		return spans
+
+
+@contextmanager
+def span(name, kind=KIND_INTERNAL, **attributes):
+	"""Child span of whatever is current; a no-op outside a sampled request."""
+	trace = _trace.get()
+	if trace is None:
+		yield None
+		return
+	parent = _parent.get()
+	current = Span(trace, name, kind, parent.span_id if parent else trace.remote_parent, attributes)
+	if not trace.add(current):
+		yield None
+		return
+	token = _parent.set(current)
+	try:
+		yield current
+	except BaseException as exc:
+		current.status = STATUS_ERROR
+		current.attributes["exception.type"] = type(exc).__name__
+		raise
+	finally:
+		current.end = time.time_ns()
+		_parent.reset(token)
+		# A span from a copied context outliving the request: export it (and
+		# its children) once its outermost span closes
+		if trace.finished and (parent is None or parent.end is not None):
+			export(trace)
+
+
+def _get_exporter():
+	global _exporter
+	if _exporter is None:
+		path = Path(getattr(settings, "TRACE_FILE", Path(settings.BASE_DIR) / "traces" / "traces.jsonl"))
+		path.parent.mkdir(parents=True, exist_ok=True)
+		exporter = logging.getLogger("myapp.tracing.export")
+		exporter.propagate = False
+		exporter.setLevel(logging.INFO)
+		handler = RotatingFileHandler(
+			path,
+			maxBytes=getattr(settings, "TRACE_FILE_MAX_BYTES", 10 * 1024 * 1024),
+			backupCount=getattr(settings, "TRACE_FILE_BACKUPS", 5),
+		)
+		handler.setFormatter(logging.Formatter("%(message)s"))
+		exporter.addHandler(handler)
+		_exporter = exporter
+	return _exporter
+
+
+def export(trace):
+	spans = trace.take_finished()
+	if spans:
+		_get_exporter().info(json.dumps(trace.to_otlp(spans), separators=(",", ":")))
+
+
+def _parse_traceparent(header):
+	"""``(trace_id, parent_span_id, sampled)`` from a W3C traceparent, or None."""
+	parts = header.split("-")
+	if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+		return None
+	try:
+		sampled = bool(int(parts[3], 16) & 1)
+	except ValueError:
+		return None
+	return parts[1], parts[2], sampled
+
+
+class _QueryTracer:
+	def __init__(self, vendor):
+		self.vendor = vendor
+
+	def __call__(self, execute, sql, params, many, context):
+		with span("db.query", KIND_CLIENT, **{
+			"db.system": self.vendor,
+			"db.statement": sql[:MAX_STATEMENT],
+			"db.executemany": many or None,
+		}):
+			return execute(sql, params, many, context)
+
+
+class TracingMiddleware:
+	def __init__(self, get_response):
+		if not getattr(settings, "TRACING_ENABLED", False):
+			raise MiddlewareNotUsed
+		self.get_response = get_response
+		self.sample_rate = getattr(settings, "TRACE_SAMPLE_RATE", 0.01)
+		self.force_secret = getattr(settings, "TRACE_FORCE_SECRET", "")
+
+	def _forced(self, request):
+		"""Only callers that know the shared secret may force a trace."""
+		value = request.META.get(FORCE_HEADER)
+		if not self.force_secret or value is None:
+			return False
+		return hmac.compare_digest(value.encode(), self.force_secret.encode())
+
+	def _start(self, request):
+		incoming = _parse_traceparent(request.META.get("HTTP_TRACEPARENT", ""))
+		forced = self._forced(request)
+		if forced or (incoming and incoming[2]) or random.random() < self.sample_rate:
+			if incoming:
+				return Trace(incoming[0], incoming[1])
+			return Trace()
+		return None
+
+	def __call__(self, request):
+		trace = self._start(request)
+		if trace is None:
+			return self.get_response(request)
+		trace_token = _trace.set(trace)
+		try:
+			with ExitStack() as stack, span(f"{request.method} {request.path}", KIND_SERVER, **{
+				"http.request.method": request.method,
+				"url.path": request.path,
+			}) as root:
+				for connection in connections.all():
+					stack.enter_context(connection.execute_wrapper(_QueryTracer(connection.vendor)))
+				response = self.get_response(request)
+				match = getattr(request, "resolver_match", None)
+				if match is not None and match.route:
+					root.name = f"{request.method} /{match.route}"
+					root.attributes["http.route"] = f"/{match.route}"
+				root.attributes["http.response.status_code"] = response.status_code
+				if response.status_code >= 500:
+					root.status = STATUS_ERROR
+		finally:
+			_trace.reset(trace_token)
+			if trace.dropped:
+				trace.spans[0].attributes["trace.dropped_spans"] = trace.dropped
+			export(trace)
+		response["X-Trace-Id"] = trace.trace_id
+		return response
+
+
+def _traced(method, make_span):
+	@wraps(method)
+	def wrapper(*args, **kwargs):
+		if _trace.get() is None:
+			return method(*args, **kwargs)
+		with make_span(*args, **kwargs):
+			return method(*args, **kwargs)
+	wrapper._traced = True
+	return wrapper
+
+
+def install():
+	"""Patch template rendering, cache backends and mail sending once."""
+	from django.core.cache import caches
+	from django.core.mail import EmailMessage
+	from django.template.base import Template
+
+	if getattr(Template._render, "_traced", False):
+		return
+
+	Template._render = _traced(Template._render, lambda self, context: span(
+		f"render {self.origin.template_name or '<string>'}", template_name=self.origin.template_name,
+	))
+
+	def cache_span(name):
+		def make(cache, key=None, *args, **kwargs):
+			return span(f"cache.{name}", KIND_CLIENT, **{
+				"cache.key": key if isinstance(key, str) else None,
+				"cache.backend": type(cache).__name__,
+			})
+		return make
+
+	for alias in settings.CACHES:
+		backend = type(caches[alias])
+		for name in CACHE_METHODS:
+			method = getattr(backend, name, None)
+			if method is not None and not getattr(method, "_traced", False):
+				setattr(backend, name, _traced(method, cache_span(name)))
+
+	EmailMessage.send = _traced(EmailMessage.send, lambda message, *args, **kwargs: span(
+		"mail.send", KIND_CLIENT, **{"mail.recipients": len(message.recipients())},
+	))
@@ -0,0 +1,102 @@
+"""Soft delete for posts and the batched purge that finishes the job.
+
+Deleting a post in a request is a single ``UPDATE`` setting ``deleted_at``;
+``Post.objects`` hides such rows from then on. ``manage.py
+purge_deleted_posts`` later removes the comments, tag links and related-post
+rows with raw ``DELETE ... LIMIT`` batches, each in its own short
+transaction, and finally the post row itself, so no single statement has to
+walk tens of thousands of rows and Django's collector never loads them.
+"""
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from . import archive, search_cache, timeline
+from .models import Post, RelatedPost
+from .page_cache import bump_post_version
+from .related import published_total, refresh_related
+from .stats import invalidate_author_stats
+from .typeahead import refresh_tag_counts
+
+
+def _after_trash(post, tag_ids, neighbour_ids):
+	bump_post_version(post.slug)
+	search_cache.bump_generation()
+	invalidate_author_stats(post.author_id)
+	refresh_tag_counts(tag_ids)
+	total = published_total()
+	for other_id in neighbour_ids:
+		refresh_related(other_id, total)
+	for slug in Post.objects.filter(pk__in=neighbour_ids).values_list("slug", flat=True):
+		bump_post_version(slug)
+
+
+def move_to_trash(post):
+	"""Soft-delete ``post``; returns False if it was already deleted.
+
+	``update()`` sends no signals, so the bookkeeping the delete receivers
+	would have done (archive month, tag counts, related lists, caches) is
+	done here instead.
+	"""
+	with transaction.atomic():
+		trashed = Post.objects.filter(pk=post.pk).update(deleted_at=timezone.now())
+		if not trashed:
+			return False
+		archive.adjust(archive.bucket_for(post.status, post.published_at), -1)
+		related = RelatedPost.objects.filter(models.Q(post_id=post.pk) | models.Q(related_id=post.pk))
+		neighbour_ids = {pk for pair in related.values_list("post_id", "related_id") for pk in pair} - {post.pk}
+		related.delete()
+		timeline.withdraw(post.pk)
+		tag_ids = list(Post.tags.through.objects.filter(post_id=post.pk).values_list("tag_id", flat=True))
+		transaction.on_commit(lambda: _after_trash(post, tag_ids, neighbour_ids))
+	return True
+
+
+def dependent_tables():
+	"""``(table, column)`` pairs holding rows that cascade from a post.
+
+	Covers reverse ``CASCADE`` foreign keys (including hidden ones) and the
+	through tables of the post's own many-to-many fields. None of these
+	rows have dependents of their own, so deleting them directly is safe.
+	"""
+	tables = []
+	for field in Post._meta.get_fields(include_hidden=True):
+		if (field.one_to_many or field.one_to_one) and field.auto_created and not field.concrete:
+			if field.on_delete is models.CASCADE:
+				tables.append((field.related_model._meta.db_table, field.field.column))
+	for field in Post._meta.many_to_many:
+		through = field.remote_field.through
+		tables.append((through._meta.db_table, through._meta.get_field(field.m2m_field_name()).column))
+	return tables
+
+
+def _delete_batch(table, column, post_id, batch_size):
+	qn = connection.ops.quote_name
+	sql = (
+		f"DELETE FROM {qn(table)} WHERE {qn('id')} IN ("
+		f"SELECT {qn('id')} FROM {qn(table)} WHERE {qn(column)} = %s LIMIT %s)"
+	)
+	with transaction.atomic(), connection.cursor() as cursor:
+		cursor.execute(sql, [post_id, batch_size])
+		return cursor.rowcount
+
+
+def purge_post(post_id, batch_size=1000):
+	"""Delete a soft-deleted post and everything hanging off it, in batches.
+
+	Returns the number of dependent rows removed. Safe to re-run after an
+	interruption: each batch commits on its own and the post row goes last.
+	"""
+	removed = 0
+	for table, column in dependent_tables():
+		while True:
+			count = _delete_batch(table, column, post_id, batch_size)
+			removed += count
+			if count < batch_size:
+				break
+	qn = connection.ops.quote_name
+	with transaction.atomic(), connection.cursor() as cursor:
+		cursor.execute(
+			f"DELETE FROM {qn(Post._meta.db_table)} WHERE {qn('id')} = %s AND {qn('deleted_at')} IS NOT NULL",
+			[post_id],
+		)
+	return removed
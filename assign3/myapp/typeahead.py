@@ -0,0 +1,85 @@
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import connection
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse
+from django.views.generic import View
+
+from .models import Category, Post, Tag
+
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 25
+
+
+def refresh_tag_counts(tag_ids):
+	"""Recount ``Tag.post_count`` for the given tags from the through table.
+
+	Recounting (instead of +1/-1) stays exact even when ``remove()`` is
+	called with tags the post never had. Soft-deleted posts are not counted.
+	"""
+	if not tag_ids:
+		return
+	through = Post.tags.through
+	usage = (
+		through.objects.filter(tag_id=OuterRef("pk"), post__deleted_at__isnull=True)
+		.order_by()
+		.values("tag_id")
+		.annotate(n=Count("*"))
+		.values("n")
+	)
+	Tag.objects.filter(pk__in=tag_ids).update(post_count=Coalesce(Subquery(usage), Value(0)))
+
+
+def _prefix_then_infix(queryset, term, limit):
+	"""Prefix matches first; fill up with substring matches on PostgreSQL.
+
+	The prefix lookup is served by the ``UPPER(name) text_pattern_ops``
+	index, the substring lookup by the trigram index when pg_trgm exists.
+	"""
+	results = list(queryset.filter(name__istartswith=term)[:limit])
+	if len(results) < limit and len(term) >= 3 and connection.vendor == "postgresql":
+		seen = [obj["slug"] for obj in results]
+		results += list(
+			queryset.filter(name__icontains=term).exclude(slug__in=seen)[:limit - len(results)]
+		)
+	return results
+
+
+def search_tags(term, limit=DEFAULT_LIMIT):
+	qs = Tag.objects.order_by("-post_count", "name").values("slug", "name", count=F("post_count"))
+	return _prefix_then_infix(qs, term, limit)
+
+
+def search_categories(term, limit=DEFAULT_LIMIT):
+	# Categories are few, so usage is counted live over the prefix matches.
+	qs = (
+		Category.objects.annotate(count=Count("posts", filter=Q(posts__deleted_at__isnull=True)))
+		.order_by("-count", "name")
+		.values("slug", "name", "count")
+	)
+	return _prefix_then_infix(qs, term, limit)
+
+
+class TypeaheadView(LoginRequiredMixin, View):
+	"""``GET ?q=<prefix>&limit=<n>`` -> ``{"results": [{slug, name, count}]}``."""
+	search = None
+
+	def get(self, request):
+		term = request.GET.get("q", "").strip()
+		try:
+			limit = min(max(int(request.GET.get("limit", DEFAULT_LIMIT)), 1), MAX_LIMIT)
+		except ValueError:
+			limit = DEFAULT_LIMIT
+		results = self.search(term, limit) if term else []
+		response = JsonResponse({"results": results})
+		response["Cache-Control"] = "private, max-age=30"
+		return response
+
+
+class TagTypeaheadView(TypeaheadView):
+	search = staticmethod(search_tags)
+
+
+class CategoryTypeaheadView(TypeaheadView):
+	search = staticmethod(search_categories)
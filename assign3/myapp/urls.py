@@ -9,16 +9,44 @@ from .views import (
     DashboardView,
     UserDashboardView,
     ApplyAuthorView,
+    MostViewedView,
+    ArchiveMonthView,
+    FeedView,
+    FollowAuthorView,
+    FollowTagView,
 )
+from .api import PostListAPIView, PostDetailAPIView
+from .typeahead import TagTypeaheadView, CategoryTypeaheadView
+from .sitemaps import SitemapIndexView, PostSitemapView
+from .live import comment_stream
+from .profiling import ProfileListView, ProfileDetailView, ProfileDownloadView
+from .user_export import UserExportView
 
 urlpatterns = [
     path('home/', HomeView.as_view(), name='home'),
+    path('archive/<int:year>/<int:month>/', ArchiveMonthView.as_view(), name='archive-month'),
+    path('popular/', MostViewedView.as_view(), name='popular'),
+    path('feed/', FeedView.as_view(), name='feed'),
+    path('follow/author/<str:username>/', FollowAuthorView.as_view(), name='follow-author'),
+    path('follow/tag/<slug:slug>/', FollowTagView.as_view(), name='follow-tag'),
     path('my-dashboard/', UserDashboardView.as_view(), name='user-dashboard'),
+    path('my-dashboard/export/', UserExportView.as_view(), name='user-export'),
+    path('users/<str:username>/export/', UserExportView.as_view(), name='user-export-admin'),
     path('apply-author/', ApplyAuthorView.as_view(), name='apply-author'),
     path('dashboard/', DashboardView.as_view(), name='dashboard'),
     path('post/new/', PostCreateView.as_view(), name='post-create'),
     path('post/<slug:slug>/', PostDetailView.as_view(), name='post-detail'),
     path('post/<slug:slug>/comment/', CommentCreateView.as_view(), name='comment-create'),
+    path('post/<slug:slug>/comments/stream/', comment_stream, name='comment-stream'),
     path('post/<slug:slug>/edit/', PostUpdateView.as_view(), name='post-edit'),
     path('post/<slug:slug>/delete/', PostDeleteView.as_view(), name='post-delete'),
+    path('api/posts/', PostListAPIView.as_view(), name='api-post-list'),
+    path('api/posts/<slug:slug>/', PostDetailAPIView.as_view(), name='api-post-detail'),
+    path('sitemap.xml', SitemapIndexView.as_view(), name='sitemap-index'),
+    path('sitemap-posts-<int:shard>.xml', PostSitemapView.as_view(), name='sitemap-posts'),
+    path('typeahead/tags/', TagTypeaheadView.as_view(), name='typeahead-tags'),
+    path('typeahead/categories/', CategoryTypeaheadView.as_view(), name='typeahead-categories'),
+    path('profiles/', ProfileListView.as_view(), name='profiles'),
+    path('profiles/<str:capture_id>/', ProfileDetailView.as_view(), name='profile-detail'),
+    path('profiles/<str:capture_id>.prof', ProfileDownloadView.as_view(), name='profile-download'),
 ]
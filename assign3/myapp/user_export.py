@@ -0,0 +1,182 @@
+"""Streaming ZIP export of everything a user has written.
+
+The archive holds ``profile.json``, ``posts.json``, ``comments.json`` and
+``applications.json``, one Markdown file per post under ``posts/`` and the
+posts' images under ``media/``. It is produced as a generator: rows are
+read with ``.iterator(chunk_size=...)``, each zip entry is written and
+flushed before the next one starts, and the bytes are handed on in chunks
+of about ``CHUNK_SIZE``. Memory use therefore does not grow with the
+amount of content, whether the generator feeds a ``StreamingHttpResponse``
+or ``manage.py export_user``.
+
+``zipfile`` writes to the non-seekable sink with data descriptors, so sizes
+and CRCs do not have to be known before an entry starts.
+"""
+import json
+import time
+import zipfile
+
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.generic import View
+
+from .models import AuthorApplication, Comment, Post, UserProfile
+from .ratelimit import Rate, RateLimitMixin
+
+
+CHUNK_SIZE = 64 * 1024
+ROW_CHUNK_SIZE = 500
+
+
+class _Sink:
+	"""Write-only file object whose contents are taken out with ``drain()``."""
+
+	def __init__(self):
+		self.chunks = []
+		self.buffered = 0
+		self.offset = 0
+
+	def write(self, data):
+		self.chunks.append(bytes(data))
+		self.buffered += len(data)
+		self.offset += len(data)
+		return len(data)
+
+	def tell(self):
+		return self.offset
+
+	def flush(self):
+		pass
+
+	def drain(self):
+		data = b"".join(self.chunks)
+		self.chunks = []
+		self.buffered = 0
+		return data
+
+
+def _json(value):
+	return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def _json_array(rows):
+	yield "["
+	separator = "\n"
+	for row in rows:
+		yield separator + _json(row)
+		separator = ",\n"
+	yield "\n]\n"
+
+
+def _markdown(post):
+	tags = ", ".join(_json(tag.name) for tag in post.tags.all())
+	lines = [
+		"---",
+		f"title: {_json(post.title)}",
+		f"slug: {post.slug}",
+		f"status: {post.status}",
+		f"published_at: {post.published_at.isoformat() if post.published_at else ''}",
+		f"category: {_json(post.category.name) if post.category else ''}",
+		f"tags: [{tags}]",
+		"---",
+		"",
+	]
+	if post.image:
+		lines += [f"![{post.title}](../media/{post.image.name})", ""]
+	lines += [post.content, ""]
+	yield "\n".join(lines)
+
+
+def _file_chunks(handle):
+	with handle:
+		while chunk := handle.read(CHUNK_SIZE):
+			yield chunk
+
+
+def _posts(user):
+	return Post.objects.filter(author=user).order_by("pk")
+
+
+def _entries(user):
+	"""``(name, compress_type, chunks)`` for each file in the archive."""
+	profile = UserProfile.objects.filter(user=user).values("email_verified", "created_at").first()
+	yield "profile.json", zipfile.ZIP_DEFLATED, [_json({
+		"username": user.username,
+		"email": user.email,
+		"first_name": user.first_name,
+		"last_name": user.last_name,
+		"date_joined": user.date_joined,
+		"last_login": user.last_login,
+		"groups": list(user.groups.values_list("name", flat=True)),
+		"profile": profile,
+	}) + "\n"]
+	yield "posts.json", zipfile.ZIP_DEFLATED, _json_array(
+		_posts(user).values(
+			"id", "title", "slug", "status", "content", "image", "category__name",
+			"published_at", "created_at", "updated_at", "view_count",
+		).iterator(chunk_size=ROW_CHUNK_SIZE)
+	)
+	yield "comments.json", zipfile.ZIP_DEFLATED, _json_array(
+		Comment.objects.filter(user=user).order_by("pk").values(
+			"id", "post__slug", "content", "moderation_status", "created_at", "updated_at",
+		).iterator(chunk_size=ROW_CHUNK_SIZE)
+	)
+	yield "applications.json", zipfile.ZIP_DEFLATED, _json_array(
+		AuthorApplication.objects.filter(user=user).order_by("pk").values(
+			"id", "reason", "status", "reviewed_at", "created_at",
+		).iterator(chunk_size=ROW_CHUNK_SIZE)
+	)
+	posts = _posts(user).select_related("category").prefetch_related("tags")
+	for post in posts.iterator(chunk_size=ROW_CHUNK_SIZE):
+		yield f"posts/{post.slug}.md", zipfile.ZIP_DEFLATED, _markdown(post)
+	images = _posts(user).exclude(image="").exclude(image__isnull=True).values_list("image", flat=True)
+	for name in images.iterator(chunk_size=ROW_CHUNK_SIZE):
+		try:
+			handle = default_storage.open(name, "rb")
+		except OSError:
+			# Missing from storage: leave it out rather than add an empty entry
+			continue
+		# Images are compressed already
+		yield f"media/{name}", zipfile.ZIP_STORED, _file_chunks(handle)
+
+
+def stream_archive(user):
+	"""Yield the bytes of ``user``'s export archive."""
+	sink = _Sink()
+	with zipfile.ZipFile(sink, "w") as archive:
+		for name, compress_type, chunks in _entries(user):
+			info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+			info.compress_type = compress_type
+			# Sizes are unknown up front, so allow for entries over 4 GiB
+			with archive.open(info, "w", force_zip64=True) as entry:
+				for chunk in chunks:
+					entry.write(chunk.encode() if isinstance(chunk, str) else chunk)
+					if sink.buffered >= CHUNK_SIZE:
+						yield sink.drain()
+	yield sink.drain()
+
+
+def archive_name(user):
+	return f"{user.username}-export.zip"
+
+
+class UserExportView(LoginRequiredMixin, RateLimitMixin, View):
+	"""Download your own archive, or anyone's as staff."""
+	login_url = '/accounts/login/'
+	ratelimit_rates = (Rate('5/h', 'user'), Rate('60/m', 'global'))
+	ratelimit_methods = ("GET",)
+
+	def get(self, request, username=None):
+		user = request.user
+		if username is not None and username != user.username:
+			if not (user.is_staff or user.is_superuser):
+				raise Http404("No such user.")
+			user = get_object_or_404(User, username=username)
+		response = StreamingHttpResponse(stream_archive(user), content_type="application/zip")
+		response["Content-Disposition"] = f'attachment; filename="{archive_name(user)}"'
+		response["Cache-Control"] = "private, no-store"
+		return response
@@ -0,0 +1,152 @@
+"""Write-behind per-post view counters.
+
+Each detail view only touches the cache: ``views:<slug>`` is incremented
+and, unless ``views:marked:<slug>`` says it is already listed, the slug is
+appended to a numbered dirty log (``views:dirty:<n>``). The marker is set
+with ``add``, so listing a slug on every view is idempotent. A flush reads
+the log since the last flush, clears each slug's marker, takes its pending
+count with an atomic ``decr`` and applies all of them with one
+``UPDATE ... SET view_count = view_count + CASE slug ... END`` per batch.
+Views that land after the marker is cleared list the slug again.
+
+A writer takes its log slot with ``incr`` before storing the slug in it,
+so a flush can find a slot that is numbered but still empty. Such gaps are
+read again by later flushes until they fill, and dropped only after
+``GAP_TIMEOUT`` seconds (a worker that died in between).
+
+Flushes run from ``manage.py flush_views`` and, at most once per
+``VIEW_COUNT_FLUSH_INTERVAL`` seconds, in a background thread started by a
+view, so no request waits on the UPDATEs. The thread is what flushes the
+default per-process LocMemCache, which other processes cannot see.
+
+Loss bound: counts live only in the cache until flushed, so a cache restart
+or eviction loses at most one flush interval of views. Views are never
+counted twice, because a count is decremented in the cache before it is
+written to the database.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, F, Value, When
+
+from .models import Post
+
+
+COUNT_KEY = "views:{slug}"
+MARKED_KEY = "views:marked:{slug}"
+DIRTY_KEY = "views:dirty:{slot}"
+DIRTY_SEQ_KEY = "views:dirty-seq"
+FLUSHED_SEQ_KEY = "views:flushed-seq"
+GAPS_KEY = "views:dirty-gaps"
+FLUSH_LOCK_KEY = "views:flush-lock"
+FLUSHING_KEY = "views:flushing"
+
+BATCH_SIZE = 500
+# Seconds an empty log slot is waited for
+GAP_TIMEOUT = 60
+# A marker whose slot was lost expires, so the slug gets listed again
+MARK_TIMEOUT = 15 * 60
+
+
+def _incr(key, delta=1):
+	cache.add(key, 0, None)
+	try:
+		return cache.incr(key, delta)
+	except ValueError:
+		cache.set(key, delta, None)
+		return delta
+
+
+def _mark_dirty(slug):
+	if cache.add(MARKED_KEY.format(slug=slug), 1, MARK_TIMEOUT):
+		slot = _incr(DIRTY_SEQ_KEY)
+		cache.set(DIRTY_KEY.format(slot=slot), slug, None)
+
+
+def record_view(slug):
+	"""Count one view of the post with ``slug``; never touches the database."""
+	_incr(COUNT_KEY.format(slug=slug))
+	_mark_dirty(slug)
+	interval = getattr(settings, "VIEW_COUNT_FLUSH_INTERVAL", 60)
+	if interval and cache.add(FLUSH_LOCK_KEY, 1, interval):
+		threading.Thread(target=_flush_in_background, name="view-count-flush", daemon=True).start()
+
+
+def _flush_in_background():
+	try:
+		flush()
+	finally:
+		connection.close()
+
+
+def _apply(pending):
+	"""Add ``{slug: delta}`` to ``Post.view_count`` with one UPDATE per batch."""
+	items = sorted(pending.items())
+	for start in range(0, len(items), BATCH_SIZE):
+		batch = items[start:start + BATCH_SIZE]
+		delta = Case(
+			*[When(slug=slug, then=Value(count)) for slug, count in batch],
+			default=Value(0),
+		)
+		with transaction.atomic():
+			Post.objects.filter(slug__in=[slug for slug, _ in batch]).update(
+				view_count=F("view_count") + delta
+			)
+
+
+def flush():
+	"""Move buffered counts into the database; returns the number applied.
+
+	Only one flush runs at a time, so two flushers can never take the same
+	pending count.
+	"""
+	if not cache.add(FLUSHING_KEY, 1, 300):
+		return 0
+	try:
+		return _flush()
+	finally:
+		cache.delete(FLUSHING_KEY)
+
+
+def _flush():
+	last = cache.get(FLUSHED_SEQ_KEY, 0)
+	current = cache.get(DIRTY_SEQ_KEY, 0)
+	if current < last:
+		# The sequence was evicted and started again from one
+		last = 0
+	gaps = cache.get(GAPS_KEY, {})
+	slots = sorted(gaps) + list(range(last + 1, current + 1))
+	if not slots:
+		return 0
+	found = cache.get_many([DIRTY_KEY.format(slot=slot) for slot in slots])
+	now = time.time()
+	gaps = {
+		slot: gaps.get(slot, now) for slot in slots
+		if DIRTY_KEY.format(slot=slot) not in found and now - gaps.get(slot, now) < GAP_TIMEOUT
+	}
+	cache.set(GAPS_KEY, gaps, None)
+	cache.set(FLUSHED_SEQ_KEY, current, None)
+	cache.delete_many(list(found))
+
+	pending = {}
+	for slug in set(found.values()):
+		# Cleared first, so any view from here on lists the slug again
+		cache.delete(MARKED_KEY.format(slug=slug))
+		key = COUNT_KEY.format(slug=slug)
+		count = cache.get(key) or 0
+		if not count:
+			continue
+		try:
+			cache.decr(key, count)
+		except ValueError:
+			pass
+		pending[slug] = count
+	_apply(pending)
+	return sum(pending.values())
+
+
+def most_viewed():
+	return Post.objects.published().filter(view_count__gt=0).order_by("-view_count", "-published_at")
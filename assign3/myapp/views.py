@@ -2,7 +2,9 @@ from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.shortcuts import render
 from django.db.models import Q
 from django.shortcuts import get_object_or_404, redirect
+from django.http import Http404
 from django.utils import timezone
+from django.utils.http import url_has_allowed_host_and_scheme
 from django.views.generic import ListView, DetailView, View, CreateView, TemplateView
 from django.contrib import messages
 from django.urls import reverse_lazy
@@ -10,7 +12,17 @@ from django.core.mail import send_mail
 from django.conf import settings
 from django.contrib.auth.models import User
 
-from .models import Post, Comment, Category, Tag, AuthorApplication
+from .models import Post, Comment, Category, Tag, AuthorApplication, RelatedPost, AuthorFollow, TagFollow
+from . import page_cache
+from .ratelimit import RateLimitMixin, Rate
+from .stats import get_author_stats
+from . import view_counts
+from . import archive
+from . import search_cache
+from . import facets
+from .trash import move_to_trash
+from . import timeline
+from . import live
 
 
 class HomeView(LoginRequiredMixin, ListView):
@@ -21,11 +33,8 @@ class HomeView(LoginRequiredMixin, ListView):
 	paginate_by = 10
 	login_url = '/accounts/login/'
 
-	def get_queryset(self):
-		qs = Post.objects.select_related('author', 'category').prefetch_related('tags').filter(status=Post.PUBLISHED)
-		q = self.request.GET.get('q')
-		cat = self.request.GET.get('category')
-		tag = self.request.GET.get('tag')
+	def filtered_posts(self, q, cat, tag):
+		qs = Post.objects.published()
 		if q:
 			qs = qs.filter(Q(title__icontains=q) | Q(content__icontains=q))
 		if cat:
@@ -34,13 +43,63 @@ class HomeView(LoginRequiredMixin, ListView):
 			qs = qs.filter(tags__slug=tag)
 		return qs.distinct().order_by('-published_at', '-created_at')
 
+	def get_queryset(self):
+		q, cat, tag = self.search = search_cache.normalize(
+			self.request.GET.get('q', ''),
+			self.request.GET.get('category', ''),
+			self.request.GET.get('tag', ''),
+		)
+		if q:
+			# Text searches reuse a cached id list; the page hydrates its own ten
+			ids = search_cache.cached_ids(
+				(q, cat, tag), lambda: self.filtered_posts(q, cat, tag).values_list('id', flat=True)
+			)
+			if ids is not None:
+				return ids
+		return self.filtered_posts(q, cat, tag).select_related('author', 'category').prefetch_related('tags')
+
+	def paginate_queryset(self, queryset, page_size):
+		paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+		if isinstance(queryset, tuple):
+			ids = list(page.object_list)
+			posts = Post.objects.select_related('author', 'category').prefetch_related('tags').in_bulk(ids)
+			page.object_list = object_list = [posts[pk] for pk in ids if pk in posts]
+		return paginator, page, object_list, is_paginated
+
 	def get_context_data(self, **kwargs):
 		ctx = super().get_context_data(**kwargs)
-		ctx['categories'] = Category.objects.order_by('name')
-		ctx['tags'] = Tag.objects.order_by('name')
+		# Only categories and tags that narrow the current results are offered
+		ctx['category_facets'], ctx['tag_facets'] = facets.for_search(
+			*self.search, self.filtered_posts(*self.search)
+		)
 		ctx['current_q'] = self.request.GET.get('q', '')
 		ctx['current_category'] = self.request.GET.get('category', '')
 		ctx['current_tag'] = self.request.GET.get('tag', '')
+		ctx['archive_months'] = archive.sidebar_months()
+		return ctx
+
+
+class ArchiveMonthView(LoginRequiredMixin, ListView):
+	"""Published posts for one calendar month."""
+	template_name = 'archive.html'
+	context_object_name = 'posts'
+	paginate_by = 10
+	login_url = '/accounts/login/'
+
+	def get_queryset(self):
+		year, month = self.kwargs['year'], self.kwargs['month']
+		if not (1 <= month <= 12 and 1 <= year <= archive.MAX_YEAR):
+			raise Http404('No such month.')
+		# Plain range on published_at so the (status, published_at) index is used
+		start, end = archive.month_range(year, month)
+		return Post.objects.published().filter(
+			published_at__gte=start, published_at__lt=end
+		).select_related('author', 'category').prefetch_related('tags').order_by('-published_at', '-id')
+
+	def get_context_data(self, **kwargs):
+		ctx = super().get_context_data(**kwargs)
+		ctx['month_start'] = archive.month_range(self.kwargs['year'], self.kwargs['month'])[0]
+		ctx['archive_months'] = archive.sidebar_months()
 		return ctx
 
 
@@ -61,21 +120,122 @@ class PostDetailView(DetailView):
 			Q(status=Post.PUBLISHED) | Q(author=self.request.user)
 		) if self.request.user.is_authenticated else qs.filter(status=Post.PUBLISHED)
 
+	def get(self, request, *args, **kwargs):
+		# Anonymous readers of published posts share one cached rendering
+		slug = kwargs['slug']
+		cached = page_cache.get_cached_response(request, slug)
+		if cached is not None:
+			view_counts.record_view(slug)
+			return cached
+		response = super().get(request, *args, **kwargs)
+		if self.object.status == Post.PUBLISHED:
+			view_counts.record_view(slug)
+			page_cache.store_response(request, slug, response)
+		return response
+
 	def get_context_data(self, **kwargs):
 		ctx = super().get_context_data(**kwargs)
 		ctx['comments'] = self.object.comments.filter(is_approved=True).select_related('user')
+		ctx['stream_url'] = live.stream_url(self.object.slug)
+		if ctx['stream_url']:
+			# The live stream replays approvals from the time the page was rendered
+			ctx['stream_since'] = live.encode_mark(timezone.now())
+		# Precomputed by myapp.related; one indexed read on (post, rank)
+		ctx['related_posts'] = [
+			entry.related for entry in RelatedPost.objects.filter(
+				post=self.object, related__status=Post.PUBLISHED, related__deleted_at__isnull=True
+			).select_related('related').order_by('rank')
+		]
+		user = self.request.user
+		if user.is_authenticated:
+			ctx['following_author'] = AuthorFollow.objects.filter(follower=user, author_id=self.object.author_id).exists()
+			ctx['followed_tag_ids'] = set(
+				TagFollow.objects.filter(follower=user, tag__posts=self.object).values_list('tag_id', flat=True)
+			)
 		return ctx
 
 
-class CommentCreateView(LoginRequiredMixin, View):
+class MostViewedView(LoginRequiredMixin, ListView):
+	"""Published posts ordered by their flushed view counts."""
+	template_name = 'popular.html'
+	context_object_name = 'posts'
+	paginate_by = 10
+	login_url = '/accounts/login/'
+
+	def get_queryset(self):
+		return view_counts.most_viewed().select_related('author', 'category')
+
+
+class FeedView(LoginRequiredMixin, TemplateView):
+	"""Posts from the authors and tags the user follows, newest first."""
+	template_name = 'feed.html'
+	login_url = '/accounts/login/'
+	page_size = 20
+
+	def get_context_data(self, **kwargs):
+		ctx = super().get_context_data(**kwargs)
+		user = self.request.user
+		# Keyset pages: ?before= names the last post of the previous page
+		cursor = timeline.decode_cursor(self.request.GET.get('before'))
+		ctx['posts'], next_cursor = timeline.feed_page(user, cursor, self.page_size)
+		ctx['next_cursor'] = timeline.encode_cursor(*next_cursor) if next_cursor else None
+		ctx['followed_authors'] = AuthorFollow.objects.filter(follower=user).select_related('author').order_by('author__username')
+		ctx['followed_tags'] = TagFollow.objects.filter(follower=user).select_related('tag').order_by('tag__name')
+		return ctx
+
+
+class CommentCreateView(LoginRequiredMixin, RateLimitMixin, View):
+	ratelimit_rates = (Rate('10/m', 'user'), Rate('600/m', 'global'))
+
 	def post(self, request, slug):
 		post = get_object_or_404(Post, slug=slug, status=Post.PUBLISHED)
 		content = request.POST.get('content', '').strip()
 		if content:
-			Comment.objects.create(post=post, user=request.user, content=content, is_approved=True)
+			# Hidden until the moderate_comments worker (or a moderator) approves it
+			Comment.objects.create(
+				post=post, user=request.user, content=content,
+				is_approved=False, moderation_status=Comment.PENDING,
+			)
+			messages.info(request, 'Thanks! Your comment will appear once it has been checked.')
 		return redirect(post.get_absolute_url())
 
 
+class FollowView(LoginRequiredMixin, RateLimitMixin, View):
+	"""POST ``action=follow`` or ``action=unfollow`` for one author or tag."""
+	ratelimit_rates = (Rate('60/m', 'user'), Rate('1200/m', 'global'))
+	# Looked up by the URL kwarg of the same name as target_field
+	target_model = None
+	target_field = None
+
+	def get_target(self, **kwargs):
+		return get_object_or_404(self.target_model, **{self.target_field: kwargs[self.target_field]})
+
+	def post(self, request, **kwargs):
+		target = self.get_target(**kwargs)
+		if request.POST.get('action') == 'unfollow':
+			self.unfollow(request.user, target)
+		else:
+			self.follow(request.user, target)
+		next_url = request.POST.get('next', '')
+		if not url_has_allowed_host_and_scheme(next_url, {request.get_host()}, request.is_secure()):
+			return redirect('feed')
+		return redirect(next_url)
+
+
+class FollowAuthorView(FollowView):
+	follow = staticmethod(timeline.follow_author)
+	unfollow = staticmethod(timeline.unfollow_author)
+	target_model = User
+	target_field = 'username'
+
+
+class FollowTagView(FollowView):
+	follow = staticmethod(timeline.follow_tag)
+	unfollow = staticmethod(timeline.unfollow_tag)
+	target_model = Tag
+	target_field = 'slug'
+
+
 class RoleRequiredMixin(UserPassesTestMixin):
 	"""Basic role mixin: allow superuser/staff or user in Author group."""
 	def test_func(self):
@@ -91,8 +251,6 @@ class PostCreateView(RoleRequiredMixin, LoginRequiredMixin, View):
 	def get(self, request):
 		ctx = {
 			'mode': 'create',
-			'categories': Category.objects.order_by('name'),
-			'tags': Tag.objects.order_by('name'),
 		}
 		return render(request, 'post_form.html', ctx)
 
@@ -120,8 +278,6 @@ class PostCreateView(RoleRequiredMixin, LoginRequiredMixin, View):
 		ctx = {
 			'mode': 'create',
 			'error': 'Title and content required.',
-			'categories': Category.objects.order_by('name'),
-			'tags': Tag.objects.order_by('name'),
 		}
 		return render(request, 'post_form.html', ctx)
 
@@ -145,8 +301,6 @@ class PostUpdateView(RoleRequiredMixin, LoginRequiredMixin, View):
 		ctx = {
 			'mode': 'edit',
 			'post': post,
-			'categories': Category.objects.order_by('name'),
-			'tags': Tag.objects.order_by('name'),
 		}
 		return render(request, 'post_form.html', ctx)
 
@@ -178,8 +332,6 @@ class PostUpdateView(RoleRequiredMixin, LoginRequiredMixin, View):
 			'mode': 'edit',
 			'post': post,
 			'error': 'Title and content required.',
-			'categories': Category.objects.order_by('name'),
-			'tags': Tag.objects.order_by('name'),
 		}
 		return render(request, 'post_form.html', ctx)
 
@@ -206,7 +358,8 @@ class PostDeleteView(RoleRequiredMixin, LoginRequiredMixin, View):
 		post = self.get_object()
 		u = request.user
 		if self.user_can_delete(post):
-			post.delete()
+			# One UPDATE; comments and tag links go later in purge_deleted_posts
+			move_to_trash(post)
 			return redirect('dashboard')
 		return redirect(post.get_absolute_url())
 
@@ -223,6 +376,14 @@ class DashboardView(RoleRequiredMixin, LoginRequiredMixin, ListView):
 			return base.order_by('-created_at')
 		return base.filter(author=u).order_by('-created_at')
 
+	def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+		paginator = super().get_paginator(queryset, per_page, orphans, allow_empty_first_page, **kwargs)
+		u = self.request.user
+		if not (u.is_superuser or u.is_staff):
+			# The cached author stats already know the total; skip the COUNT(*)
+			paginator.count = get_author_stats(u.id)['total']
+		return paginator
+
 
 class UserDashboardView(LoginRequiredMixin, TemplateView):
 	"""Dashboard for all users showing their role and application status"""
@@ -233,37 +394,36 @@ class UserDashboardView(LoginRequiredMixin, TemplateView):
 		ctx = super().get_context_data(**kwargs)
 		user = self.request.user
 		
-		# Get user's groups
-		user_groups = user.groups.all()
-		ctx['user_groups'] = user_groups
-		
-		# Check if user is Author or Admin
-		ctx['is_author'] = user.groups.filter(name__in=['Author', 'Admin']).exists() or user.is_staff or user.is_superuser
-		ctx['is_admin'] = user.groups.filter(name='Admin').exists() or user.is_superuser
-		
-		# Get user's latest application
-		latest_application = AuthorApplication.objects.filter(user=user).order_by('-created_at').first()
-		ctx['latest_application'] = latest_application
-		
-		# Check if user can apply (no pending application)
-		ctx['can_apply'] = not latest_application or latest_application.status != AuthorApplication.PENDING
+		# One query for group names, then role checks in Python
+		group_names = set(user.groups.values_list('name', flat=True))
+		ctx['user_groups'] = sorted(group_names)
+		ctx['is_author'] = bool(group_names & {'Author', 'Admin'}) or user.is_staff or user.is_superuser
+		ctx['is_admin'] = 'Admin' in group_names or user.is_superuser
 		
-		# Get user's post count if they're an author
 		if ctx['is_author']:
-			ctx['post_count'] = Post.objects.filter(author=user).count()
-			ctx['published_count'] = Post.objects.filter(author=user, status=Post.PUBLISHED).count()
-			ctx['draft_count'] = Post.objects.filter(author=user, status=Post.DRAFT).count()
+			# Cached single-query aggregate, invalidated on post/comment writes
+			stats = get_author_stats(user.id)
+			ctx['stats'] = stats
+			ctx['post_count'] = stats['total']
+			ctx['published_count'] = stats['published']
+			ctx['draft_count'] = stats['drafts']
+		else:
+			# Readers see their latest application instead
+			latest_application = AuthorApplication.objects.filter(user=user).order_by('-created_at').first()
+			ctx['latest_application'] = latest_application
+			ctx['can_apply'] = not latest_application or latest_application.status != AuthorApplication.PENDING
 		
 		return ctx
 
 
-class ApplyAuthorView(LoginRequiredMixin, CreateView):
+class ApplyAuthorView(LoginRequiredMixin, RateLimitMixin, CreateView):
 	"""View for users to apply to become authors"""
 	model = AuthorApplication
 	template_name = 'apply_author.html'
 	fields = ['reason']
 	success_url = reverse_lazy('user-dashboard')
 	login_url = '/accounts/login/'
+	ratelimit_rates = (Rate('3/h', 'user'), Rate('120/m', 'global'))
 	
 	def dispatch(self, request, *args, **kwargs):
 		# Check if user is already an author